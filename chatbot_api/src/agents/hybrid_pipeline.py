@@ -0,0 +1,122 @@
+import asyncio
+import os
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from chains.only_cypher_chain import get_cypher_chain
+from chains.only_vector_chain import get_vector_chain
+from utils import metrics
+from utils.llm import get_chat_model
+from utils.model_registry import get_or_load, is_loaded
+from utils.rate_limiter import RateLimitExceeded
+from utils.resilience import remaining
+
+HYBRID_MODEL = os.getenv("HYBRID_MODEL", os.getenv("AGENT_MODEL"))
+HYBRID_BRANCH_TIMEOUT = float(os.getenv("HYBRID_BRANCH_TIMEOUT", "30"))
+
+hybrid_template = """Việc của bạn là trả lời các câu hỏi liên quan đến hỏi đáp về Pháp Luật Việt Nam
+trong lĩnh vực khoa học và công nghệ dựa trên hai nguồn kết quả dưới đây: kết quả tìm kiếm bằng
+ngữ nghĩa (Vector Search) và kết quả truy vấn Cypher trên cơ sở dữ liệu Neo4j.
+Hãy trả lời chi tiết nhất có thể và nhớ rằng đừng tự tạo ra, bịa
+ra thông tin gì hết mà không nằm trong nội dung.
+Nếu bạn không thể trả lời câu hỏi hãy trả lời rằng bạn không biết.
+Hay nếu bạn nhận thấy rằng câu hỏi không liên quan đến pháp luật
+Việt Nam trong lĩnh vực khoa học và công nghệ thì hãy trả lời rằng
+câu hỏi không nằm trong lĩnh vực mà bạn có thể trả lời.
+Khi trả lời hãy trích dẫn các nội dung liên quan Luật nào, phần nào trong Pháp điển nếu có.
+Kết quả Vector Search có mã trích dẫn dạng [1], [2]; hãy ghi mã tương ứng sau phần trả lời dùng nội dung đó.
+
+Kết quả Vector Search:
+{vector_context}
+
+Kết quả truy vấn Cypher:
+{cypher_context}
+"""
+
+
+class HybridPipeline:
+    """Run vector and Cypher retrieval concurrently, then answer with one LLM call.
+
+    A branch that fails, has an open circuit or exceeds ``branch_timeout``
+    seconds (or the request deadline) contributes an empty context instead
+    of holding up the answer.
+    """
+
+    def __init__(self, branch_timeout: float = HYBRID_BRANCH_TIMEOUT):
+        self.branch_timeout = branch_timeout
+        self.vector_chain = get_vector_chain()
+        self.cypher_chain = get_cypher_chain()
+        self.prompt = ChatPromptTemplate([
+            ("system", hybrid_template),
+            ("human", "{question}"),
+        ])
+        self.llm = get_chat_model(HYBRID_MODEL)
+        self.answer_chain = self.prompt | self.llm | StrOutputParser()
+
+    async def _run_branch(self, name: str, coroutine):
+        time_left = remaining()
+        timeout = self.branch_timeout if time_left is None else max(min(self.branch_timeout, time_left), 0)
+        try:
+            return await asyncio.wait_for(coroutine, timeout=timeout), f"{name}: ok"
+        except asyncio.TimeoutError:
+            return None, f"{name}: timed out after {timeout:.1f}s"
+        except RateLimitExceeded:
+            # Hết ngân sách Groq thì trả 429 ngay, không gọi thêm LLM để trả lời bằng nhánh còn lại
+            raise
+        except Exception as e:
+            return None, f"{name}: failed: {e}"
+
+    async def _retrieve(self, query: str):
+        (vector_context, vector_status), (cypher_result, cypher_status) = await asyncio.gather(
+            self._run_branch("Vector Search", self.vector_chain.aretrieve_context(query)),
+            self._run_branch("Cypher Chain", self.cypher_chain.aretrieve_context(query)),
+        )
+        cypher_context = cypher_result["context"] if cypher_result else None
+        answer_inputs = {
+            "question": query,
+            "vector_context": vector_context or "Không có kết quả.",
+            "cypher_context": cypher_context or "Không có kết quả.",
+        }
+
+        intermediate_steps = [vector_status, cypher_status]
+        if vector_context:
+            intermediate_steps.append(f"Vector Search context: {vector_context}")
+        if cypher_result and cypher_result.get("citations"):
+            intermediate_steps.append(f"Legal index: {', '.join(cypher_result['citations'])}")
+            intermediate_steps.append(f"Cypher Chain context: {cypher_context}")
+        elif cypher_result:
+            source = "Cached Cypher" if cypher_result.get("cache_hit") else "Generated Cypher"
+            intermediate_steps.append(f"{source}: {cypher_result['cypher']}")
+            intermediate_steps.append(f"Cypher Chain context: {cypher_context}")
+        return answer_inputs, intermediate_steps
+
+    async def ainvoke(self, query: str) -> dict:
+        answer_inputs, intermediate_steps = await self._retrieve(query)
+        with metrics.stage("hybrid_answer"):
+            output = await self.answer_chain.ainvoke(answer_inputs)
+        return {"input": query, "output": output, "intermediate_steps": intermediate_steps}
+
+    async def astream_events(self, query: str):
+        """Same events as ``agents.rag_agent.astream_agent_events``."""
+        answer_inputs, intermediate_steps = await self._retrieve(query)
+        for step in intermediate_steps[:2]:
+            name, status = step.split(": ", 1)
+            yield {"type": "step", "name": name, "status": "end", "data": status}
+
+        output = ""
+        async for token in self.answer_chain.astream(answer_inputs):
+            output += token
+            yield {"type": "token", "content": token}
+        yield {"type": "final", "input": query, "output": output, "intermediate_steps": intermediate_steps}
+
+
+def get_hybrid_pipeline() -> HybridPipeline:
+    return get_or_load("hybrid_pipeline", HybridPipeline)
+
+
+async def aget_hybrid_pipeline() -> HybridPipeline:
+    """``get_hybrid_pipeline`` for coroutines; the first call builds both chains in a thread."""
+    if not is_loaded("hybrid_pipeline"):
+        await asyncio.to_thread(get_hybrid_pipeline)
+    return get_hybrid_pipeline()
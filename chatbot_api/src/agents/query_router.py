@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agents.hybrid_pipeline import aget_hybrid_pipeline
+from agents.rag_agent import astream_agent_events, rag_agent_executor
+from chains.only_cypher_chain import aget_cypher_chain
+from chains.only_vector_chain import get_chunked_embedder, get_vector_chain
+from utils.model_registry import get_or_load
+from utils.resilience import StageUnavailableError
+
+QUERY_ROUTER_ENABLED = os.getenv("QUERY_ROUTER_ENABLED", "true").lower() == "true"
+# Độ tương đồng cosine tối thiểu với prototype gần nhất và khoảng cách tối thiểu với nhãn thứ hai
+QUERY_ROUTER_THRESHOLD = float(os.getenv("QUERY_ROUTER_THRESHOLD", "0.6"))
+QUERY_ROUTER_MARGIN = float(os.getenv("QUERY_ROUTER_MARGIN", "0.05"))
+# File JSON {"nhãn": ["câu hỏi mẫu", ...]} thay cho bộ prototype mặc định
+QUERY_ROUTER_PROTOTYPES_PATH = os.getenv("QUERY_ROUTER_PROTOTYPES_PATH")
+
+OUT_OF_DOMAIN = "out_of_domain"
+AGENT = "agent"
+ROUTES = (OUT_OF_DOMAIN, "vector", "cypher", "hybrid")
+
+OUT_OF_DOMAIN_ANSWER = (
+    "Câu hỏi không nằm trong lĩnh vực mà tôi có thể trả lời. Tôi chỉ hỗ trợ hỏi đáp về "
+    "pháp luật Việt Nam trong lĩnh vực khoa học và công nghệ."
+)
+
+DEFAULT_PROTOTYPES: Dict[str, List[str]] = {
+    OUT_OF_DOMAIN: [
+        "Xin chào",
+        "Chào bạn, bạn là ai?",
+        "Cảm ơn bạn nhiều",
+        "Hôm nay thời tiết thế nào?",
+        "Kể cho tôi một câu chuyện cười",
+        "Cách nấu phở bò ngon",
+        "Đội tuyển Việt Nam đá trận tiếp theo khi nào?",
+        "Giá vàng hôm nay bao nhiêu?",
+        "Thủ tục ly hôn đơn phương gồm những bước nào?",
+        "Mức phạt vượt đèn đỏ đối với xe máy là bao nhiêu?",
+        "Điều kiện hưởng trợ cấp thất nghiệp là gì?",
+        "Viết giúp tôi một đoạn code Python",
+    ],
+    "vector": [
+        "Các nguyên tắc quản lý sản phẩm, hàng hóa nhóm 2 là gì?",
+        "Giấy chứng nhận an toàn kỹ thuật của tàu có thời hạn bao lâu?",
+        "Quỹ phát triển khoa học và công nghệ quốc gia hỗ trợ những gì?",
+        "Chuyển giao công nghệ được thực hiện bằng những hình thức nào?",
+        "Doanh nghiệp khoa học và công nghệ được hưởng ưu đãi gì?",
+        "Tổ chức đánh giá sự phù hợp phải đáp ứng điều kiện nào?",
+        "Hành vi nào bị nghiêm cấm trong hoạt động khoa học và công nghệ?",
+        "Quyền của tổ chức, cá nhân hoạt động khoa học và công nghệ là gì?",
+    ],
+    "cypher": [
+        "Điều 5 Luật Khoa học và công nghệ quy định gì?",
+        "Chương II của Luật Chuyển giao công nghệ gồm những điều nào?",
+        "Liệt kê các điều trong đề mục Khoa học, công nghệ",
+        "Luật số 29/2013/QH13 có bao nhiêu chương?",
+        "Nội dung của Điều 12 Luật Tiêu chuẩn và quy chuẩn kỹ thuật",
+        "Điều 3 thuộc chương nào của Luật Năng lượng nguyên tử?",
+        "Đề mục Đo lường có bao nhiêu điều?",
+        "Cho tôi tiêu đề các điều trong Chương I Luật Sở hữu trí tuệ",
+    ],
+    "hybrid": [
+        "Theo Điều 10 Luật Chuyển giao công nghệ, công nghệ nào bị cấm chuyển giao và vì sao?",
+        "Điều 23 Luật Khoa học và công nghệ quy định những hình thức hỗ trợ nào cho doanh nghiệp?",
+        "So sánh quy định về hợp đồng chuyển giao công nghệ tại Chương III với các điều khoản ưu đãi",
+        "Chương IV Luật Tiêu chuẩn và quy chuẩn kỹ thuật quy định trách nhiệm công bố hợp quy thế nào?",
+        "Trong Luật Đo lường, điều nào quy định về kiểm định phương tiện đo và thủ tục ra sao?",
+        "Những điều nào quy định về quỹ phát triển khoa học và công nghệ và quỹ hỗ trợ những gì?",
+    ],
+}
+
+
+def load_prototypes(path: Optional[str] = QUERY_ROUTER_PROTOTYPES_PATH) -> Dict[str, List[str]]:
+    if not path:
+        return DEFAULT_PROTOTYPES
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class QueryRouter:
+    """Nearest-prototype classifier over the bi-encoder query embeddings.
+
+    A query is scored against every labeled prototype; the label of the best
+    match wins when its cosine similarity reaches ``threshold`` and beats the
+    best match of any other label by ``margin``. Otherwise the query goes to
+    the agent, which decides with an LLM call.
+    """
+
+    def __init__(self, embedder=None, prototypes: Optional[Dict[str, List[str]]] = None,
+                 threshold: float = QUERY_ROUTER_THRESHOLD, margin: float = QUERY_ROUTER_MARGIN):
+        self.embedder = embedder or get_chunked_embedder()
+        self.threshold = threshold
+        self.margin = margin
+        prototypes = prototypes or load_prototypes()
+        unknown = set(prototypes) - set(ROUTES)
+        if unknown:
+            raise ValueError(f"Unknown query router labels: {sorted(unknown)}, expected {ROUTES}")
+        self.labels = list(prototypes)
+        texts, label_ids = [], []
+        for label_id, label in enumerate(self.labels):
+            texts.extend(prototypes[label])
+            label_ids.extend([label_id] * len(prototypes[label]))
+        # Prototype là câu hỏi nên được encode giống câu hỏi của người dùng
+        matrix = np.asarray([self.embedder.embed_query(text) for text in texts], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.matrix = matrix / norms
+        self.label_ids = np.asarray(label_ids)
+
+        self.decisions = {label: 0 for label in self.labels + [AGENT]}
+        self.route_seconds = {label: 0.0 for label in self.labels + [AGENT]}
+        self.saved_seconds = 0.0
+        self._agent_latency: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> np.ndarray:
+        embedding = np.asarray(self.embedder.embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def classify(self, embedding: np.ndarray) -> Tuple[str, float]:
+        """Return ``(route, score)`` for a normalized query embedding."""
+        scores = self.matrix @ embedding
+        best = np.full(len(self.labels), -1.0, dtype=np.float32)
+        np.maximum.at(best, self.label_ids, scores)
+        order = np.argsort(-best)
+        top = float(best[order[0]])
+        runner_up = float(best[order[1]]) if len(order) > 1 else -1.0
+        if top < self.threshold or top - runner_up < self.margin:
+            return AGENT, top
+        return self.labels[order[0]], top
+
+    def record(self, route: str, seconds: float):
+        """Count a decision and estimate the time it saved against the agent path."""
+        with self._lock:
+            self.decisions[route] = self.decisions.get(route, 0) + 1
+            self.route_seconds[route] = self.route_seconds.get(route, 0.0) + seconds
+            if route == AGENT:
+                # Trung bình trượt độ trễ của agent làm mốc so sánh
+                self._agent_latency = seconds if self._agent_latency is None else (
+                    0.9 * self._agent_latency + 0.1 * seconds
+                )
+            elif self._agent_latency is not None:
+                self.saved_seconds += max(0.0, self._agent_latency - seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "decisions": dict(self.decisions),
+                "avg_seconds": {
+                    route: self.route_seconds[route] / count for route, count in self.decisions.items() if count
+                },
+                "agent_latency_ewma": self._agent_latency or 0.0,
+                "saved_seconds": self.saved_seconds,
+            }
+
+
+def get_query_router() -> QueryRouter:
+    return get_or_load("query_router", QueryRouter)
+
+
+def _response(query: str, output: str, route: str) -> dict:
+    return {"input": query, "output": output, "intermediate_steps": [f"Query router: {route}"]}
+
+
+async def arun_route(route: str, query: str) -> dict:
+    """Answer ``query`` on the path chosen by the router, without the agent LLM when possible."""
+    if route == OUT_OF_DOMAIN:
+        return _response(query, OUT_OF_DOMAIN_ANSWER, route)
+    try:
+        if route == "vector":
+            return _response(query, await get_vector_chain().arun_vector_chain(query), route)
+        if route == "cypher":
+            return _response(query, (await (await aget_cypher_chain()).arun_cypher_chain(query))["result"], route)
+    except StageUnavailableError:
+        # Nhánh được chọn không dùng được thì hybrid vẫn trả lời bằng nhánh còn lại
+        route = "hybrid"
+    if route == "hybrid":
+        response = await (await aget_hybrid_pipeline()).ainvoke(query)
+        return {**response, "intermediate_steps": [f"Query router: {route}"] + response["intermediate_steps"]}
+
+    # Thử lại được áp dụng cho từng lời gọi bên ngoài (utils.resilience), không chạy lại cả agent
+    response = await rag_agent_executor.ainvoke({"input": query})
+    response["intermediate_steps"] = [str(s) for s in response["intermediate_steps"]]
+    return response
+
+
+async def astream_route_events(route: str, query: str):
+    """Same events as ``agents.rag_agent.astream_agent_events`` for a routed query.
+
+    The vector and Cypher chains have no token stream of their own, so their
+    answer arrives as a single token event.
+    """
+    if route == AGENT:
+        async for event in astream_agent_events(query):
+            yield event
+    elif route == "hybrid":
+        async for event in (await aget_hybrid_pipeline()).astream_events(query):
+            yield event
+    else:
+        yield {"type": "step", "name": "Query router", "status": "end", "data": route}
+        response = await arun_route(route, query)
+        yield {"type": "token", "content": response["output"]}
+        yield {"type": "final", **response}
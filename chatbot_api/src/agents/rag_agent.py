@@ -1,24 +1,54 @@
 import os
 from langchain_core.messages import HumanMessage
-from langchain_groq import ChatGroq
 from langchain.agents import (
     create_openai_functions_agent,
     Tool,
     AgentExecutor,
 )
-from chains.vector_chain import VectorChain
-from chains.cypher_chain import CypherChain
+from chains.only_vector_chain import get_vector_chain
+from chains.only_cypher_chain import aget_cypher_chain, get_cypher_chain
 from langchain_core.prompts import PromptTemplate
+from utils import metrics
+from utils.llm import get_chat_model
+from utils.resilience import StageUnavailableError
 
 
 AGENT_MODEL = os.getenv("AGENT_MODEL")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+
+def run_vector_search(query: str) -> str:
+    return get_vector_chain().run_vector_chain(query)
+
+
+# Khi một công cụ không dùng được, agent nhận thông báo này và chuyển sang công cụ còn lại
+TOOL_UNAVAILABLE_MESSAGE = "Công cụ {tool} tạm thời không khả dụng ({error}). Hãy dùng công cụ còn lại."
+
+
+async def arun_vector_search(query: str) -> str:
+    try:
+        with metrics.stage("tool:vector_search"):
+            return await get_vector_chain().arun_vector_chain(query)
+    except StageUnavailableError as e:
+        return TOOL_UNAVAILABLE_MESSAGE.format(tool="Vector Search", error=e)
+
+
+def run_cypher_chain(query: str) -> dict:
+    return get_cypher_chain().run_cypher_chain(query)
+
+
+async def arun_cypher_chain(query: str) -> dict:
+    try:
+        with metrics.stage("tool:cypher_chain"):
+            return await (await aget_cypher_chain()).arun_cypher_chain(query)
+    except StageUnavailableError as e:
+        return TOOL_UNAVAILABLE_MESSAGE.format(tool="Cypher Chain", error=e)
 
 
 tools = [
     Tool(
         name="Vector Search",
-        func=VectorChain.run_vector_chain,
+        func=run_vector_search,
+        coroutine=arun_vector_search,
         description="""Công cụ hữu ích giúp bạn trả lời các câu hỏi
         liên quan đến hỏi đáp về Pháp luật Việt Nam trong lĩnh vực khoa học
         và công nghệ bằng cách tìm kiếm bằng ngữ nghĩa (semantic search).
@@ -29,7 +59,8 @@ tools = [
     ),
     Tool(
         name="Cypher Chain",
-        func=CypherChain.run_cypher_chain,
+        func=run_cypher_chain,
+        coroutine=arun_cypher_chain,
         description="""Công cụ hữu ích giúp bạn trả lời các câu hỏi
         liên quan đến hỏi đáp về Pháp Luật Việt Nam trong lĩnh vực khoa học
         và công nghệ dựa trên việc tìm kiếm trên Cypher của Neo4j Graph Database.
@@ -41,7 +72,7 @@ tools = [
 ]
 
 
-chat_model = ChatGroq(model=AGENT_MODEL,temperature=0, api_key=GROQ_API_KEY)
+chat_model = get_chat_model(AGENT_MODEL)
 # chat_model_with_tools = chat_model.bind_tools(tools)
 # response = chat_model_with_tools.invoke([HumanMessage(content="Pháp luật Việt Nam có các loại văn bản nào?.")])
 # print(f"ContentString: {response.content}")
@@ -76,6 +107,35 @@ rag_agent_executor = AgentExecutor(
     verbose=True,
 )
 
+
+async def astream_agent_events(query: str):
+    """Yield tool step events while the agent runs, then the final answer tokens.
+
+    Tokens produced by LLM calls inside a tool are not forwarded, only the ones
+    the agent model generates for its final answer.
+    """
+    running_tools = 0
+    async for event in rag_agent_executor.astream_events({"input": query}, version="v2"):
+        kind = event["event"]
+        if kind == "on_tool_start":
+            running_tools += 1
+            yield {"type": "step", "name": event["name"], "status": "start", "data": str(event["data"].get("input"))}
+        elif kind == "on_tool_end":
+            running_tools -= 1
+            yield {"type": "step", "name": event["name"], "status": "end", "data": str(event["data"].get("output"))}
+        elif kind == "on_chat_model_stream" and running_tools == 0:
+            content = event["data"]["chunk"].content
+            if content:
+                yield {"type": "token", "content": content}
+        elif kind == "on_chain_end" and not event["parent_ids"]:
+            output = event["data"]["output"]
+            yield {
+                "type": "final",
+                "input": query,
+                "output": output["output"],
+                "intermediate_steps": [str(s) for s in output["intermediate_steps"]],
+            }
+
 if __name__ == "__main__":
     input_data = {"messages": [HumanMessage(
         content="Các nguyên tắc quản lý sản phẩm, hàng hóa nhóm 2 là gì?")]}
@@ -0,0 +1,167 @@
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from utils.token_count import CHARS_PER_TOKEN, estimate_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Ngân sách riêng cho từng model, ví dụ "llama-3.3-70b-versatile:6000,gemma2-9b-it:2000"
+CONTEXT_TOKEN_BUDGETS = os.getenv("CONTEXT_TOKEN_BUDGETS", "")
+
+PAGE_CONTENT_PATTERN = re.compile(r"^\s*content: (.*)\nid: (.*?)\s*$", re.DOTALL)
+# Số nguyên tố Mersenne 2^61 - 1 cho các hàm băm a*x + b mod p của MinHash
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def token_budget(model: Optional[str]) -> int:
+    """Context token budget for ``model`` from CONTEXT_TOKEN_BUDGETS, else the default."""
+    for item in CONTEXT_TOKEN_BUDGETS.split(","):
+        name, _, budget = item.strip().rpartition(":")
+        if name and name == model:
+            return int(budget)
+    return CONTEXT_TOKEN_BUDGET
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text).lower()).strip()
+
+
+def _parse(document: Document) -> Tuple[str, Optional[str]]:
+    match = PAGE_CONTENT_PATTERN.match(document.page_content)
+    if match:
+        return match.group(1).strip(), match.group(2) or document.metadata.get("id")
+    return document.page_content.strip(), document.metadata.get("id")
+
+
+def _overlap(left: str, right: str, min_overlap: int, max_overlap: int = 200) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``, up to ``max_overlap``."""
+    for size in range(min(len(left), len(right), max_overlap + 1) - 1, min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+class ContextPacker:
+    """Turn ranked documents into a deduplicated, budgeted context with citation ids.
+
+    Passages are visited in relevance order. Exact duplicates and passages
+    contained in an earlier one are dropped, near duplicates are detected by
+    MinHash over syllable shingles, and passages from the same node or whose
+    text overlaps at the boundary (the splitter's chunk overlap) are merged.
+    The result is packed greedily until ``token_budget`` is reached.
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, shingle_size: int = 5, num_perm: int = 64,
+                 threshold: float = 0.8, min_overlap: int = 30):
+        self.token_budget = token_budget
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        rng = np.random.default_rng(0)
+        # a, b < 2^31 và x < 2^32 nên a*x + b không tràn uint64
+        self._a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+        self.passages_in = 0
+        self.passages_out = 0
+        self.duplicates = 0
+        self.merged = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self._lock = threading.Lock()
+
+    def signature(self, text: str) -> np.ndarray:
+        syllables = text.split()
+        size = min(self.shingle_size, len(syllables)) or 1
+        shingles = {" ".join(syllables[i:i + size]) for i in range(max(len(syllables) - size + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64)
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+    def pack(self, documents: List[Document]) -> Tuple[str, Dict[str, List[str]]]:
+        """Return the rendered context and a map from citation id ("[1]") to the ids of the nodes merged into it."""
+        passages: List[dict] = []
+        seen = set()
+        duplicates = merged = 0
+        for document in documents:
+            content, node_id = _parse(document)
+            normalized = _normalize(content)
+            if not normalized:
+                continue
+            digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+            if digest in seen or any(normalized in p["normalized"] for p in passages):
+                duplicates += 1
+                continue
+            seen.add(digest)
+
+            signature = self.signature(normalized)
+            if any(np.mean(signature == p["signature"]) >= self.threshold for p in passages):
+                duplicates += 1
+                continue
+
+            if self._merge(passages, content, node_id):
+                merged += 1
+                continue
+            passages.append({"content": content, "noidung_ids": [node_id] if node_id else [],
+                             "normalized": normalized, "signature": signature})
+
+        budget = self.token_budget
+        blocks, citations = [], {}
+        for passage in passages:
+            tokens = estimate_tokens(passage["content"])
+            if tokens > budget:
+                if blocks:
+                    continue
+                # Đoạn liên quan nhất luôn được giữ, cắt bớt cho vừa ngân sách
+                passage["content"] = passage["content"][: int(budget * CHARS_PER_TOKEN)]
+                tokens = budget
+            budget -= tokens
+            citation = f"[{len(blocks) + 1}]"
+            citations[citation] = passage["noidung_ids"]
+            header = f"{citation} (id: {', '.join(passage['noidung_ids'])})" if passage["noidung_ids"] else citation
+            blocks.append(f"{header}\n{passage['content']}")
+
+        context = "\n\n".join(blocks)
+        with self._lock:
+            self.passages_in += len(documents)
+            self.passages_out += len(blocks)
+            self.duplicates += duplicates
+            self.merged += merged
+            self.tokens_in += sum(estimate_tokens(_parse(document)[0]) for document in documents)
+            self.tokens_out += estimate_tokens(context)
+        return context, citations
+
+    def _merge(self, passages: List[dict], content: str, node_id: Optional[str]) -> bool:
+        for passage in passages:
+            before = _overlap(passage["content"], content, self.min_overlap)
+            after = 0 if before else _overlap(content, passage["content"], self.min_overlap)
+            if before or after:
+                passage["content"] = (
+                    passage["content"] + content[before:] if before else content + passage["content"][after:]
+                )
+            elif node_id is not None and node_id in passage["noidung_ids"]:
+                passage["content"] = f"{passage['content']}\n{content}"
+            else:
+                continue
+            if node_id is not None and node_id not in passage["noidung_ids"]:
+                passage["noidung_ids"].append(node_id)
+            passage["normalized"] = _normalize(passage["content"])
+            passage["signature"] = self.signature(passage["normalized"])
+            return True
+        return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "passages_in": self.passages_in,
+                "passages_out": self.passages_out,
+                "duplicates": self.duplicates,
+                "merged": self.merged,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+            }
@@ -0,0 +1,362 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from neo4j import GraphDatabase
+
+from utils.model_registry import get_or_load
+from utils.neo4j_pool import read_query
+
+load_dotenv()
+
+LEGAL_INDEX_PATH = os.getenv("LEGAL_INDEX_PATH", "legal_index.json")
+# Số hàng tối đa trả về cho một câu hỏi cấu trúc, giống top_k của GraphCypherQAChain
+LEGAL_INDEX_MAX_ROWS = int(os.getenv("LEGAL_INDEX_MAX_ROWS", "20"))
+
+# Một dòng cho mỗi Điều, kèm Chương và Đề mục chứa nó và id các Noidung của nó
+EXPORT_QUERY = """
+MATCH (d:Dieu)-[:CO_NOI_DUNG]->(n:Noidung)
+OPTIONAL MATCH (c:Chuong)-[:CO_DIEU]->(d)
+OPTIONAL MATCH (m:Demuc)-[:CO_CHUONG]->(c)
+OPTIONAL MATCH (m2:Demuc)-[:CO_DIEU]->(d)
+WITH d, c, coalesce(m, m2) AS m, collect(n.id) AS noidung_ids
+RETURN d.id AS dieu_id, d.title AS dieu_title, d.ghi_chu AS ghi_chu,
+       c.id AS chuong_id, c.title AS chuong_title, m.id AS demuc_id, m.title AS demuc_title, noidung_ids
+"""
+# Nội dung của nhiều Điều trong một lần truy vấn, đi theo index unique trên Dieu.id
+ARTICLES_QUERY = """
+UNWIND $dieu_ids AS dieu_id
+MATCH (d:Dieu {id: dieu_id})-[:CO_NOI_DUNG]->(n:Noidung)
+WITH d, n ORDER BY n.id
+RETURN d.id AS dieu_id, d.title AS title, d.ghi_chu AS ghi_chu,
+       collect(n.id) AS noidung_ids, collect(n.content) AS contents
+"""
+
+DOCUMENT_NUMBER = r"\d{1,4}/\d{4}/[a-zđ0-9]+(?:-[a-zđ0-9]+)*"
+# "Điều 5" hoặc mã Điều trong Pháp điển như "Điều 2.1.LQ.1"
+ARTICLE_PATTERN = re.compile(r"\bđiều\s+(\d+(?:\.\d+)*\.[a-zđ]+\.\d+(?:\.\d+)*|\d+[a-zđ]?)\b")
+CHAPTER_PATTERN = re.compile(r"\bchương\s+([ivxlc]+|\d+)\b")
+CLAUSE_PATTERN = re.compile(r"\bkhoản\s+(\d+)\b")
+DOCUMENT_NUMBER_PATTERN = re.compile(rf"(?<![\w/]){DOCUMENT_NUMBER}(?![\w/])")
+# Tên văn bản lấy từ ghi chú của Điều, ví dụ "(Điều 5 Luật Chuyển giao công nghệ số 07/2017/QH14 ...)"
+DOCUMENT_NAME_PATTERN = re.compile(rf"\b((?:bộ luật|luật|pháp lệnh)\s+[^()\d,;]+?)\s+số\s+({DOCUMENT_NUMBER})")
+ROMAN_NUMERALS = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text or "").lower()).strip()
+
+
+def document_key(number: str) -> str:
+    # Người dùng hay gõ "ND-CP" thay cho "NĐ-CP"
+    return normalize(number).replace("đ", "d")
+
+
+def chapter_number(token: str) -> int:
+    if token.isdigit():
+        return int(token)
+    values = [ROMAN_NUMERALS[char] for char in token]
+    return sum(-value if value < next_value else value for value, next_value in zip(values, values[1:] + [0]))
+
+
+def _find_names(text: str, names: List[Tuple[str, str]]) -> List[Tuple[int, int, str]]:
+    """Non-overlapping occurrences of known document names, longest name first."""
+    found, taken = [], []
+    for name, key in names:
+        start = text.find(name)
+        while start >= 0:
+            end = start + len(name)
+            if all(end <= s or start >= e for s, e in taken):
+                found.append((start, end, key))
+                taken.append((start, end))
+            start = text.find(name, end)
+    return found
+
+
+def extract_citations(text: str, names: Optional[List[Tuple[str, str]]] = None) -> List[dict]:
+    """Legal citations in ``text`` such as "khoản 2 Điều 5 Thông tư 01/2020/TT-BKHCN".
+
+    Each article or chapter mention is paired with the first document
+    mentioned after it, else the last one before it. Documents are found by
+    number and, when ``names`` (normalized name, document key) is given, by
+    name. A document mentioned without any article or chapter is returned on
+    its own.
+    """
+    text = normalize(text)
+    documents = [(m.start(), m.end(), document_key(m.group())) for m in DOCUMENT_NUMBER_PATTERN.finditer(text)]
+    documents += [span for span in _find_names(text, names or [])
+                  if not any(span[0] < end and start < span[1] for start, end, _ in documents)]
+    documents.sort()
+
+    def document_for(position: int) -> Optional[str]:
+        after = [key for start, _, key in documents if start >= position]
+        before = [key for start, _, key in documents if start < position]
+        return after[0] if after else (before[-1] if before else None)
+
+    citations, used_documents = [], set()
+    previous_end = 0
+    for match in ARTICLE_PATTERN.finditer(text):
+        article = match.group(1)
+        is_code = "." in article
+        clause = CLAUSE_PATTERN.findall(text, previous_end, match.start())
+        document = None if is_code else document_for(match.end())
+        used_documents.add(document)
+        citations.append({"article": None if is_code else article, "code": article if is_code else None,
+                          "clause": clause[-1] if clause else None, "chapter": None, "document": document})
+        previous_end = match.end()
+    for match in CHAPTER_PATTERN.finditer(text):
+        document = document_for(match.end())
+        used_documents.add(document)
+        citations.append({"article": None, "code": None, "clause": None,
+                          "chapter": chapter_number(match.group(1)), "document": document})
+    for _, _, key in documents:
+        if key not in used_documents:
+            used_documents.add(key)
+            citations.append({"article": None, "code": None, "clause": None, "chapter": None, "document": key})
+    return citations
+
+
+def format_citation(citation: dict) -> str:
+    parts = []
+    if citation["clause"]:
+        parts.append(f"khoản {citation['clause']}")
+    if citation["article"] or citation["code"]:
+        parts.append(f"Điều {citation['article'] or citation['code']}")
+    if citation["chapter"]:
+        parts.append(f"Chương {citation['chapter']}")
+    if citation["document"]:
+        parts.append(citation["document"])
+    return " ".join(parts)
+
+
+class LegalHierarchyIndex:
+    """Path index from every Noidung node to its Điều, Chương and Đề mục.
+
+    Built from Neo4j in one pass (``python -m chains.legal_index build``).
+    Besides the ancestry, it maps the citations found in each Điều's title
+    and ghi chú (the article and number of the source document) to the Điều,
+    so a question citing "Điều 5 Thông tư 01/2020/TT-BKHCN" resolves without
+    an LLM writing Cypher. Only article contents are fetched from Neo4j, for
+    all resolved articles in one batched query.
+    """
+
+    def __init__(self, data: Optional[dict] = None):
+        data = data or {}
+        self.demucs: Dict[str, str] = data.get("demucs", {})
+        self.chuongs: Dict[str, str] = data.get("chuongs", {})
+        # dieu_id -> [title, chuong_id, demuc_id]
+        self.dieus: Dict[str, list] = data.get("dieus", {})
+        self.noidung: Dict[str, str] = data.get("noidung", {})
+        self.articles: Dict[str, List[str]] = data.get("articles", {})
+        self.codes: Dict[str, List[str]] = data.get("codes", {})
+        self.chapters: Dict[str, List[str]] = data.get("chapters", {})
+        self.documents: Dict[str, List[str]] = data.get("documents", {})
+        self.names: List[Tuple[str, str]] = [tuple(item) for item in data.get("names", [])]
+        self.lookups = 0
+        self.resolved = 0
+        self.expanded = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict]) -> "LegalHierarchyIndex":
+        index = cls()
+        articles, codes, chapters, documents = (defaultdict(list) for _ in range(4))
+        names = {}
+        for row in rows:
+            dieu_id = row["dieu_id"]
+            if row.get("demuc_id") is not None:
+                index.demucs[row["demuc_id"]] = row["demuc_title"] or row["demuc_id"]
+            if row.get("chuong_id") is not None:
+                index.chuongs[row["chuong_id"]] = row["chuong_title"] or row["chuong_id"]
+            index.dieus[dieu_id] = [row["dieu_title"] or dieu_id, row.get("chuong_id"), row.get("demuc_id")]
+            for noidung_id in row["noidung_ids"]:
+                index.noidung[noidung_id] = dieu_id
+
+            note = normalize(f"{row['dieu_title'] or ''} {row.get('ghi_chu') or ''}")
+            for name, number in DOCUMENT_NAME_PATTERN.findall(note):
+                names[name] = document_key(number)
+            for citation in extract_citations(note):
+                if citation["code"]:
+                    codes[citation["code"]].append(dieu_id)
+                elif citation["article"] and citation["document"]:
+                    articles[f"{citation['document']}|{citation['article']}"].append(dieu_id)
+                if citation["document"]:
+                    documents[citation["document"]].append(dieu_id)
+                    chapter = _chapter_of(index.chuongs.get(row.get("chuong_id")))
+                    if chapter is not None:
+                        chapters[f"{citation['document']}|{chapter}"].append(dieu_id)
+
+        for target, source in ((index.articles, articles), (index.codes, codes),
+                               (index.chapters, chapters), (index.documents, documents)):
+            target.update({key: list(dict.fromkeys(ids)) for key, ids in source.items()})
+        index.names = sorted(names.items(), key=lambda item: -len(item[0]))
+        return index
+
+    @classmethod
+    def build(cls, driver, path: str = LEGAL_INDEX_PATH) -> dict:
+        """Export the hierarchy from Neo4j and write the snapshot."""
+        start_time = time.perf_counter()
+        with driver.session() as session:
+            index = cls.from_rows(record.data() for record in session.run(EXPORT_QUERY))
+        index.save(path)
+        return {**index.sizes(), "seconds": time.perf_counter() - start_time}
+
+    def save(self, path: str = LEGAL_INDEX_PATH):
+        data = {"demucs": self.demucs, "chuongs": self.chuongs, "dieus": self.dieus, "noidung": self.noidung,
+                "articles": self.articles, "codes": self.codes, "chapters": self.chapters,
+                "documents": self.documents, "names": self.names}
+        # Ghi ra file tạm rồi os.replace để worker đang đọc snapshot cũ không bị ảnh hưởng
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str = LEGAL_INDEX_PATH) -> "LegalHierarchyIndex":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def ancestry(self, dieu_id: str) -> dict:
+        title, chuong_id, demuc_id = self.dieus[dieu_id]
+        return {"de_muc": self.demucs.get(demuc_id), "chuong": self.chuongs.get(chuong_id), "dieu": title}
+
+    def resolve(self, citation: dict) -> Optional[List[str]]:
+        """Điều ids a citation refers to, None if it cannot be resolved unambiguously."""
+        if citation["code"]:
+            return self.codes.get(citation["code"])
+        if not citation["document"]:
+            # "Điều 5" không kèm văn bản thì văn bản nào cũng có
+            return None
+        if citation["article"]:
+            return self.articles.get(f"{citation['document']}|{citation['article']}")
+        if citation["chapter"]:
+            return self.chapters.get(f"{citation['document']}|{citation['chapter']}")
+        return self.documents.get(citation["document"])
+
+    async def alookup(self, query: str, max_rows: int = LEGAL_INDEX_MAX_ROWS) -> Optional[dict]:
+        """Answer rows for a question citing articles, chapters or documents.
+
+        Returns None unless the question cites an article or chapter and every
+        such citation resolves, so the caller can fall back to LLM-generated
+        Cypher. Cited articles come with their contents; chapters are listed
+        by article title.
+        """
+        # Chỉ nhắc tên văn bản thì vẫn là câu hỏi nội dung, để LLM viết Cypher
+        citations = [citation for citation in extract_citations(query, self.names)
+                     if citation["article"] or citation["code"] or citation["chapter"]]
+        with self._lock:
+            self.lookups += 1
+        if not citations:
+            return None
+        resolved = [self.resolve(citation) for citation in citations]
+        if not all(resolved):
+            return None
+        with self._lock:
+            self.resolved += 1
+
+        with_content = list(dict.fromkeys(
+            dieu_id for citation, ids in zip(citations, resolved) if citation["article"] or citation["code"]
+            for dieu_id in ids
+        ))[:max_rows]
+        listed = list(dict.fromkeys(
+            dieu_id for citation, ids in zip(citations, resolved) if not (citation["article"] or citation["code"])
+            for dieu_id in ids if dieu_id not in with_content
+        ))[:max(0, max_rows - len(with_content))]
+
+        rows = []
+        if with_content:
+            articles = {row["dieu_id"]: row for row in await read_query(ARTICLES_QUERY, {"dieu_ids": with_content})}
+            for dieu_id in with_content:
+                if dieu_id in articles:
+                    rows.append({**self.ancestry(dieu_id), "ghi_chu": articles[dieu_id]["ghi_chu"],
+                                 "noi_dung": "\n".join(articles[dieu_id]["contents"])})
+        rows.extend(self.ancestry(dieu_id) for dieu_id in listed)
+        return {"citations": [format_citation(citation) for citation in citations], "rows": rows}
+
+    async def aexpand_documents(self, documents: List[Document]) -> List[Document]:
+        """Replace retrieved Noidung passages by their whole parent Điều, in one query.
+
+        Passages of the same Điều collapse into the first, best ranked one;
+        passages whose node is not in the index are kept unchanged.
+        """
+        dieu_ids = list(dict.fromkeys(
+            self.noidung[document.metadata.get("id")] for document in documents
+            if document.metadata.get("id") in self.noidung
+        ))
+        if not dieu_ids:
+            return documents
+        articles = {row["dieu_id"]: row for row in await read_query(ARTICLES_QUERY, {"dieu_ids": dieu_ids})}
+
+        expanded, seen = [], set()
+        for document in documents:
+            dieu_id = self.noidung.get(document.metadata.get("id"))
+            if dieu_id not in articles:
+                expanded.append(document)
+                continue
+            if dieu_id in seen:
+                continue
+            seen.add(dieu_id)
+            article = articles[dieu_id]
+            content = "\n".join([article["title"] or ""] + article["contents"]).strip()
+            expanded.append(Document(
+                page_content=f"\ncontent: {content}\nid: {dieu_id}",
+                metadata={**document.metadata, "id": dieu_id, "noidung_ids": article["noidung_ids"],
+                          **self.ancestry(dieu_id)},
+            ))
+        with self._lock:
+            self.expanded += len(seen)
+        return expanded
+
+    def sizes(self) -> dict:
+        return {"demucs": len(self.demucs), "chuongs": len(self.chuongs), "dieus": len(self.dieus),
+                "noidung": len(self.noidung), "cited_articles": len(self.articles),
+                "documents": len(self.documents), "document_names": len(self.names)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.sizes(), "lookups": self.lookups, "resolved": self.resolved,
+                    "resolved_rate": self.resolved / self.lookups if self.lookups else 0.0,
+                    "expanded_articles": self.expanded}
+
+
+def _chapter_of(title: Optional[str]) -> Optional[int]:
+    match = CHAPTER_PATTERN.match(normalize(title)) if title else None
+    return chapter_number(match.group(1)) if match else None
+
+
+def load_legal_index(path: str = LEGAL_INDEX_PATH) -> Optional[LegalHierarchyIndex]:
+    if not os.path.exists(path):
+        return None
+    return LegalHierarchyIndex.load(path)
+
+
+def get_legal_index() -> Optional[LegalHierarchyIndex]:
+    """Shared path index, None until ``python -m chains.legal_index build`` has written the snapshot."""
+    return get_or_load("legal_index", load_legal_index)
+
+
+if __name__ == "__main__":
+    # python -m chains.legal_index build | python -m chains.legal_index cite "Điều 5 Thông tư 01/2020/TT-BKHCN"
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "cite":
+        index = load_legal_index() or LegalHierarchyIndex()
+        for citation in extract_citations(" ".join(sys.argv[2:]), index.names):
+            print(format_citation(citation), "->", index.resolve(citation))
+        sys.exit(0)
+
+    driver = GraphDatabase.driver(
+        os.getenv("NEO4J_URI"),
+        auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+    )
+    try:
+        report = LegalHierarchyIndex.build(driver)
+    finally:
+        driver.close()
+    print(report)
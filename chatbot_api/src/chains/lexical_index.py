@@ -0,0 +1,272 @@
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from neo4j import GraphDatabase
+
+load_dotenv()
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "lexical_index")
+
+NODES_QUERY = """
+MATCH (n:Noidung) WHERE n.content IS NOT NULL
+RETURN elementId(n) AS element_id, n.id AS id, n.content AS content
+"""
+
+# Âm tiết giữ nguyên dấu; số hiệu văn bản như "01/2020/tt-bkhcn" hay "2.1" là một token
+SYLLABLE_PATTERN = re.compile(r"\w+(?:[/.\-]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split Vietnamese text into syllables plus adjacent-syllable compounds.
+
+    Most Vietnamese words span two syllables ("hợp quy", "hàng hóa"), so
+    syllable bigrams act as compound-word terms without a word segmenter and
+    also keep references like "điều 5" or "nhóm 2" together.
+    """
+    syllables = SYLLABLE_PATTERN.findall(unicodedata.normalize("NFC", text).lower())
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+class LexicalIndex:
+    """In-process BM25 inverted index over Noidung content.
+
+    The main segment stores postings in CSR form (``offsets``, ``doc_ids``,
+    ``term_freqs``). Documents added afterwards go to an in-memory delta
+    segment and replaced or removed rows are tombstoned until ``compact``
+    merges everything back into the main segment.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: List[dict] = []
+        self.rows: Dict[str, int] = {}
+        self.vocab: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.term_freqs = np.zeros(0, dtype=np.uint16)
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.deleted = np.zeros(0, dtype=bool)
+        self._delta: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+
+    @property
+    def num_documents(self) -> int:
+        return int(len(self.docs) - self.deleted.sum())
+
+    def add_documents(self, docs: List[dict]):
+        """Add or replace documents, each a dict with element_id, id and content."""
+        start = len(self.docs)
+        lengths = np.zeros(len(docs), dtype=np.float32)
+        for i, doc in enumerate(docs):
+            old_row = self.rows.get(doc["element_id"])
+            if old_row is not None:
+                self.deleted[old_row] = True
+            row = start + i
+            self.rows[doc["element_id"]] = row
+            self.docs.append({"element_id": doc["element_id"], "id": doc["id"], "content": doc["content"]})
+            counts = Counter(tokenize(doc["content"] or ""))
+            lengths[i] = sum(counts.values())
+            for term, tf in counts.items():
+                self._delta[term].append((row, tf))
+        self.doc_lengths = np.concatenate([self.doc_lengths, lengths])
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(docs), dtype=bool)])
+
+    def remove_documents(self, element_ids: List[str]):
+        for element_id in element_ids:
+            row = self.rows.pop(element_id, None)
+            if row is not None:
+                self.deleted[row] = True
+
+    def compact(self):
+        """Merge the delta segment into the CSR postings and drop tombstoned rows."""
+        keep = np.flatnonzero(~self.deleted)
+        new_row = np.full(len(self.docs), -1, dtype=np.int64)
+        new_row[keep] = np.arange(len(keep))
+
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for term, term_id in self.vocab.items():
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            postings[term].extend(zip(self.doc_ids[start:end].tolist(), self.term_freqs[start:end].tolist()))
+        for term, entries in self._delta.items():
+            postings[term].extend(entries)
+
+        vocab, offsets, doc_ids, term_freqs = {}, [0], [], []
+        for term, entries in postings.items():
+            entries = [(new_row[row], tf) for row, tf in entries if new_row[row] >= 0]
+            if not entries:
+                continue
+            vocab[term] = len(vocab)
+            entries.sort()
+            doc_ids.extend(row for row, _ in entries)
+            term_freqs.extend(min(tf, 65535) for _, tf in entries)
+            offsets.append(len(doc_ids))
+
+        self.docs = [self.docs[row] for row in keep]
+        self.rows = {doc["element_id"]: row for row, doc in enumerate(self.docs)}
+        self.doc_lengths = self.doc_lengths[keep]
+        self.deleted = np.zeros(len(self.docs), dtype=bool)
+        self.vocab = vocab
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.term_freqs = np.asarray(term_freqs, dtype=np.uint16)
+        self._delta = defaultdict(list)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """Return (row, BM25 score) of the top-k documents, best first."""
+        if not self.docs:
+            return []
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        live = ~self.deleted
+        num_docs = max(int(live.sum()), 1)
+        avg_length = float(self.doc_lengths[live].mean()) if live.any() else 1.0
+
+        for term in set(tokenize(query)):
+            rows, tfs = self._postings(term)
+            if not len(rows):
+                continue
+            doc_freq = int(live[rows].sum())
+            idf = np.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[rows] / avg_length)
+            np.add.at(scores, rows, idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        scores[self.deleted] = 0
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def to_document(self, row: int, score: float) -> Document:
+        doc = self.docs[row]
+        # Cùng định dạng page_content với Neo4jVector để gộp được với kết quả vector
+        text = f"\ncontent: {doc['content'] or ''}\nid: {doc['id'] or ''}"
+        return Document(page_content=text, metadata={"id": doc["id"], "bm25_score": score})
+
+    def search_documents(self, query: str, k: int = 10) -> List[Document]:
+        return [self.to_document(row, score) for row, score in self.search(query, k)]
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            rows = np.zeros(0, dtype=np.int64)
+            tfs = np.zeros(0, dtype=np.float32)
+        else:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = self.doc_ids[start:end].astype(np.int64)
+            tfs = self.term_freqs[start:end].astype(np.float32)
+        delta = self._delta.get(term)
+        if delta:
+            delta = np.asarray(delta, dtype=np.int64)
+            rows = np.concatenate([rows, delta[:, 0]])
+            tfs = np.concatenate([tfs, delta[:, 1].astype(np.float32)])
+        return rows, tfs
+
+    def save(self, path: str = LEXICAL_INDEX_PATH):
+        self.compact()
+        os.makedirs(path, exist_ok=True)
+        np.savez_compressed(
+            os.path.join(path, "postings.npz"),
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            term_freqs=self.term_freqs,
+            doc_lengths=self.doc_lengths,
+        )
+        with open(os.path.join(path, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "vocab": list(self.vocab), "docs": self.docs}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str = LEXICAL_INDEX_PATH) -> "LexicalIndex":
+        with open(os.path.join(path, "index.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(k1=meta["k1"], b=meta["b"])
+        arrays = np.load(os.path.join(path, "postings.npz"))
+        index.offsets = arrays["offsets"]
+        index.doc_ids = arrays["doc_ids"]
+        index.term_freqs = arrays["term_freqs"]
+        index.doc_lengths = arrays["doc_lengths"]
+        index.vocab = {term: term_id for term_id, term in enumerate(meta["vocab"])}
+        index.docs = meta["docs"]
+        index.rows = {doc["element_id"]: row for row, doc in enumerate(index.docs)}
+        index.deleted = np.zeros(len(index.docs), dtype=bool)
+        return index
+
+    def refresh(self, driver) -> dict:
+        """Apply new, changed and deleted Noidung nodes from Neo4j."""
+        start_time = time.perf_counter()
+        with driver.session() as session:
+            nodes = [record.data() for record in session.run(NODES_QUERY)]
+        changed = [
+            node for node in nodes
+            if node["element_id"] not in self.rows
+            or self.docs[self.rows[node["element_id"]]]["content"] != node["content"]
+        ]
+        removed = set(self.rows) - {node["element_id"] for node in nodes}
+        self.add_documents(changed)
+        self.remove_documents(list(removed))
+        return {
+            "documents": self.num_documents,
+            "changed": len(changed),
+            "removed": len(removed),
+            "seconds": time.perf_counter() - start_time,
+        }
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Document]], k: int = 10, rrf_k: int = 60) -> List[Document]:
+    """Merge ranked Document lists by reciprocal rank fusion, keyed by page_content."""
+    scores: Dict[str, float] = defaultdict(float)
+    documents: Dict[str, Document] = {}
+    for results in result_lists:
+        for rank, document in enumerate(results):
+            key = document.page_content
+            scores[key] += 1.0 / (rrf_k + rank + 1)
+            documents.setdefault(key, document)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in ranked]
+
+
+class FusionRetriever(BaseRetriever):
+    """Vector retriever fused with the BM25 index by reciprocal rank fusion."""
+
+    vector_retriever: BaseRetriever
+    lexical_index: LexicalIndex
+    k: int = 10
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector_documents = self.vector_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        lexical_documents = self.lexical_index.search_documents(query, self.k)
+        return reciprocal_rank_fusion([vector_documents, lexical_documents], self.k, self.rrf_k)
+
+
+def load_lexical_index(path: str = LEXICAL_INDEX_PATH) -> Optional[LexicalIndex]:
+    if not os.path.exists(os.path.join(path, "index.json")):
+        return None
+    return LexicalIndex.load(path)
+
+
+if __name__ == "__main__":
+    # python -m chains.lexical_index build|refresh
+    command = sys.argv[1] if len(sys.argv) > 1 else "refresh"
+    driver = GraphDatabase.driver(
+        os.getenv("NEO4J_URI"),
+        auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+    )
+    try:
+        index = (load_lexical_index() if command == "refresh" else None) or LexicalIndex()
+        report = index.refresh(driver)
+        index.save()
+    finally:
+        driver.close()
+    print(report)
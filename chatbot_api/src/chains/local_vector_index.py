@@ -0,0 +1,247 @@
+import json
+import os
+import shutil
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from neo4j import GraphDatabase
+
+load_dotenv()
+
+LOCAL_VECTOR_INDEX_PATH = os.getenv("LOCAL_VECTOR_INDEX_PATH", "vector_snapshot")
+LOCAL_VECTOR_INDEX_HNSW = os.getenv("LOCAL_VECTOR_INDEX_HNSW", "false").lower() == "true"
+
+EXPORT_QUERY = """
+MATCH (n:Noidung) WHERE n.embedding IS NOT NULL
+RETURN elementId(n) AS element_id, n.id AS id, n.content AS content,
+       n.content_hash AS content_hash, n.embedding_model AS embedding_model, n.embedding AS embedding
+"""
+# content_hash và embedding_model do chains.reindex / ETL ghi cùng lúc với embedding
+NODES_QUERY = """
+MATCH (n:Noidung) WHERE n.embedding IS NOT NULL
+RETURN elementId(n) AS element_id, n.id AS id, n.content AS content,
+       n.content_hash AS content_hash, n.embedding_model AS embedding_model
+"""
+# Node có embedding được ghi lại khi một trong các trường này đổi
+CHANGE_KEYS = ("content", "content_hash", "embedding_model")
+EMBEDDINGS_QUERY = """
+MATCH (n:Noidung) WHERE elementId(n) IN $element_ids
+RETURN elementId(n) AS element_id, n.embedding AS embedding
+"""
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class LocalVectorIndex:
+    """Snapshot of the Noidung embeddings served in-process.
+
+    Each snapshot version is a subdirectory holding ``embeddings.f32``
+    (row-normalized float32 matrix, memory-mapped on load), ``nodes.json``
+    with the element id, id, content, content hash and embedding model of
+    every row and, when hnswlib is installed and enabled, an HNSW graph in
+    ``hnsw.bin``. ``current.json``
+    names the version to load and is replaced last, so a reader never pairs
+    the vectors of one version with the nodes of another.
+    """
+
+    def __init__(self, path: str = LOCAL_VECTOR_INDEX_PATH, use_hnsw: bool = LOCAL_VECTOR_INDEX_HNSW):
+        self.path = path
+        self.use_hnsw = use_hnsw
+        self.nodes: List[dict] = []
+        self.matrix: Optional[np.ndarray] = None
+        self.hnsw = None
+        self.load()
+
+    def load(self):
+        directory = _current_version(self.path)
+        if directory is None:
+            raise FileNotFoundError(f"No vector snapshot in {self.path}")
+        with open(os.path.join(directory, "nodes.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.nodes = meta["nodes"]
+        self.hnsw = None
+        if not self.nodes:
+            # Không mmap được file rỗng
+            self.matrix = np.zeros((0, meta["dim"]), dtype=np.float32)
+            return
+        self.matrix = np.memmap(
+            os.path.join(directory, "embeddings.f32"),
+            dtype=np.float32,
+            mode="r",
+            shape=(len(self.nodes), meta["dim"]),
+        )
+        hnsw_path = os.path.join(directory, "hnsw.bin")
+        if self.use_hnsw and os.path.exists(hnsw_path):
+            import hnswlib
+
+            self.hnsw = hnswlib.Index(space="ip", dim=meta["dim"])
+            self.hnsw.load_index(hnsw_path, max_elements=len(self.nodes))
+            self.hnsw.set_ef(int(os.getenv("LOCAL_VECTOR_INDEX_EF", "64")))
+
+    def search(self, embedding: List[float], k: int = 10) -> List[Tuple[int, float]]:
+        """Return (row, cosine similarity) of the top-k rows, best first."""
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        k = min(k, len(self.nodes))
+        if k <= 0:
+            return []
+
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(query, k=k)
+            # hnswlib trả về khoảng cách 1 - inner product
+            return [(int(row), float(1 - dist)) for row, dist in zip(labels[0], distances[0])]
+
+        scores = self.matrix @ query
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def to_document(self, row: int, score: float) -> Document:
+        node = self.nodes[row]
+        # Giữ nguyên định dạng page_content của Neo4jVector.from_existing_graph
+        text = f"\ncontent: {node['content'] or ''}\nid: {node['id'] or ''}"
+        # Neo4j trả về điểm cosine đã được chuẩn hóa về [0, 1]
+        return Document(page_content=text, metadata={"id": node["id"], "score": (1 + score) / 2})
+
+    @classmethod
+    def export(cls, driver, path: str = LOCAL_VECTOR_INDEX_PATH) -> dict:
+        """Write a full snapshot of the Noidung embeddings from Neo4j."""
+        start_time = time.perf_counter()
+        nodes, embeddings = [], []
+        with driver.session() as session:
+            for record in session.run(EXPORT_QUERY):
+                nodes.append({key: record[key] for key in ("element_id", "id") + CHANGE_KEYS})
+                embeddings.append(record["embedding"])
+        if not nodes:
+            raise ValueError("No Noidung node has an embedding yet")
+
+        _write_snapshot(path, nodes, np.asarray(embeddings, dtype=np.float32))
+        return {"nodes": len(nodes), "changed": len(nodes), "seconds": time.perf_counter() - start_time}
+
+    @classmethod
+    def refresh(cls, driver, path: str = LOCAL_VECTOR_INDEX_PATH) -> dict:
+        """Update an existing snapshot, fetching embeddings only for new or changed nodes.
+
+        A node counts as changed when its content, content hash or embedding
+        model differs from the snapshot, so re-embedding the corpus with
+        another model never leaves old vectors next to new ones. When the
+        embedding size changed the whole snapshot is exported again.
+        """
+        if _current_version(path) is None:
+            return cls.export(driver, path)
+
+        start_time = time.perf_counter()
+        old_index = cls(path, use_hnsw=False)
+        old_rows = {node["element_id"]: row for row, node in enumerate(old_index.nodes)}
+
+        with driver.session() as session:
+            nodes = [record.data() for record in session.run(NODES_QUERY)]
+            changed = [
+                node["element_id"] for node in nodes
+                if node["element_id"] not in old_rows or any(
+                    old_index.nodes[old_rows[node["element_id"]]].get(key) != node[key] for key in CHANGE_KEYS
+                )
+            ]
+            changed_embeddings = {}
+            for start in range(0, len(changed), 1000):
+                result = session.run(EMBEDDINGS_QUERY, element_ids=changed[start:start + 1000])
+                changed_embeddings.update({record["element_id"]: record["embedding"] for record in result})
+
+        dim = old_index.matrix.shape[1]
+        if any(len(embedding) != dim for embedding in changed_embeddings.values()):
+            # Model mới có số chiều khác: không ghép được với vector cũ
+            return cls.export(driver, path)
+
+        matrix = np.empty((len(nodes), dim), dtype=np.float32)
+        for row, node in enumerate(nodes):
+            element_id = node["element_id"]
+            if element_id in changed_embeddings:
+                matrix[row] = _normalize(np.asarray([changed_embeddings[element_id]], dtype=np.float32))[0]
+            else:
+                matrix[row] = old_index.matrix[old_rows[element_id]]
+
+        _write_snapshot(path, nodes, matrix, normalized=True)
+        return {
+            "nodes": len(nodes),
+            "changed": len(changed),
+            "removed": len(set(old_rows) - {node["element_id"] for node in nodes}),
+            "seconds": time.perf_counter() - start_time,
+        }
+
+
+def _current_version(path: str) -> Optional[str]:
+    """Directory of the snapshot version named by ``current.json``, None if there is no snapshot."""
+    manifest_path = os.path.join(path, "current.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            return os.path.join(path, json.load(f)["version"])
+    # Snapshot cũ ghi thẳng vào thư mục gốc, trước khi có phiên bản
+    return path if os.path.exists(os.path.join(path, "nodes.json")) else None
+
+
+def _write_snapshot(path: str, nodes: List[dict], matrix: np.ndarray, normalized: bool = False):
+    # Ghi trọn phiên bản mới vào thư mục riêng rồi mới đổi current.json, tiến trình đang đọc không bị ảnh hưởng
+    if not normalized:
+        matrix = _normalize(matrix)
+    dim = matrix.shape[1]
+    version = f"v{time.time_ns()}"
+    directory = os.path.join(path, version)
+    os.makedirs(directory)
+
+    matrix.astype(np.float32).tofile(os.path.join(directory, "embeddings.f32"))
+    if LOCAL_VECTOR_INDEX_HNSW and len(nodes):
+        import hnswlib
+
+        hnsw = hnswlib.Index(space="ip", dim=dim)
+        hnsw.init_index(max_elements=len(nodes), ef_construction=200, M=16)
+        hnsw.add_items(matrix, np.arange(len(nodes)))
+        hnsw.save_index(os.path.join(directory, "hnsw.bin"))
+    with open(os.path.join(directory, "nodes.json"), "w", encoding="utf-8") as f:
+        json.dump({"dim": dim, "nodes": nodes}, f, ensure_ascii=False)
+
+    manifest_path = os.path.join(path, "current.json")
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": version}, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    # Giữ lại phiên bản liền trước cho tiến trình vừa đọc manifest cũ, xóa các phiên bản cũ hơn
+    versions = sorted(name for name in os.listdir(path) if name.startswith("v") and name[1:].isdigit())
+    for name in versions[:-2]:
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+class LocalVectorRetriever(BaseRetriever):
+    """Drop-in replacement for ``Neo4jVector.as_retriever`` backed by a LocalVectorIndex."""
+
+    index: LocalVectorIndex
+    embedder: Embeddings
+    k: int = 10
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        embedding = self.embedder.embed_query(query)
+        return [self.index.to_document(row, score) for row, score in self.index.search(embedding, self.k)]
+
+
+if __name__ == "__main__":
+    # python -m chains.local_vector_index export|refresh
+    command = sys.argv[1] if len(sys.argv) > 1 else "refresh"
+    driver = GraphDatabase.driver(
+        os.getenv("NEO4J_URI"),
+        auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+    )
+    try:
+        report = LocalVectorIndex.export(driver) if command == "export" else LocalVectorIndex.refresh(driver)
+    finally:
+        driver.close()
+    print(report)
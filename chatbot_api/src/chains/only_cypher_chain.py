@@ -1,24 +1,51 @@
 import  os
+import asyncio
+
+import numpy as np
 from dotenv import load_dotenv
 from langchain_neo4j import Neo4jGraph
-from langchain_groq import ChatGroq
-from langchain_neo4j.chains.graph_qa.cypher import GraphCypherQAChain
+from langchain_neo4j.chains.graph_qa.cypher import GraphCypherQAChain, extract_cypher
 from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
 
 load_dotenv()
 
+from chains.legal_index import get_legal_index
+from chains.only_vector_chain import get_chunked_embedder
+from chains.reranker import RERANK_ENABLED, get_reranker
+from utils import metrics, resilience
+from utils.cypher_cache import CypherCache, schema_fingerprint
+from utils.shared_cache import CACHE_BACKEND, SharedCypherCache
+from utils.llm import get_chat_model
+from utils.model_registry import get_or_load, is_loaded
+from utils.neo4j_pool import read_query
+from utils.schema_snapshot import SchemaSnapshot
+
 QA_MODEL = os.getenv("QA_MODEL")
 CYPHER_MODEL = os.getenv("CYPHER_MODEL")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-
+# Cho phép dùng lại câu Cypher của câu hỏi gần giống nhất theo embedding
+CYPHER_CACHE_SEMANTIC = os.getenv("CYPHER_CACHE_SEMANTIC", "false").lower() == "true"
 
-graph = Neo4jGraph(
-    url=os.getenv("NEO4J_URI"),
-    username=os.getenv("NEO4J_USERNAME"),
-    password=os.getenv("NEO4J_PASSWORD"),
+cypher_cache = (SharedCypherCache if CACHE_BACKEND == "sqlite" else CypherCache)(
+    max_size=int(os.getenv("CYPHER_CACHE_MAX_SIZE", "5000")),
+    threshold=float(os.getenv("CYPHER_CACHE_THRESHOLD", "0.97")),
 )
 
-graph.refresh_schema()
+
+def get_graph() -> Neo4jGraph:
+    """Shared Neo4jGraph, connected on first use without introspecting the schema."""
+    return get_or_load("neo4j_graph", lambda: Neo4jGraph(
+        url=os.getenv("NEO4J_URI"),
+        username=os.getenv("NEO4J_USERNAME"),
+        password=os.getenv("NEO4J_PASSWORD"),
+        refresh_schema=False,
+    ))
+
+
+schema_snapshot = SchemaSnapshot(
+    graph_factory=get_graph,
+    path=os.getenv("SCHEMA_SNAPSHOT_PATH", "schema_snapshot.json"),
+    ttl=float(os.getenv("SCHEMA_SNAPSHOT_TTL", "86400")),
+)
 
 cypher_generation_template = """
 Task:
@@ -76,9 +103,20 @@ qa_generation_prompt = PromptTemplate(
 
 class CypherChain:
     def __init__(self):
-        self.cypher_chain = GraphCypherQAChain.from_llm(
-            cypher_llm=ChatGroq(model=CYPHER_MODEL, temperature=0, api_key=GROQ_API_KEY),
-            qa_llm=ChatGroq(model=QA_MODEL, temperature=0, api_key=GROQ_API_KEY),
+        schema_snapshot.ensure()
+        self.cypher_llm = get_chat_model(CYPHER_MODEL)
+        self.qa_llm = get_chat_model(QA_MODEL)
+        self.cypher_chain = self.build_chain()
+        self.reranker = get_reranker() if RERANK_ENABLED else None
+        self.legal_index = get_legal_index()
+
+    def build_chain(self) -> GraphCypherQAChain:
+        """Build the QA chain against the current schema snapshot."""
+        graph = get_graph()
+        schema_snapshot.apply(graph)
+        return GraphCypherQAChain.from_llm(
+            cypher_llm=self.cypher_llm,
+            qa_llm=self.qa_llm,
             graph=graph,
             verbose=True,
             qa_prompt=qa_generation_prompt,
@@ -91,6 +129,91 @@ class CypherChain:
     def run_cypher_chain(self, query):
          return self.cypher_chain.invoke(query)
 
+    async def agenerate_cypher(self, query: str) -> str:
+        generated_cypher = await self.cypher_chain.cypher_generation_chain.ainvoke(
+            {"question": query, "schema": self.cypher_chain.graph_schema}
+        )
+        generated_cypher = extract_cypher(generated_cypher)
+        if self.cypher_chain.cypher_query_corrector:
+            generated_cypher = self.cypher_chain.cypher_query_corrector(generated_cypher)
+        return generated_cypher
+
+    async def aretrieve_context(self, query: str) -> dict:
+        """Return the Cypher query, reused from the cache when possible, and its result rows.
+
+        Questions citing articles or chapters that the legal index resolves
+        skip Cypher generation and read the cited articles directly.
+        """
+        if self.legal_index is not None:
+            with metrics.stage("legal_index"):
+                structural = await self.legal_index.alookup(query, self.cypher_chain.top_k)
+            if structural is not None:
+                return {"cypher": None, "context": structural["rows"], "cache_hit": False,
+                        "citations": structural["citations"]}
+
+        # Snapshot quá TTL được làm mới ở thread nền; khi chưa có snapshot thì đọc schema Neo4j trong thread
+        await schema_snapshot.aensure()
+        fingerprint = schema_fingerprint(self.cypher_chain.graph_schema)
+        embedding = None
+        if CYPHER_CACHE_SEMANTIC:
+            embedding = np.asarray(
+                await resilience.call("embedding", asyncio.to_thread, get_chunked_embedder().embed_query, query)
+            )
+
+        # Cache Cypher dùng chung (SQLite) chặn trên lock và ghi đĩa, không gọi trực tiếp trên event loop
+        generated_cypher = await asyncio.to_thread(cypher_cache.lookup, query, fingerprint, embedding)
+        cache_hit = generated_cypher is not None
+        if not cache_hit:
+            with metrics.stage("cypher_generation"):
+                generated_cypher = await self.agenerate_cypher(query)
+        if not generated_cypher:
+            return {"cypher": generated_cypher, "context": [], "cache_hit": False}
+
+        try:
+            with metrics.stage("cypher_query"):
+                context = await read_query(generated_cypher)
+        except Exception:
+            await asyncio.to_thread(cypher_cache.record_failure, query, generated_cypher, fingerprint)
+            raise
+        if context:
+            await asyncio.to_thread(cypher_cache.record_success, query, generated_cypher, fingerprint, embedding)
+        else:
+            await asyncio.to_thread(cypher_cache.record_failure, query, generated_cypher, fingerprint)
+        context = context[: self.cypher_chain.top_k]
+        if self.reranker is not None:
+            with metrics.stage("rerank"):
+                context = await asyncio.to_thread(self.reranker.rerank_rows, query, context)
+        return {"cypher": generated_cypher, "context": context, "cache_hit": cache_hit}
+
+    async def arun_cypher_chain(self, query: str) -> dict:
+        retrieved = await self.aretrieve_context(query)
+        with metrics.stage("qa_generation"):
+            result = await self.cypher_chain.qa_chain.ainvoke(
+                {"question": query, "context": retrieved["context"]}
+            )
+        return {"query": query, "result": result}
+
+
+def get_cypher_chain() -> CypherChain:
+    return get_or_load("cypher_chain", CypherChain)
+
+
+async def aget_cypher_chain() -> CypherChain:
+    """``get_cypher_chain`` for coroutines; building the chain may introspect Neo4j, so it runs in a thread."""
+    if not is_loaded("cypher_chain"):
+        await asyncio.to_thread(get_cypher_chain)
+    return get_cypher_chain()
+
+
+def _on_schema_refreshed(snapshot: SchemaSnapshot):
+    # Câu Cypher trong cache tự bị loại bỏ khi fingerprint của schema thay đổi
+    if is_loaded("cypher_chain"):
+        cypher_chain = get_cypher_chain()
+        cypher_chain.cypher_chain = cypher_chain.build_chain()
+
+
+schema_snapshot.listeners.append(_on_schema_refreshed)
+
 
 if __name__ == "__main__":
     # Test Cypher chain
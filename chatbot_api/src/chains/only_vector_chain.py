@@ -1,8 +1,10 @@
+import asyncio
 import os
 from langchain_community.vectorstores.neo4j_vector import Neo4jVector
+from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_google_genai import GoogleGenerativeAI
 from langchain_groq import  ChatGroq
 from langchain_core.prompts import (
@@ -13,13 +15,52 @@ from  dotenv import load_dotenv
 
 load_dotenv()
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List
+from typing import List, Optional
 import numpy as np
 
+from chains.context_packer import ContextPacker, token_budget
+from chains.legal_index import get_legal_index
+from chains.lexical_index import FusionRetriever, LexicalIndex, load_lexical_index, reciprocal_rank_fusion
+from chains.local_vector_index import LocalVectorIndex, LocalVectorRetriever
+from chains.reranker import RERANK_ENABLED, get_reranker
+from utils.embedding_store import EmbeddingStore
+from utils.llm import get_chat_model
+from utils.model_registry import get_embedder, get_or_load, get_query_embedder
+from utils import metrics, resilience
+from utils.neo4j_pool import read_query
+
+# neo4j | local (snapshot được xuất bằng python -m chains.local_vector_index)
+VECTOR_RETRIEVER = os.getenv("VECTOR_RETRIEVER", "neo4j")
+# Gộp kết quả vector với chỉ mục BM25 (python -m chains.lexical_index build)
+LEXICAL_FUSION = os.getenv("LEXICAL_FUSION", "false").lower() == "true"
+# Thay đoạn Noidung tìm được bằng cả Điều chứa nó (python -m chains.legal_index build)
+LEGAL_EXPAND_VECTOR_HITS = os.getenv("LEGAL_EXPAND_VECTOR_HITS", "false").lower() == "true"
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH")
+embedding_store = EmbeddingStore(EMBEDDING_STORE_PATH) if EMBEDDING_STORE_PATH else None
+
+# Cùng định dạng page_content với Neo4jVector.from_existing_graph
+RETRIEVAL_QUERY = """
+RETURN reduce(str='', k IN ['content', 'id'] | str + '\\n' + k + ': ' + coalesce(node[k], '')) AS text,
+       node {.*, embedding: Null, id: Null, content: Null, content_hash: Null, embedding_model: Null} AS metadata,
+       score
+"""
+VECTOR_SEARCH_QUERY = """
+CALL db.index.vector.queryNodes($index_name, $k, $embedding) YIELD node, score
+RETURN reduce(str='', k IN ['content', 'id'] | str + '\\n' + k + ': ' + coalesce(node[k], '')) AS text,
+       node.id AS id, score
+"""
+
 
 class ChunkedEmbedding(Embeddings):
-    def __init__(self, base_embedder, chunk_size=500, chunk_overlap=50):
+    def __init__(self, base_embedder, chunk_size=500, chunk_overlap=50, batch_size=64, batched=True,
+                 store: Optional[EmbeddingStore] = None, query_embedder=None):
         self.base_embedder = base_embedder
+        self.query_embedder = query_embedder or base_embedder
+        self.batch_size = batch_size
+        self.batched = batched
+        self.store = store
+        self.model_name = getattr(base_embedder, "model_name", type(base_embedder).__name__)
+        self.normalize = getattr(base_embedder, "encode_kwargs", {}).get("normalize_embeddings", False)
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
@@ -27,6 +68,9 @@ class ChunkedEmbedding(Embeddings):
         )
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.batched:
+            return self.embed_documents_batched(texts)
+
         final_embeddings = []
         for text in texts:
             # Chia văn bản thành các chunk nhỏ hơn
@@ -40,37 +84,100 @@ class ChunkedEmbedding(Embeddings):
             final_embeddings.append(embedding)
         return final_embeddings
 
+    def embed_documents_batched(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        all_chunks, chunk_counts = self._split_documents(texts)
+        chunk_embeddings = self._embed_chunks(all_chunks)
+
+        # Mean pooling theo từng văn bản: mỗi vòng cộng chunk thứ j của mọi văn bản còn chunk đó, nên số vòng
+        # bằng số chunk lớn nhất chứ không bằng số văn bản (np.add.reduceat theo axis=0 chậm hơn vài lần).
+        # Giữ nguyên float32, chia cho mảng int64 sẽ nâng cả ma trận lên float64.
+        starts = np.concatenate(([0], np.cumsum(chunk_counts)[:-1]))
+        pooled = chunk_embeddings[starts]
+        for j in range(1, int(chunk_counts.max())):
+            docs = np.flatnonzero(chunk_counts > j)
+            pooled[docs] += chunk_embeddings[starts[docs] + j]
+        pooled /= chunk_counts.astype(np.float32)[:, None]
+        return pooled.tolist()
+
+    def prefetch(self, texts: List[str]) -> dict:
+        """Encode and store every chunk of ``texts`` that is not in the store yet."""
+        if self.store is None:
+            raise ValueError("prefetch requires an EmbeddingStore")
+        all_chunks, _ = self._split_documents(texts)
+        self._embed_chunks(list(dict.fromkeys(all_chunks)))
+        return self.store.stats()
+
+    def _split_documents(self, texts: List[str]):
+        # Chia tất cả văn bản trước, văn bản chỉ có một chunk thì giữ nguyên như cũ
+        all_chunks = []
+        chunk_counts = np.empty(len(texts), dtype=np.int64)
+        for i, text in enumerate(texts):
+            chunks = self.text_splitter.split_text(text)
+            if len(chunks) <= 1:
+                chunks = [text]
+            all_chunks.extend(chunks)
+            chunk_counts[i] = len(chunks)
+        return all_chunks, chunk_counts
+
+    def _embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        if self.store is None:
+            return self._encode(chunks)
+
+        keys = [self.store.make_key(self.model_name, chunk, self.normalize) for chunk in chunks]
+        found, cached = self.store.get_many(keys)
+        if found.all():
+            return np.array(cached, dtype=np.float32)
+
+        missing_ids = np.flatnonzero(~found)
+        encoded = self._encode([chunks[i] for i in missing_ids])
+        self.store.put_many([keys[i] for i in missing_ids], encoded)
+
+        embeddings = np.empty((len(chunks), encoded.shape[1]), dtype=np.float32)
+        if len(cached):
+            embeddings[found] = cached
+        embeddings[missing_ids] = encoded
+        return embeddings
+
+    def _encode(self, chunks: List[str]) -> np.ndarray:
+        """Encode chunks in length-bucketed batches to minimise padding."""
+        order = np.argsort([-len(chunk) for chunk in chunks], kind="stable")
+        embeddings = None
+        for start in range(0, len(order), self.batch_size):
+            batch_ids = order[start:start + self.batch_size]
+            batch = self.base_embedder.embed_documents([chunks[i] for i in batch_ids])
+            batch = np.asarray(batch, dtype=np.float32)
+            if embeddings is None:
+                embeddings = np.empty((len(chunks), batch.shape[1]), dtype=np.float32)
+            embeddings[batch_ids] = batch
+        return embeddings
+
     def embed_query(self, text: str) -> List[float]:
-        return self.base_embedder.embed_query(text)
+        return self.query_embedder.embed_query(text)
 
 
-base_embedder = HuggingFaceEmbeddings(
-    model_name="NghiemAbe/Vi-Legal-Bi-Encoder-v2",
-    model_kwargs={'device': 'cpu'},
-    encode_kwargs={'normalize_embeddings': True}
-)
-chunked_embedder = ChunkedEmbedding(base_embedder)
+def get_chunked_embedder() -> ChunkedEmbedding:
+    """Shared ChunkedEmbedding, the bi-encoder is loaded once per process on first use."""
+    return get_or_load("chunked_embedder", lambda: ChunkedEmbedding(
+        get_embedder(),
+        store=embedding_store,
+        query_embedder=get_query_embedder(),
+    ))
+
 
 class Neo4jVectorIndex:
     def __init__(self):
-        self.base_embedder = HuggingFaceEmbeddings(
-            model_name="NghiemAbe/Vi-Legal-Bi-Encoder-v2",
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
-        self.chunked_embedder = ChunkedEmbedding(self.base_embedder)
-        self.vector_index = Neo4jVector.from_existing_graph(
+        self.chunked_embedder = get_chunked_embedder()
+        # Chỉ nối vào index có sẵn; việc embed node mới hoặc đã sửa do python -m chains.reindex làm
+        self.vector_index = Neo4jVector.from_existing_index(
             embedding=self.chunked_embedder,
             url=os.getenv("NEO4J_URI"),
             username=os.getenv("NEO4J_USERNAME"),
             password=os.getenv("NEO4J_PASSWORD"),
             index_name="VectorIndex",
-            node_label="Noidung",
-            text_node_properties=[
-                "content",
-                "id",
-            ],
-            embedding_node_property="embedding",
+            retrieval_query=RETRIEVAL_QUERY,
         )
         self.retriever =  self.vector_index.as_retriever(k = 10)
 
@@ -78,6 +185,17 @@ class Neo4jVectorIndex:
     def get_retriever(self):
         return self.retriever
 
+    async def aget_relevant_documents(self, query: str, k: int = 10) -> List[Document]:
+        """Vector search over the shared async driver pool instead of the sync driver."""
+        embedding = await resilience.call("embedding", asyncio.to_thread, self.chunked_embedder.embed_query, query)
+        rows = await read_query(
+            VECTOR_SEARCH_QUERY, {"index_name": "VectorIndex", "k": k, "embedding": embedding}
+        )
+        return [
+            Document(page_content=row["text"], metadata={"id": row["id"], "score": row["score"]})
+            for row in rows
+        ]
+
     def close_vector_index(self):
         self.vector_index._driver.close()
         return
@@ -85,16 +203,33 @@ class Neo4jVectorIndex:
 
 
 
+def get_local_retriever(k: int = 10) -> LocalVectorRetriever:
+    index = get_or_load("local_vector_index", LocalVectorIndex)
+    return LocalVectorRetriever(index=index, embedder=get_chunked_embedder(), k=k)
+
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    return get_or_load("lexical_index", load_lexical_index)
+
+
 class VectorChain:
     def __init__(self):
-        self.vector_index = Neo4jVectorIndex()
-        self.llm = ChatGroq(
-            model=os.getenv("VECTOR_MODEL"),
-            temperature=0,
+        if VECTOR_RETRIEVER == "local":
+            self.vector_index = None
+            self.retriever = get_local_retriever()
+        else:
+            self.vector_index = Neo4jVectorIndex()
+            self.retriever = self.vector_index.get_retriever()
+        self.lexical_index = get_lexical_index() if LEXICAL_FUSION else None
+        if self.lexical_index is not None:
+            self.retriever = FusionRetriever(vector_retriever=self.retriever, lexical_index=self.lexical_index)
+        self.reranker = get_reranker() if RERANK_ENABLED else None
+        self.legal_index = get_legal_index() if LEGAL_EXPAND_VECTOR_HITS else None
+        self.context_packer = ContextPacker(token_budget=token_budget(os.getenv("VECTOR_MODEL")))
+        self.llm = get_chat_model(
+            os.getenv("VECTOR_MODEL"),
             max_tokens=None,
             timeout=None,
-            max_retries=2,
-            api_key=os.getenv("GROQ_API_KEY")
         )
         # self.llm = GoogleGenerativeAI(
         #     model=os.getenv("GEMINI_MODEL"),
@@ -112,6 +247,8 @@ class VectorChain:
             Hãy ghi nhớ bạn chỉ trả lời trong pháp luật Việt Nam và khi trả lời hãy trích dẫn
             các nội dung liên quan Luật nào, phần nào trong Pháp điển đến nếu tìm kiếm được bằng Vector Search vào trong câu trả lời.
             
+            Mỗi nội dung liên quan có mã trích dẫn dạng [1], [2]; hãy ghi mã tương ứng sau phần trả lời dùng nội dung đó.
+
             Chú ý quan trọng: Từ các nội dung đã trích xuất được thì 
             Nội dung liên quan: 
             {context}
@@ -125,17 +262,62 @@ class VectorChain:
             ("human", "{question}")
         ])
 
+    def retrieve_documents(self, query: str) -> List[Document]:
+        documents = self.retriever.invoke(query)
+        if self.reranker is not None:
+            documents = self.reranker.rerank_documents(query, documents)
+        return documents
+
     def run_vector_chain(self, query: str) -> str:
-            retriever = self.vector_index.get_retriever()
+            retriever = self.retriever if self.reranker is None else RunnableLambda(self.retrieve_documents)
             chain = (
-                    {"context": retriever, "question": RunnablePassthrough()}
+                    {"context": retriever | RunnableLambda(self.pack_context), "question": RunnablePassthrough()}
                     | self.prompt
                     | self.llm
                     | StrOutputParser()
             )
-            self.vector_index.close_vector_index()
             return chain.invoke(query)
 
+    async def aretrieve_documents(self, query: str) -> List[Document]:
+        with metrics.stage("vector_retrieval"):
+            documents = await self._aretrieve_candidates(query)
+        if self.reranker is not None:
+            with metrics.stage("rerank"):
+                documents = await asyncio.to_thread(self.reranker.rerank_documents, query, documents)
+        if self.legal_index is not None:
+            with metrics.stage("expand_articles"):
+                documents = await self.legal_index.aexpand_documents(documents)
+        return documents
+
+    async def _aretrieve_candidates(self, query: str) -> List[Document]:
+        if self.vector_index is None:
+            documents = await self.retriever.ainvoke(query)
+        else:
+            documents = await self.vector_index.aget_relevant_documents(query)
+        if self.vector_index is not None and self.lexical_index is not None:
+            lexical_documents = await asyncio.to_thread(self.lexical_index.search_documents, query, 10)
+            documents = reciprocal_rank_fusion([documents, lexical_documents], k=10)
+        return documents
+
+    def pack_context(self, documents: List[Document]) -> str:
+        with metrics.stage("context_pack"):
+            context, _ = self.context_packer.pack(documents)
+        return context
+
+    async def aretrieve_context(self, query: str) -> str:
+        documents = await self.aretrieve_documents(query)
+        return self.pack_context(documents)
+
+    async def arun_vector_chain(self, query: str) -> str:
+        context = await self.aretrieve_context(query)
+        chain = self.prompt | self.llm | StrOutputParser()
+        with metrics.stage("vector_answer"):
+            return await chain.ainvoke({"context": context, "question": query})
+
+
+def get_vector_chain() -> VectorChain:
+    return get_or_load("vector_chain", VectorChain)
+
 
 if __name__ == "__main__":
     # Test Chunking Embedding class
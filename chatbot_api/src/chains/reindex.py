@@ -0,0 +1,125 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Iterator, List
+
+import numpy as np
+from dotenv import load_dotenv
+from neo4j import GraphDatabase
+
+load_dotenv()
+
+REINDEX_BATCH_SIZE = int(os.getenv("REINDEX_BATCH_SIZE", "128"))
+# Mỗi lần chạy được ghi thêm một dòng JSON vào file này nếu được cấu hình
+REINDEX_REPORT_PATH = os.getenv("REINDEX_REPORT_PATH")
+
+# Không trả về embedding: chỉ cần biết node đã có vector hay chưa
+SCAN_QUERY = """
+MATCH (n:Noidung) WHERE n.content IS NOT NULL
+RETURN elementId(n) AS element_id, n.content AS content, n.content_hash AS content_hash,
+       n.embedding_model AS embedding_model, n.embedding IS NULL AS missing
+"""
+# content_hash là hash của đúng nội dung đã embed; nếu content đổi giữa lúc quét và lúc ghi
+# thì hash không khớp và node được embed lại ở lần chạy sau
+UPDATE_QUERY = """
+UNWIND $rows AS row
+MATCH (n:Noidung) WHERE elementId(n) = row.element_id
+CALL db.create.setNodeVectorProperty(n, 'embedding', row.embedding)
+SET n.content_hash = row.content_hash, n.embedding_model = row.embedding_model
+"""
+
+
+def content_hash(content: str) -> str:
+    """Hash stored next to the embedding; graphrag_neo4j_etl computes the same one."""
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def find_stale_nodes(session, model_name: str, report: dict, batch_size: int = REINDEX_BATCH_SIZE
+                     ) -> Iterator[List[dict]]:
+    """Noidung nodes that are new, whose content changed, or embedded by another model.
+
+    The scan is streamed and yielded in batches of ``batch_size``, so only the
+    content of one batch is held in memory at a time.
+    """
+    stale = []
+    for record in session.run(SCAN_QUERY):
+        report["scanned"] += 1
+        digest = content_hash(record["content"])
+        if record["missing"] or record["content_hash"] is None:
+            reason = "new"
+        elif record["content_hash"] != digest:
+            reason = "changed"
+        elif record["embedding_model"] != model_name:
+            reason = "model_changed"
+        else:
+            continue
+        report[reason] += 1
+        stale.append({"element_id": record["element_id"], "content": record["content"], "content_hash": digest})
+        if len(stale) == batch_size:
+            yield stale
+            stale = []
+    if stale:
+        yield stale
+
+
+def reindex(driver, embedder, batch_size: int = REINDEX_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """Re-embed only the stale Noidung nodes, one write transaction per batch."""
+    start_time = time.perf_counter()
+    model_name = getattr(embedder, "model_name", type(embedder).__name__)
+    report = {"model": model_name, "scanned": 0, "new": 0, "changed": 0, "model_changed": 0,
+              "embedded": 0, "batches": 0, "scan_s": 0.0, "embed_s": 0.0, "write_s": 0.0}
+
+    # Kết quả quét vẫn đang được đọc dần khi ghi, nên ghi bằng một session riêng
+    with driver.session() as scan_session, driver.session() as write_session:
+        batches = find_stale_nodes(scan_session, model_name, report, batch_size)
+        while True:
+            scan_start = time.perf_counter()
+            batch = next(batches, None)
+            report["scan_s"] += time.perf_counter() - scan_start
+            if batch is None:
+                break
+            if dry_run:
+                continue
+
+            embed_start = time.perf_counter()
+            embeddings = np.asarray(embedder.embed_documents([node["content"] for node in batch]), dtype=np.float32)
+            report["embed_s"] += time.perf_counter() - embed_start
+
+            rows = [
+                {"element_id": node["element_id"], "embedding": embedding.tolist(),
+                 "content_hash": node["content_hash"], "embedding_model": model_name}
+                for node, embedding in zip(batch, embeddings)
+            ]
+            write_start = time.perf_counter()
+            write_session.execute_write(lambda tx: tx.run(UPDATE_QUERY, rows=rows).consume())
+            report["write_s"] += time.perf_counter() - write_start
+            report["embedded"] += len(rows)
+            report["batches"] += 1
+
+    report["seconds"] = time.perf_counter() - start_time
+    if REINDEX_REPORT_PATH and not dry_run:
+        with open(REINDEX_REPORT_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"timestamp": time.time(), **report}) + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    # python -m chains.reindex [--dry-run] [--batch-size 128]
+    parser = argparse.ArgumentParser(description="Re-embed new or modified Noidung nodes")
+    parser.add_argument("--batch-size", type=int, default=REINDEX_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="only count the nodes that would be re-embedded")
+    args = parser.parse_args()
+
+    from chains.only_vector_chain import get_chunked_embedder
+
+    driver = GraphDatabase.driver(
+        os.getenv("NEO4J_URI"),
+        auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+    )
+    try:
+        report = reindex(driver, get_chunked_embedder(), batch_size=args.batch_size, dry_run=args.dry_run)
+    finally:
+        driver.close()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from utils.model_registry import get_or_load
+from utils.token_count import estimate_tokens
+
+# Chấm lại ứng viên bằng cross-encoder trước khi đưa vào prompt
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3")
+RERANKER_TOP_N = int(os.getenv("RERANKER_TOP_N", "4"))
+RERANKER_MAX_LENGTH = int(os.getenv("RERANKER_MAX_LENGTH", "512"))
+
+
+class CrossEncoderReranker:
+    """Score (question, passage) pairs with a cross-encoder and keep the best ``top_n``.
+
+    All candidates of a call are scored in a single batched forward pass on CPU.
+    """
+
+    def __init__(self, model_name: str = RERANKER_MODEL, top_n: int = RERANKER_TOP_N,
+                 max_length: int = RERANKER_MAX_LENGTH):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu", max_length=max_length)
+        self.top_n = top_n
+        self.calls = 0
+        self.seconds = 0.0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self._lock = threading.Lock()
+
+    def rerank(self, query: str, texts: List[str]) -> List[int]:
+        """Return the indices of the best ``top_n`` texts, best first."""
+        if len(texts) <= self.top_n:
+            return list(range(len(texts)))
+
+        start_time = time.perf_counter()
+        scores = self.model.predict([(query, text) for text in texts], batch_size=len(texts))
+        keep = np.argsort(-np.asarray(scores))[: self.top_n].tolist()
+        elapsed = time.perf_counter() - start_time
+
+        with self._lock:
+            self.calls += 1
+            self.seconds += elapsed
+            self.tokens_before += sum(estimate_tokens(text) for text in texts)
+            self.tokens_after += sum(estimate_tokens(texts[i]) for i in keep)
+        return keep
+
+    def rerank_documents(self, query: str, documents: List[Document]) -> List[Document]:
+        keep = self.rerank(query, [document.page_content for document in documents])
+        return [documents[i] for i in keep]
+
+    def rerank_rows(self, query: str, rows: List[dict]) -> List[dict]:
+        texts = [", ".join(f"{key}: {value}" for key, value in row.items()) for row in rows]
+        return [rows[i] for i in self.rerank(query, texts)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "avg_ms": self.seconds / self.calls * 1000 if self.calls else 0.0,
+                "prompt_tokens_before": self.tokens_before,
+                "prompt_tokens_after": self.tokens_after,
+                "prompt_tokens_saved": self.tokens_before - self.tokens_after,
+            }
+
+
+def get_reranker() -> CrossEncoderReranker:
+    return get_or_load("reranker", CrossEncoderReranker)
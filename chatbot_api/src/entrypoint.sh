@@ -4,4 +4,9 @@
 echo "Starting Vietnamese Legal RAG FastAPI service..."
 
 # Start the main application
-uvicorn main:app --host localhost --port 8000
\ No newline at end of file
+if [ "${SERVE_WORKERS:-1}" -gt 1 ]; then
+    # Nhiều worker: nạp model một lần ở master rồi fork (xem serve.py)
+    python serve.py --host localhost --port 8000 --workers "$SERVE_WORKERS"
+else
+    uvicorn main:app --host localhost --port 8000
+fi
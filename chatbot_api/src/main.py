@@ -1,35 +1,265 @@
-from fastapi import FastAPI
-from agents.rag_agent import rag_agent_executor
-from models.rag_query import QueryInput, QueryOutput
-from utils.async_utils import async_retry
+import time
+from utils import startup_report
+
+import asyncio
+import json
+import math
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from agents.hybrid_pipeline import aget_hybrid_pipeline
+from agents.query_router import (
+    AGENT,
+    QUERY_ROUTER_ENABLED,
+    arun_route,
+    astream_route_events,
+    get_query_router,
+)
+from chains.legal_index import get_legal_index
+from chains.only_cypher_chain import cypher_cache
+from chains.only_vector_chain import get_chunked_embedder, get_vector_chain
+from chains.reranker import RERANK_ENABLED, get_reranker
+from models.rag_query import BatchQueryOutput, QueryInput, QueryOutput
+from utils import neo4j_pool
+from utils.cypher_cache import normalize_question
+from utils.llm import close_http_clients
+from utils.llm_cache import get_llm_cache
+from utils import metrics, resilience
+from utils.model_registry import is_loaded
+from utils.rate_limiter import BATCH, RateLimitExceeded, priority, rate_limiter
+from utils.semantic_cache import SemanticAnswerCache
+from utils.shared_cache import CACHE_BACKEND, SharedAnswerCache
+from utils.single_flight import SingleFlight
 import  uvicorn
 
+startup_report.mark_phase("import", time.perf_counter() - startup_report.PROCESS_START)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Một pool kết nối Neo4j và Groq dùng chung cho mọi request
+    await neo4j_pool.init_driver()
+    yield
+    await neo4j_pool.close_driver()
+    await close_http_clients()
+
 app = FastAPI(
     title="Vietnamese Legal Chatbot",
     description="Chatbot hỏi đáp về pháp luật Việt Nam trong lĩnh vực khoa học và công nghệ ",
+    lifespan=lifespan,
 )
 
-@async_retry(max_retries=10, delay=1)
-async def invoke_agent_with_retry(query: str):
-    """Retry the agent if a tool fails to run.
+single_flight = SingleFlight()
+
+# Với nhiều worker (serve.py) cache câu trả lời nằm trong SQLite để mọi worker dùng chung
+answer_cache = (SharedAnswerCache if CACHE_BACKEND == "sqlite" else SemanticAnswerCache)(
+    get_embedder=get_chunked_embedder,
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    max_size=int(os.getenv("ANSWER_CACHE_MAX_SIZE", "1000")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+)
+
+@app.middleware("http")
+async def record_first_request(request: Request, call_next):
+    start_time = time.perf_counter()
+    response = await call_next(request)
+    if request.url.path.startswith("/rag-agent"):
+        startup_report.mark_first_request(time.perf_counter() - start_time)
+    return response
+
+@app.exception_handler(resilience.DeadlineExceeded)
+async def handle_deadline_exceeded(request: Request, exc: resilience.DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
-    This can help when there are intermittent connection issues
-    to external APIs.
-    """
-    return await rag_agent_executor.ainvoke({"input": query})
+@app.exception_handler(RateLimitExceeded)
+async def handle_rate_limit_exceeded(request: Request, exc: RateLimitExceeded):
+    # Từ chối ngay thay vì giữ request trong hàng đợi đến khi hết deadline
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+@app.exception_handler(resilience.StageUnavailableError)
+async def handle_stage_unavailable(request: Request, exc: resilience.StageUnavailableError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
 
 @app.get("/")
 async def get_status():
     return {"status": "running"}
 
+@app.get("/startup-report")
+async def get_startup_report():
+    return startup_report.report()
+
+def _uses_router(query: QueryInput) -> bool:
+    return QUERY_ROUTER_ENABLED and query.mode == "agent"
+
+async def route_query(query: QueryInput, embedding) -> str:
+    """Pick the answer path with the local router; ``agent`` when it is not confident."""
+    if not _uses_router(query):
+        return query.mode
+    with metrics.stage("query_router"):
+        if not is_loaded("query_router"):
+            # Lần đầu phải encode mọi prototype, không chạy việc đó trên event loop (serve.py nạp sẵn khi khởi động)
+            await asyncio.to_thread(get_query_router)
+        return get_query_router().classify(embedding)[0]
+
+async def run_query(query: QueryInput, embedding=None) -> dict:
+    if query.mode == "hybrid":
+        return await (await aget_hybrid_pipeline()).ainvoke(query.text)
+
+    route = await route_query(query, embedding) if embedding is not None else AGENT
+    start_time = time.perf_counter()
+    with metrics.stage(f"route:{route}"):
+        query_response = await arun_route(route, query.text)
+    if _uses_router(query):
+        get_query_router().record(route, time.perf_counter() - start_time)
+    return query_response
+
+async def answer_query(query: QueryInput) -> dict:
+    if not query.include_timings:
+        return await _answer_query(query)
+    with metrics.collect_breakdown() as timings:
+        query_response = await _answer_query(query)
+    return {**query_response, "timings": timings}
+
+async def embed_query(query: QueryInput):
+    """Normalized query embedding shared by the answer cache and the router, None if neither is on."""
+    if not (ANSWER_CACHE_ENABLED or _uses_router(query)):
+        return None
+    return await resilience.call("embedding", asyncio.to_thread, answer_cache.embed, query.text)
+
+def lookup_answer(embedding, mode: str) -> tuple:
+    """Cache generation and the answer cached for ``mode``; run it in a thread, the shared cache blocks on SQLite."""
+    return answer_cache.generation, answer_cache.lookup(embedding, mode)
+
+async def _answer_query(query: QueryInput) -> dict:
+    # Mọi stage của request (embedding, Neo4j, Groq) dùng chung một deadline
+    with resilience.deadline(), metrics.stage(f"request:{query.mode}"):
+        embedding = await embed_query(query)
+        if ANSWER_CACHE_ENABLED:
+            generation, cached_response = await asyncio.to_thread(lookup_answer, embedding, query.mode)
+            if cached_response is not None:
+                return {**cached_response, "input": query.text}
+
+        async def run_and_cache():
+            query_response = await run_query(query, embedding)
+            if ANSWER_CACHE_ENABLED:
+                await asyncio.to_thread(
+                    answer_cache.store, query.text, embedding, query_response, generation, query.mode
+                )
+            return query_response
+
+        # Các câu hỏi giống hệt nhau đang chạy dùng chung một lần chạy agent
+        key = f"{query.mode}:{normalize_question(query.text)}"
+        query_response = await single_flight.do(key, run_and_cache)
+        return {**query_response, "input": query.text}
+
 @app.post("/rag-agent")
 async def query_agent(query: QueryInput) -> QueryOutput:
-    query_response = await invoke_agent_with_retry(query.text)
-    query_response["intermediate_steps"] = [
-        str(s) for s in query_response["intermediate_steps"]
-    ]
+    return await answer_query(query)
 
-    return query_response
+@app.post("/rag-agent/batch")
+async def query_agent_batch(queries: list[QueryInput]) -> BatchQueryOutput:
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_one(query: QueryInput):
+        async with semaphore:
+            return await answer_query(query)
+
+    # Lời gọi LLM của batch xếp sau các request tương tác trong hàng đợi rate limit
+    with priority(BATCH):
+        responses = await asyncio.gather(*(run_one(q) for q in queries), return_exceptions=True)
+    return {
+        # CancelledError không phải Exception nhưng gather(return_exceptions=True) vẫn trả về nó
+        "results": [None if isinstance(r, BaseException) else r for r in responses],
+        "errors": [(str(r) or repr(r)) if isinstance(r, BaseException) else None for r in responses],
+    }
+
+@app.post("/rag-agent/stream")
+async def stream_agent(query: QueryInput):
+    """Stream NDJSON events: tool steps, answer tokens and the final QueryOutput."""
+    return StreamingResponse(stream_query_events(query), media_type="application/x-ndjson")
+
+async def stream_query_events(query: QueryInput):
+    with resilience.deadline():
+        embedding = await embed_query(query)
+        if ANSWER_CACHE_ENABLED:
+            generation, cached_response = await asyncio.to_thread(lookup_answer, embedding, query.mode)
+            if cached_response is not None:
+                yield _ndjson({"type": "token", "content": cached_response["output"]})
+                yield _ndjson({"type": "final", **cached_response, "input": query.text})
+                return
+
+        if query.mode == "hybrid":
+            events = (await aget_hybrid_pipeline()).astream_events(query.text)
+        else:
+            route = await route_query(query, embedding) if embedding is not None else AGENT
+            events = astream_route_events(route, query.text)
+
+        start_time = time.perf_counter()
+        try:
+            async for event in events:
+                if event["type"] == "final" and ANSWER_CACHE_ENABLED:
+                    response = {key: event[key] for key in ("input", "output", "intermediate_steps")}
+                    await asyncio.to_thread(
+                        answer_cache.store, query.text, embedding, response, generation, query.mode
+                    )
+                yield _ndjson(event)
+            if _uses_router(query):
+                get_query_router().record(route, time.perf_counter() - start_time)
+        except Exception as e:
+            # Không thể trả về mã lỗi HTTP khi đã bắt đầu stream
+            yield _ndjson({"type": "error", "message": str(e)})
+
+def _ndjson(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+def request_stats() -> dict:
+    stats = {"pid": os.getpid(), "single_flight": single_flight.stats(), "circuit_breakers": resilience.stats(),
+             "rate_limiter": rate_limiter.stats()}
+    if is_loaded("vector_chain"):
+        stats["context_packer"] = get_vector_chain().context_packer.stats()
+    if RERANK_ENABLED and is_loaded("reranker"):
+        stats["reranker"] = get_reranker().stats()
+    if QUERY_ROUTER_ENABLED and is_loaded("query_router"):
+        stats["router"] = get_query_router().stats()
+    if is_loaded("legal_index") and get_legal_index() is not None:
+        stats["legal_index"] = get_legal_index().stats()
+    return stats
+
+def cache_stats() -> dict:
+    stats = {"answers": answer_cache.stats(), "cypher": cypher_cache.stats()}
+    llm_cache = get_llm_cache()
+    if llm_cache is not None:
+        stats["llm"] = llm_cache.stats()
+    return stats
+
+metrics.register_stats("requests", request_stats)
+metrics.register_stats("cache", cache_stats)
+
+@app.get("/rag-agent/stats")
+async def get_request_stats():
+    return request_stats()
+
+@app.get("/rag-agent/cache")
+async def get_cache_stats():
+    return await asyncio.to_thread(cache_stats)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus exposition of stage latencies, LLM tokens and cache statistics."""
+    # Các cache SQLite được đọc khi render nên không chạy trên event loop
+    content, content_type = await asyncio.to_thread(metrics.render)
+    return Response(content=content, media_type=content_type)
+
+@app.post("/rag-agent/cache/invalidate")
+async def invalidate_answer_cache():
+    """Call this after the legal corpus in Neo4j has been reloaded."""
+    await asyncio.to_thread(answer_cache.invalidate)
+    return await asyncio.to_thread(answer_cache.stats)
 
 if __name__ == "__main__":
     uvicorn.run(app, host= "localhost", port=8000)
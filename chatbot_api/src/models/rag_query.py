@@ -1,9 +1,22 @@
+from typing import Literal, Optional
+
 from pydantic import BaseModel
 
 class QueryInput(BaseModel):
     text: str
+    # agent: bộ định tuyến cục bộ chọn nhánh, chỉ gọi agent khi không chắc chắn (QUERY_ROUTER_ENABLED)
+    # hybrid: chạy song song Vector Search và Cypher Chain
+    mode: Literal["agent", "hybrid"] = "agent"
+    # Trả kèm thời gian từng stage và số token của request (cần METRICS_ENABLED)
+    include_timings: bool = False
 
 class QueryOutput(BaseModel):
     input: str
     output: str
-    intermediate_steps: list[str]
\ No newline at end of file
+    intermediate_steps: list[str]
+    timings: Optional[dict[str, float]] = None
+
+class BatchQueryOutput(BaseModel):
+    # Cùng thứ tự với danh sách câu hỏi đầu vào, câu hỏi lỗi có result là None
+    results: list[Optional[QueryOutput]]
+    errors: list[Optional[str]]
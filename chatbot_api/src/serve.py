@@ -0,0 +1,168 @@
+"""Pre-fork server for production.
+
+The master process imports the app, loads the models and read-only indexes,
+freezes the garbage collector and only then forks the uvicorn workers. The
+workers share those memory pages copy-on-write instead of loading their own
+copies. The master never runs a forward pass: torch's OpenMP thread pool
+must not exist at fork time, so the torch thread count is set before the
+models load and the query router encodes its prototypes in each worker. Everything that holds a connection (Neo4j driver, Groq HTTP pools,
+SQLite) is opened lazily, so each worker gets its own after the fork.
+Prometheus counters and histograms are written to PROMETHEUS_MULTIPROC_DIR
+and summed over the workers on every scrape; the gauges built from the
+``stats()`` sources describe the answering worker and carry its pid.
+
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import gc
+import glob
+import importlib
+import os
+import random
+import signal
+import socket
+import tempfile
+import time
+
+import uvicorn
+
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "2"))
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+
+
+def preload(app_path: str):
+    """Import the app and load everything read-only that the workers can share."""
+    from utils.startup_report import record_phase
+
+    module_name, _, attribute = app_path.partition(":")
+    with record_phase("preload:import"):
+        app = getattr(importlib.import_module(module_name), attribute or "app")
+
+    from chains.legal_index import get_legal_index
+    from chains.only_cypher_chain import schema_snapshot
+    from chains.only_vector_chain import (
+        LEXICAL_FUSION, VECTOR_RETRIEVER, get_chunked_embedder, get_lexical_index, get_local_retriever,
+    )
+    from chains.reranker import RERANK_ENABLED, get_reranker
+
+    with record_phase("preload:models"):
+        get_chunked_embedder()
+        if RERANK_ENABLED:
+            get_reranker()
+    with record_phase("preload:indexes"):
+        if VECTOR_RETRIEVER == "local":
+            get_local_retriever()
+        if LEXICAL_FUSION:
+            get_lexical_index()
+        get_legal_index()
+        # Chỉ đọc snapshot trên đĩa, không kết nối Neo4j trước khi fork
+        schema_snapshot.load()
+    return app
+
+
+def set_torch_threads(threads: int):
+    """Set torch's intra-op thread count; must run before any forward pass starts its thread pool."""
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+def run_worker(app, sock: socket.socket):
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    random.seed()
+    from agents.query_router import QUERY_ROUTER_ENABLED, get_query_router
+
+    if QUERY_ROUTER_ENABLED:
+        # Encode prototype là một forward pass: chạy ở worker sau fork, không ở master
+        get_query_router()
+    server = uvicorn.Server(uvicorn.Config(app, lifespan="on", log_level=os.getenv("LOG_LEVEL", "info")))
+    server.run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers sharing preloaded models")
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--threads", type=int, default=0, help="torch threads per worker, 0 = cores / workers")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Cache câu trả lời và Cypher phải dùng chung giữa các worker
+        os.environ.setdefault("CACHE_BACKEND", "sqlite")
+        # /metrics do worker nào nhận scrape trả về: counter và histogram phải cộng gộp từ mọi worker
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="rag-metrics-"))
+        os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+        for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+            os.remove(path)
+    # Mỗi worker có hàng đợi rate limit riêng nên chia đều giới hạn của Groq
+    os.environ.setdefault("LLM_RATE_LIMIT_WORKERS", str(args.workers))
+    # Chia số core cho các worker thay vì mỗi worker dùng hết; worker thừa hưởng giá trị này qua fork
+    set_torch_threads(args.threads or max(1, (os.cpu_count() or 1) // args.workers))
+    app = preload(args.app)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Đưa mọi object đã nạp vào thế hệ permanent để GC ở worker không ghi vào các trang dùng chung
+    gc.collect()
+    gc.freeze()
+
+    workers = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app, sock)
+            finally:
+                os._exit(0)
+        workers[pid] = time.monotonic()
+        print(f"[serve] worker {pid} started", flush=True)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"[serve] master {os.getpid()} listening on {args.host}:{args.port}", flush=True)
+    for _ in range(args.workers):
+        spawn()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started_at = workers.pop(pid, None)
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            from prometheus_client import multiprocess
+
+            multiprocess.mark_process_dead(pid)
+        if started_at is None or stopping:
+            continue
+        print(f"[serve] worker {pid} exited with status {status}, restarting", flush=True)
+        # Tránh vòng lặp khởi động lại liên tục khi worker chết ngay lúc khởi động
+        if time.monotonic() - started_at < 1:
+            time.sleep(1)
+        spawn()
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
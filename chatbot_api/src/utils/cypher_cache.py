@@ -0,0 +1,122 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    question = unicodedata.normalize("NFC", question).lower()
+    question = re.sub(r"\s+", " ", question)
+    return question.strip(" ?.!,;:\"'")
+
+
+def schema_fingerprint(schema: str) -> str:
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()[:16]
+
+
+class CypherCache:
+    """Cache of Cypher statements that ran successfully and returned rows.
+
+    Entries are keyed by the normalized question and, when embeddings are
+    given, can also be matched to the nearest cached question above
+    ``threshold``. The last ``max_size`` statements that failed or returned
+    nothing are remembered so they are never served, and every entry is
+    dropped when the schema fingerprint changes.
+    """
+
+    def __init__(self, max_size: int = 5000, threshold: float = 0.97):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.fingerprint: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        # normalized question -> (cypher, embedding or None)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Câu Cypher lỗi gần đây nhất, cũ nhất trước
+        self._bad_statements: "OrderedDict[str, None]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: list = []
+
+    def lookup(self, question: str, fingerprint: str, embedding: Optional[np.ndarray] = None) -> Optional[str]:
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            key = normalize_question(question)
+            entry = self._entries.get(key)
+            if entry is None and embedding is not None:
+                key = self._nearest(embedding)
+                entry = self._entries.get(key) if key else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def record_success(self, question: str, cypher: str, fingerprint: str, embedding: Optional[np.ndarray] = None):
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            if cypher in self._bad_statements:
+                return
+            key = normalize_question(question)
+            self._entries[key] = (cypher, embedding)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def record_failure(self, question: str, cypher: str, fingerprint: str):
+        """Remember a statement that raised or returned no rows so it is not reused."""
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            self.rejected += 1
+            self._bad_statements[cypher] = None
+            self._bad_statements.move_to_end(cypher)
+            if len(self._bad_statements) > self.max_size:
+                self._bad_statements.popitem(last=False)
+            # Với kết quả semantic, câu Cypher lỗi nằm ở câu hỏi lân cận chứ không ở ``question``
+            stale = [key for key, (statement, _) in self._entries.items() if statement == cypher]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._matrix = None
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._bad_statements.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "rejected": self.rejected,
+                "schema_fingerprint": self.fingerprint,
+            }
+
+    def _check_fingerprint(self, fingerprint: str):
+        if fingerprint != self.fingerprint:
+            self._entries.clear()
+            self._bad_statements.clear()
+            self._matrix = None
+            self.fingerprint = fingerprint
+
+    def _nearest(self, embedding: np.ndarray) -> Optional[str]:
+        if self._matrix is None:
+            self._matrix_keys = [key for key, (_, e) in self._entries.items() if e is not None]
+            if not self._matrix_keys:
+                return None
+            self._matrix = np.stack([self._entries[key][1] for key in self._matrix_keys])
+        scores = self._matrix @ embedding
+        best = int(np.argmax(scores))
+        return self._matrix_keys[best] if scores[best] >= self.threshold else None
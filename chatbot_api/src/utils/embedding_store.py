@@ -0,0 +1,160 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+KEY_SIZE = 16
+
+
+class EmbeddingStore:
+    """Append-only on-disk store of chunk embeddings.
+
+    Vectors live in a raw float32 file that is memory-mapped for reading and
+    keys are 16-byte hashes appended to a separate file in the same order, so
+    the position of a key is its row in the matrix. Writers take an exclusive
+    file lock and append the vectors before the keys, which lets readers in
+    other uvicorn workers pick up new rows without locking.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._keys_path = os.path.join(path, "keys.bin")
+        self._meta_path = os.path.join(path, "meta.json")
+        self._lock_path = os.path.join(path, "store.lock")
+
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._index: Dict[bytes, int] = {}
+        self._keys_read = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._thread_lock = threading.Lock()
+        self._refresh()
+
+    @staticmethod
+    def make_key(model_name: str, text: str, normalize: bool) -> bytes:
+        payload = f"{model_name}\0{int(normalize)}\0{text}".encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=KEY_SIZE).digest()
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        """Return a read-only view of the stored vector, without copying."""
+        with self._thread_lock:
+            row = self._index.get(key)
+            if row is None:
+                self._refresh()
+                row = self._index.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._row(row)
+
+    def get_many(self, keys: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (found mask, matrix of the found vectors in key order)."""
+        with self._thread_lock:
+            self._refresh()
+            rows = np.array([self._index.get(key, -1) for key in keys], dtype=np.int64)
+            found = rows >= 0
+            self.hits += int(found.sum())
+            self.misses += int((~found).sum())
+            if not found.any():
+                return found, np.empty((0, self.dim or 0), dtype=np.float32)
+            if int(rows.max()) >= len(self._matrix):
+                self._map_vectors()
+            return found, self._matrix[rows[found]]
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._thread_lock, open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    with open(self._meta_path, "w") as f:
+                        json.dump({"dim": self.dim}, f)
+
+                new_ids, new_keys, seen = [], [], set()
+                for i, key in enumerate(keys):
+                    if key not in self._index and key not in seen:
+                        new_ids.append(i)
+                        new_keys.append(key)
+                        seen.add(key)
+                if not new_keys:
+                    return
+
+                self._truncate_to_committed()
+
+                # Ghi vector trước rồi mới ghi key để worker khác không đọc phải dòng chưa có dữ liệu
+                with open(self._vectors_path, "ab") as f:
+                    f.write(vectors[new_ids].tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self._keys_path, "ab") as f:
+                    f.write(b"".join(new_keys))
+                    f.flush()
+                self._refresh()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _truncate_to_committed(self):
+        """Drop what an interrupted writer left after the last complete key.
+
+        A crash between the two appends leaves vectors without keys, and a
+        torn key write leaves a partial key; either would shift the rows of
+        every key appended afterwards. Called with the file lock held.
+        """
+        rows = self._keys_read // KEY_SIZE
+        for path, size in ((self._keys_path, rows * KEY_SIZE), (self._vectors_path, rows * 4 * self.dim)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._index),
+            "dim": self.dim,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _refresh(self):
+        """Read keys appended by this or other processes since the last refresh."""
+        if self.dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        if not os.path.exists(self._keys_path):
+            return
+
+        size = os.path.getsize(self._keys_path)
+        size -= size % KEY_SIZE
+        if size <= self._keys_read:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._keys_read)
+            data = f.read(size - self._keys_read)
+        row = self._keys_read // KEY_SIZE
+        for offset in range(0, len(data), KEY_SIZE):
+            self._index.setdefault(data[offset:offset + KEY_SIZE], row)
+            row += 1
+        self._keys_read = size
+        self._map_vectors()
+
+    def _map_vectors(self):
+        rows = os.path.getsize(self._vectors_path) // (4 * self.dim)
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def _row(self, row: int) -> np.ndarray:
+        if row >= len(self._matrix):
+            self._map_vectors()
+        return self._matrix[row]
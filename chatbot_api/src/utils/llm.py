@@ -0,0 +1,107 @@
+import os
+from typing import Any, AsyncIterator, List, Optional
+
+import httpx
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_groq import ChatGroq
+
+from utils import metrics, resilience
+from utils.llm_cache import get_llm_cache
+from utils.rate_limiter import estimate_request_tokens, rate_limiter
+
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "100"))
+
+_http_client = None
+_http_async_client = None
+
+
+def _get_http_clients():
+    global _http_client, _http_async_client
+    if _http_client is None:
+        limits = httpx.Limits(max_connections=GROQ_MAX_CONNECTIONS, max_keepalive_connections=GROQ_MAX_CONNECTIONS)
+        _http_client = httpx.Client(limits=limits)
+        _http_async_client = httpx.AsyncClient(limits=limits)
+    return _http_client, _http_async_client
+
+
+class ResilientChatGroq(ChatGroq):
+    """ChatGroq whose calls go through the "groq" stage of ``utils.resilience``.
+
+    Streaming calls are retried only until the first chunk arrives; a stream
+    that breaks after tokens were emitted is not replayed. A call first waits
+    for the model's budget in ``utils.rate_limiter``, outside the stage, so
+    the time spent queued never counts as a Groq failure; its retries reuse
+    that slot.
+    """
+
+    def _request_tokens(self, messages: List[BaseMessage], kwargs: dict) -> int:
+        return estimate_request_tokens(messages, kwargs.get("max_tokens") or self.max_tokens)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        return rate_limiter.run_sync(
+            self.model_name, self._request_tokens(messages, kwargs), resilience.call_sync, "groq",
+            rate_limiter.attempt_sync, self.model_name, super()._generate,
+            messages, stop=stop, run_manager=run_manager, **kwargs
+        )
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        return await rate_limiter.arun(
+            self.model_name, self._request_tokens(messages, kwargs), resilience.call, "groq",
+            rate_limiter.aattempt, self.model_name, super()._agenerate,
+            messages, stop=stop, run_manager=run_manager, **kwargs
+        )
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        parent_astream = super()._astream
+
+        async def open_stream():
+            stream = parent_astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+
+        tokens = self._request_tokens(messages, kwargs)
+        stream, first_chunk = await rate_limiter.arun(
+            self.model_name, tokens, resilience.call, "groq", rate_limiter.aattempt, self.model_name, open_stream
+        )
+        if first_chunk is None:
+            return
+        usage = first_chunk.message.usage_metadata
+        yield first_chunk
+        async for chunk in stream:
+            # Groq gửi usage trong chunk cuối
+            usage = chunk.message.usage_metadata or usage
+            yield chunk
+        rate_limiter.settle(self.model_name, tokens, usage["total_tokens"] if usage else None)
+
+
+def get_chat_model(model: str, **kwargs) -> ChatGroq:
+    """Create a ChatGroq that shares the process-wide pooled HTTP clients and LLM response cache."""
+    http_client, http_async_client = _get_http_clients()
+    kwargs.setdefault("temperature", 0)
+    # Thử lại do utils.resilience đảm nhận, không để client Groq tự thử lại thêm
+    kwargs["max_retries"] = 0
+    kwargs.setdefault("callbacks", metrics.llm_callbacks(str(model)))
+    if not kwargs["temperature"]:
+        # Chỉ cache khi model trả lời tất định; False thay vì None để không rơi về cache toàn cục của LangChain
+        kwargs.setdefault("cache", get_llm_cache() or False)
+    return ResilientChatGroq(
+        model=model,
+        api_key=os.getenv("GROQ_API_KEY"),
+        http_client=http_client,
+        http_async_client=http_async_client,
+        **kwargs,
+    )
+
+
+async def close_http_clients():
+    global _http_client, _http_async_client
+    if _http_client is not None:
+        _http_client.close()
+        await _http_async_client.aclose()
+        _http_client = _http_async_client = None
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from utils.model_registry import get_or_load
+from utils.shared_cache import SQLiteStore
+
+# Cache câu trả lời của LLM theo đúng prompt, dùng chung cho mọi chain gọi Groq và mọi worker
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_MAX_SIZE = int(os.getenv("LLM_CACHE_MAX_SIZE", "20000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "604800"))
+
+# Đánh dấu generation lấy từ cache để utils.metrics không tính token và độ trễ của nó như một lời gọi thật
+CACHE_HIT_KEY = "llm_cache_hit"
+
+
+def model_name(llm_string: str) -> str:
+    """Model name in the ``llm_string`` LangChain builds from a serializable chat model."""
+    try:
+        serialized = json.loads(llm_string.split("---", 1)[0])
+        kwargs = serialized.get("kwargs", {})
+        return str(kwargs.get("model_name") or kwargs.get("model") or serialized["id"][-1])
+    except (ValueError, KeyError, IndexError, AttributeError):
+        return "unknown"
+
+
+def _dump_generation(generation: Generation) -> dict:
+    if isinstance(generation, ChatGeneration):
+        return {"message": message_to_dict(generation.message), "generation_info": generation.generation_info}
+    return {"text": generation.text, "generation_info": generation.generation_info}
+
+
+def _load_generation(data: dict) -> Generation:
+    if "message" in data:
+        message = messages_from_dict([data["message"]])[0]
+        message.response_metadata = {**message.response_metadata, CACHE_HIT_KEY: True}
+        return ChatGeneration(message=message, generation_info=data["generation_info"])
+    return Generation(text=data["text"], generation_info=data["generation_info"])
+
+
+def _usage_tokens(generations: Sequence[Generation]) -> int:
+    tokens = 0
+    for generation in generations:
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+        tokens += usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+    return tokens
+
+
+class LLMResponseCache(BaseCache):
+    """Exact-prompt LangChain cache stored in SQLite.
+
+    The key is a hash of the ``llm_string`` (model and every call parameter,
+    including bound tools and stop words) and the serialized messages, so a
+    hit returns what the same model answered to exactly the same request.
+    Entries expire after ``ttl`` seconds and the least recently used ones are
+    dropped beyond ``max_size``. LangChain only consults the cache for
+    ``invoke``/``generate``; token streams always go to the model.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS llm_responses (
+        key TEXT PRIMARY KEY, model TEXT, generations TEXT, tokens INTEGER,
+        created_at REAL, last_used REAL
+    );
+    CREATE INDEX IF NOT EXISTS llm_responses_last_used ON llm_responses(last_used);
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_size: int = LLM_CACHE_MAX_SIZE, ttl: float = LLM_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db = SQLiteStore(path, self.SCHEMA)
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self.key(prompt, llm_string)
+        rows = self.db.query("SELECT generations, tokens, created_at FROM llm_responses WHERE key = ?", (key,))
+        model = model_name(llm_string)
+        if not rows or rows[0][2] < time.time() - self.ttl:
+            self._count(model, misses=1)
+            return None
+        self.db.write(("UPDATE llm_responses SET last_used = ? WHERE key = ?", (time.time(), key)))
+        self._count(model, hits=1, saved_tokens=rows[0][1])
+        return [_load_generation(data) for data in json.loads(rows[0][0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        now = time.time()
+        model = model_name(llm_string)
+        self.db.write(
+            ("INSERT OR REPLACE INTO llm_responses (key, model, generations, tokens, created_at, last_used) "
+             "VALUES (?, ?, ?, ?, ?, ?)",
+             (self.key(prompt, llm_string), model,
+              json.dumps([_dump_generation(generation) for generation in return_val], ensure_ascii=False),
+              _usage_tokens(return_val), now, now)),
+            ("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl,)),
+            ("DELETE FROM llm_responses WHERE key IN (SELECT key FROM llm_responses ORDER BY last_used "
+             "LIMIT max(0, (SELECT count(*) FROM llm_responses) - ?))", (self.max_size,)),
+        )
+        self._count(model, stores=1)
+
+    def clear(self, **kwargs) -> None:
+        self.db.write(("DELETE FROM llm_responses", ()))
+
+    def stats(self) -> dict:
+        """Hits, misses and tokens not sent to the API, per model, for this process."""
+        sizes = dict(self.db.query("SELECT model, count(*) FROM llm_responses GROUP BY model"))
+        with self._lock:
+            models = {}
+            for model in set(self._stats) | set(sizes):
+                counts = self._stats.get(model, {"hits": 0, "misses": 0, "stores": 0, "saved_tokens": 0})
+                total = counts["hits"] + counts["misses"]
+                models[model] = {**counts, "hit_rate": counts["hits"] / total if total else 0.0,
+                                 "size": sizes.get(model, 0)}
+        return {"backend": "sqlite", "pid": os.getpid(), "size": sum(sizes.values()),
+                "max_size": self.max_size, "models": models}
+
+    def _count(self, model: str, **increments: int):
+        with self._lock:
+            counts = self._stats.setdefault(model, {"hits": 0, "misses": 0, "stores": 0, "saved_tokens": 0})
+            for name, value in increments.items():
+                counts[name] += value
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Process-wide cache for ``utils.llm.get_chat_model``, None when disabled."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    return get_or_load("llm_cache", LLMResponseCache)
@@ -0,0 +1,189 @@
+import os
+import re
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# serve.py đặt biến này khi chạy nhiều worker: counter và histogram được ghi ra file, cộng gộp khi scrape
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Bảng thời gian theo stage của request hiện tại, chỉ có khi client yêu cầu include_timings
+_breakdown: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_breakdown", default=None)
+_stats_sources: Dict[str, Callable[[], Optional[dict]]] = {}
+
+if METRICS_ENABLED:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    )
+    from prometheus_client.core import GaugeMetricFamily
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each pipeline stage", ["stage"],
+                              buckets=LATENCY_BUCKETS)
+    STAGE_ERRORS = Counter("rag_stage_errors", "Stages that ended with an exception", ["stage"])
+    LLM_SECONDS = Histogram("rag_llm_seconds", "Chat model call latency", ["model"], buckets=LATENCY_BUCKETS)
+    LLM_TOKENS = Counter("rag_llm_tokens", "Chat model tokens", ["model", "kind"])
+    LLM_QUEUE_SECONDS = Histogram("rag_llm_queue_seconds", "Time chat model calls waited in the rate limiter queue",
+                                  ["model", "priority"], buckets=LATENCY_BUCKETS)
+
+
+class _StageTimer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.labels(self.name).observe(elapsed)
+        if exc_type is not None:
+            STAGE_ERRORS.labels(self.name).inc()
+        _add_to_breakdown(self.name, elapsed)
+        return False
+
+
+_NOOP = nullcontext()
+
+
+def stage(name: str):
+    """Time the enclosed block as ``name``; a shared no-op when metrics are disabled."""
+    return _StageTimer(name) if METRICS_ENABLED else _NOOP
+
+
+def _add_to_breakdown(key: str, value: float):
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown[key] = breakdown.get(key, 0.0) + value
+
+
+@contextmanager
+def collect_breakdown() -> Iterator[Dict[str, float]]:
+    """Collect per-stage seconds and token counts of the enclosed request into a dict."""
+    breakdown: Dict[str, float] = {}
+    token = _breakdown.set(breakdown)
+    try:
+        yield breakdown
+    finally:
+        _breakdown.reset(token)
+
+
+def _token_usage(response: LLMResult) -> Tuple[int, int]:
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+def _is_cache_hit(response: LLMResult) -> bool:
+    return any(
+        getattr(getattr(generation, "message", None), "response_metadata", {}).get("llm_cache_hit")
+        for generations in response.generations for generation in generations
+    )
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Record latency and prompt/completion tokens of every call of one chat model."""
+
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+        self._starts: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs: Any):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        start = self._starts.pop(run_id, None)
+        if _is_cache_hit(response):
+            # Trả lời từ utils.llm_cache: không tốn token, không phải độ trễ của model
+            _add_to_breakdown(f"llm_cache_hits:{self.model}", 1)
+            return
+        if start is not None:
+            elapsed = time.perf_counter() - start
+            LLM_SECONDS.labels(self.model).observe(elapsed)
+            _add_to_breakdown(f"llm:{self.model}", elapsed)
+        prompt_tokens, completion_tokens = _token_usage(response)
+        LLM_TOKENS.labels(self.model, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(self.model, "completion").inc(completion_tokens)
+        _add_to_breakdown("prompt_tokens", prompt_tokens)
+        _add_to_breakdown("completion_tokens", completion_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._starts.pop(run_id, None)
+
+
+def llm_callbacks(model: str) -> list:
+    return [LLMMetricsHandler(model)] if METRICS_ENABLED else []
+
+
+def observe_queue_wait(model: str, priority: str, seconds: float):
+    """Record the time a call to ``model`` spent queued in ``utils.rate_limiter``."""
+    if METRICS_ENABLED:
+        LLM_QUEUE_SECONDS.labels(model, priority).observe(seconds)
+    _add_to_breakdown(f"queue:{model}", seconds)
+
+
+def register_stats(name: str, fn: Callable[[], Optional[dict]]):
+    """Expose the numeric values of ``fn()`` (e.g. a cache's ``stats()``) as gauges at scrape time."""
+    _stats_sources[name] = fn
+
+
+def _flatten(stats: dict, prefix: str) -> Iterator[Tuple[str, float]]:
+    for key, value in stats.items():
+        # Tên model như "llama-3.3-70b-versatile" không hợp lệ trong tên metric Prometheus
+        name = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_:]', '_', str(key))}"
+        if isinstance(value, dict):
+            yield from _flatten(value, name)
+        elif isinstance(value, (int, float)):
+            yield name, float(value)
+
+
+class _StatsCollector:
+    """Gauges read from the registered ``stats()`` sources of this process.
+
+    With several workers they describe only the worker that answered the
+    scrape, so they carry its ``pid`` as a label.
+    """
+
+    def collect(self):
+        for source, fn in list(_stats_sources.items()):
+            stats = fn()
+            if not stats:
+                continue
+            for name, value in _flatten(stats, f"rag_{source}"):
+                if MULTIPROCESS:
+                    gauge = GaugeMetricFamily(name, f"{source} statistic", labels=["pid"])
+                    gauge.add_metric([str(os.getpid())], value)
+                    yield gauge
+                else:
+                    yield GaugeMetricFamily(name, f"{source} statistic", value=value)
+
+
+if METRICS_ENABLED and not MULTIPROCESS:
+    REGISTRY.register(_StatsCollector())
+
+
+def render() -> Tuple[bytes, str]:
+    """Prometheus exposition of all metrics and its content type."""
+    if not METRICS_ENABLED:
+        return b"", "text/plain; charset=utf-8"
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_StatsCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,74 @@
+import os
+import threading
+from typing import Any, Callable, Dict
+
+from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+from utils.startup_report import record_phase
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "NghiemAbe/Vi-Legal-Bi-Encoder-v2")
+# torch | onnx | onnx-int8, chỉ áp dụng cho embed_query
+EMBEDDING_QUERY_BACKEND = os.getenv("EMBEDDING_QUERY_BACKEND", "torch")
+ONNX_EXPORT_DIR = os.getenv("ONNX_EXPORT_DIR", "onnx_models/vi-legal-bi-encoder")
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx2")
+
+_models: Dict[str, Any] = {}
+_lock = threading.RLock()
+
+
+def get_or_load(name: str, loader: Callable[[], Any]) -> Any:
+    """Return the process-wide instance registered under ``name``, loading it once."""
+    if name in _models:
+        return _models[name]
+    with _lock:
+        if name not in _models:
+            with record_phase(f"load:{name}"):
+                _models[name] = loader()
+        return _models[name]
+
+
+def is_loaded(name: str) -> bool:
+    return name in _models
+
+
+def get_embedder(backend: str = "torch") -> HuggingFaceEmbeddings:
+    return get_or_load(f"embedder:{backend}", lambda: _load_embedder(backend))
+
+
+def get_query_embedder() -> HuggingFaceEmbeddings:
+    return get_embedder(EMBEDDING_QUERY_BACKEND)
+
+
+def _load_embedder(backend: str) -> HuggingFaceEmbeddings:
+    encode_kwargs = {'normalize_embeddings': True}
+    if backend == "torch":
+        return HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs=encode_kwargs,
+        )
+    if backend == "onnx":
+        return HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL,
+            model_kwargs={'device': 'cpu', 'backend': 'onnx'},
+            encode_kwargs=encode_kwargs,
+        )
+    if backend == "onnx-int8":
+        file_name = f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx"
+        if not os.path.exists(os.path.join(ONNX_EXPORT_DIR, file_name)):
+            _export_quantized_model()
+        return HuggingFaceEmbeddings(
+            model_name=ONNX_EXPORT_DIR,
+            model_kwargs={'device': 'cpu', 'backend': 'onnx', 'model_kwargs': {'file_name': file_name}},
+            encode_kwargs=encode_kwargs,
+        )
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def _export_quantized_model():
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    onnx_model = get_embedder("onnx")._client
+    onnx_model.save_pretrained(ONNX_EXPORT_DIR)
+    export_dynamic_quantized_onnx_model(onnx_model, ONNX_QUANTIZATION, ONNX_EXPORT_DIR)
+
@@ -0,0 +1,43 @@
+import os
+
+from neo4j import AsyncDriver, AsyncGraphDatabase, RoutingControl
+
+from utils import resilience
+
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+
+_driver = None
+
+
+def get_async_driver() -> AsyncDriver:
+    """Return the shared async Neo4j driver, created on first use."""
+    global _driver
+    if _driver is None:
+        _driver = AsyncGraphDatabase.driver(
+            os.getenv("NEO4J_URI"),
+            auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+            max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+            # Thử lại do utils.resilience đảm nhận trong deadline của request
+            max_transaction_retry_time=0,
+        )
+    return _driver
+
+
+async def init_driver():
+    # Pool chỉ mở kết nối khi có truy vấn đầu tiên, khởi động không cần chờ Neo4j
+    get_async_driver()
+
+
+async def close_driver():
+    global _driver
+    if _driver is not None:
+        await _driver.close()
+        _driver = None
+
+
+async def read_query(query: str, params: dict = None) -> list:
+    """Run a read-only Cypher query on the pool and return the rows as dicts."""
+    records, _, _ = await resilience.call(
+        "neo4j", get_async_driver().execute_query, query, params or {}, routing_=RoutingControl.READ
+    )
+    return [record.data() for record in records]
@@ -0,0 +1,421 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils import metrics
+from utils.resilience import remaining
+from utils.token_count import estimate_tokens
+
+LLM_RATE_LIMIT_ENABLED = os.getenv("LLM_RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Giới hạn riêng cho từng model dạng "model:rpm:tpm", ví dụ "llama-3.3-70b-versatile:28:5700,gemma2-9b-it:28:14000";
+# nên đặt thấp hơn giới hạn của API vài phần trăm vì lời gọi đến API muộn hơn một chút so với lúc được cấp slot
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+# Giới hạn cho model không có trong LLM_RATE_LIMITS; 0 = không giới hạn chiều đó. Mặc định không giới hạn để
+# key trả phí không bị xếp hàng; với gói miễn phí của Groq đặt LLM_DEFAULT_RPM=30 và LLM_DEFAULT_TPM=6000
+# (hoặc theo từng model trong LLM_RATE_LIMITS). Khi không giới hạn, 429 của API vẫn tạm dừng model theo Retry-After
+LLM_DEFAULT_RPM = float(os.getenv("LLM_DEFAULT_RPM", "0"))
+LLM_DEFAULT_TPM = float(os.getenv("LLM_DEFAULT_TPM", "0"))
+# Giới hạn của Groq tính theo API key: serve.py đặt số worker để mỗi worker chỉ dùng phần của mình
+LLM_RATE_LIMIT_WORKERS = max(1, int(os.getenv("LLM_RATE_LIMIT_WORKERS", "1")))
+# Số token trả lời giữ chỗ trước khi biết usage thật, khi lời gọi không đặt max_tokens
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "512"))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = {INTERACTIVE: 0, BATCH: 1}
+
+_priority: ContextVar[str] = ContextVar("llm_priority", default=INTERACTIVE)
+
+
+class RateLimitExceeded(Exception):
+    """The rate limiter queue would hold the call past the request deadline.
+
+    Deliberately not a ``StageUnavailableError``: the agent tools and the
+    query router answer those by falling back to other LLM calls, which is
+    the opposite of shedding load when the budget is exhausted.
+    """
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"groq: {model}: rate limit queue wait {retry_after:.1f}s exceeds the request deadline")
+        self.model = model
+        self.retry_after = retry_after
+
+
+@contextmanager
+def priority(name: str):
+    """Run the LLM calls made inside the block (and tasks started there) at ``name`` priority."""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority {name!r}, expected one of {list(PRIORITIES)}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def parse_limits(spec: str = LLM_RATE_LIMITS) -> Dict[str, Tuple[float, float]]:
+    limits = {}
+    for item in spec.split(","):
+        parts = item.strip().rsplit(":", 2)
+        if len(parts) == 3 and parts[0]:
+            limits[parts[0]] = (float(parts[1]), float(parts[2]))
+    return limits
+
+
+def estimate_request_tokens(messages: list, max_tokens: Optional[int] = None) -> int:
+    """Prompt tokens of ``messages`` plus the completion tokens the call may use."""
+    prompt = sum(estimate_tokens(str(getattr(message, "content", message))) for message in messages)
+    return prompt + (max_tokens or LLM_EXPECTED_COMPLETION_TOKENS)
+
+
+class TokenBucket:
+    """Budget of ``per_minute`` units refilled continuously; ``per_minute <= 0`` means unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def refill(self, now: float):
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` units are available, assuming nobody else takes any."""
+        if self.unlimited or self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self.level -= amount
+
+    def give_back(self, amount: float):
+        # amount âm khi usage thật lớn hơn phần đã giữ chỗ: bucket nợ lại cho các lời gọi sau
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "granted", "wake")
+
+    def __init__(self, priority: int, seq: int, tokens: int):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.granted = False
+        self.wake: Callable[[], None] = lambda: None
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ModelScheduler:
+    """Requests-per-minute and tokens-per-minute budgets of one model, with a priority queue.
+
+    Calls are granted strictly in (priority, arrival) order: a call waits
+    until the buckets can pay for it and for everything queued before it.
+    That wait is known on arrival, so a call that could not start before
+    the request deadline is rejected at once instead of queueing. A 429
+    from the API pauses the model for its Retry-After instead of letting
+    the retries hit the API again.
+    """
+
+    def __init__(self, model: str, rpm: float = LLM_DEFAULT_RPM, tpm: float = LLM_DEFAULT_TPM):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self.queue: List[_Waiter] = []
+        self.admitted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.max_depth = 0
+        self.wait_seconds = 0.0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _wait_for(self, requests: int, tokens: int, now: float) -> float:
+        return max(self.blocked_until - now, self.requests.wait_time(requests), self.tokens.wait_time(tokens))
+
+    def reservation(self, tokens: int) -> int:
+        """Tokens actually held for a call estimated at ``tokens``."""
+        # Lời gọi lớn hơn cả bucket vẫn chạy được khi bucket đầy
+        return tokens if self.tokens.unlimited else min(tokens, int(self.tokens.capacity))
+
+    def _enqueue(self, tokens: int, priority_name: str) -> _Waiter:
+        now = time.monotonic()
+        with self._lock:
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            waiter = _Waiter(PRIORITIES[priority_name], next(self._seq), self.reservation(tokens))
+            ahead = [other for other in self.queue if other < waiter]
+            expected_wait = self._wait_for(len(ahead) + 1, sum(other.tokens for other in ahead) + waiter.tokens, now)
+            time_left = remaining()
+            if time_left is not None and expected_wait > time_left:
+                self.rejected += 1
+                raise RateLimitExceeded(self.model, expected_wait)
+            heapq.heappush(self.queue, waiter)
+            self.max_depth = max(self.max_depth, len(self.queue))
+            return waiter
+
+    def _dispatch(self) -> Optional[float]:
+        """Grant the waiters at the head that fit; seconds until the next head fits, None if none is left."""
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        while self.queue:
+            head = self.queue[0]
+            wait = self._wait_for(1, head.tokens, now)
+            if wait > 0:
+                return wait
+            heapq.heappop(self.queue)
+            self.requests.take(1)
+            self.tokens.take(head.tokens)
+            self.admitted += 1
+            head.granted = True
+            head.wake()
+        return None
+
+    def _abandon(self, waiter: _Waiter):
+        with self._lock:
+            if waiter.granted:
+                # Đã được cấp nhưng không dùng: trả lại cho người kế tiếp
+                self.requests.give_back(1)
+                self.tokens.give_back(waiter.tokens)
+            elif waiter in self.queue:
+                self.queue.remove(waiter)
+                heapq.heapify(self.queue)
+            self._dispatch()
+
+    def _finish_wait(self, started_at: float):
+        waited = time.monotonic() - started_at
+        with self._lock:
+            self.wait_seconds += waited
+        metrics.observe_queue_wait(self.model, _priority.get(), waited)
+
+    async def acquire(self, tokens: int) -> int:
+        """Wait for a slot and ``tokens`` tokens; returns the tokens reserved."""
+        started_at = time.monotonic()
+        waiter = self._enqueue(tokens, _priority.get())
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                woken = loop.create_future()
+                with self._lock:
+                    waiter.wake = lambda: loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+                    next_check = self._dispatch()
+                if waiter.granted:
+                    break
+                time_left = remaining()
+                if time_left is not None and time_left <= 0:
+                    raise RateLimitExceeded(self.model, next_check or 0.0)
+                timeout = next_check if time_left is None else min(next_check or time_left, time_left)
+                await asyncio.wait([woken], timeout=timeout)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        self._finish_wait(started_at)
+        return waiter.tokens
+
+    def acquire_sync(self, tokens: int) -> int:
+        """Blocking counterpart of ``acquire`` for the synchronous chain calls."""
+        started_at = time.monotonic()
+        waiter = self._enqueue(tokens, _priority.get())
+        woken = threading.Event()
+        waiter.wake = woken.set
+        try:
+            while True:
+                with self._lock:
+                    next_check = self._dispatch()
+                if waiter.granted:
+                    break
+                time_left = remaining()
+                if time_left is not None and time_left <= 0:
+                    raise RateLimitExceeded(self.model, next_check or 0.0)
+                woken.wait(next_check if time_left is None else min(next_check or time_left, time_left))
+                woken.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        self._finish_wait(started_at)
+        return waiter.tokens
+
+    def settle(self, reserved: int, used: Optional[int]):
+        """Correct the token bucket with the usage the API reported."""
+        if used is None:
+            return
+        with self._lock:
+            self.tokens.give_back(reserved - used)
+
+    def paused_for(self) -> float:
+        """Seconds left of the pause started by the last 429."""
+        with self._lock:
+            return max(0.0, self.blocked_until - time.monotonic())
+
+    def throttle(self, retry_after: float):
+        """The API answered 429: hold every call to this model for ``retry_after`` seconds."""
+        with self._lock:
+            self.throttled += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            granted = self.admitted
+            return {
+                "queue_depth": len(self.queue),
+                "max_queue_depth": self.max_depth,
+                "admitted": granted,
+                "rejected": self.rejected,
+                "throttled": self.throttled,
+                "avg_wait_seconds": self.wait_seconds / granted if granted else 0.0,
+                "requests_available": self.requests.level if not self.requests.unlimited else -1,
+                "tokens_available": self.tokens.level if not self.tokens.unlimited else -1,
+            }
+
+
+def _retry_after(error: Exception) -> float:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 1.0))
+    except (AttributeError, TypeError, ValueError):
+        return 1.0
+
+
+def _used_tokens(result: Any) -> Optional[int]:
+    usage = (getattr(result, "llm_output", None) or {}).get("token_usage") or {}
+    if usage.get("total_tokens"):
+        return usage["total_tokens"]
+    for generation in getattr(result, "generations", None) or []:
+        usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage_metadata:
+            return usage_metadata.get("total_tokens")
+    return None
+
+
+def _rate_limit_errors() -> tuple:
+    import groq
+
+    return (groq.RateLimitError,)
+
+
+class RateLimiter:
+    """One ``ModelScheduler`` per model, created on first use from LLM_RATE_LIMITS."""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None, enabled: bool = LLM_RATE_LIMIT_ENABLED,
+                 workers: int = LLM_RATE_LIMIT_WORKERS):
+        self.limits = parse_limits() if limits is None else limits
+        self.enabled = enabled
+        self.workers = workers
+        self.schedulers: Dict[str, ModelScheduler] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str) -> ModelScheduler:
+        scheduler = self.schedulers.get(model)
+        if scheduler is None:
+            with self._lock:
+                rpm, tpm = self.limits.get(model, (LLM_DEFAULT_RPM, LLM_DEFAULT_TPM))
+                scheduler = self.schedulers.setdefault(
+                    model, ModelScheduler(model, rpm / self.workers, tpm / self.workers)
+                )
+        return scheduler
+
+    async def arun(self, model: str, tokens: int, fn: Callable[..., Any], /, *args, **kwargs) -> Any:
+        """Await ``fn(*args, **kwargs)`` once the model's budgets allow it.
+
+        The slot covers every retry made inside ``fn``, so the queue wait stays
+        out of the "groq" stage's breaker and retries. The reservation is
+        corrected from the usage in the returned ``ChatResult``; for a stream
+        the caller calls ``settle`` at its end.
+        """
+        if not self.enabled:
+            return await fn(*args, **kwargs)
+        scheduler = self.get(model)
+        reserved = await scheduler.acquire(tokens)
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException:
+            # Lời gọi lỗi (kể cả 429) không dùng phần token đã giữ chỗ
+            scheduler.settle(reserved, 0)
+            raise
+        scheduler.settle(reserved, _used_tokens(result))
+        return result
+
+    def run_sync(self, model: str, tokens: int, fn: Callable[..., Any], /, *args, **kwargs) -> Any:
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        scheduler = self.get(model)
+        reserved = scheduler.acquire_sync(tokens)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            scheduler.settle(reserved, 0)
+            raise
+        scheduler.settle(reserved, _used_tokens(result))
+        return result
+
+    @staticmethod
+    def _pause_before_attempt(scheduler: ModelScheduler) -> float:
+        delay = scheduler.paused_for()
+        time_left = remaining()
+        if delay and time_left is not None and delay > time_left:
+            raise RateLimitExceeded(scheduler.model, delay)
+        return delay
+
+    async def aattempt(self, model: str, fn: Callable[..., Any], /, *args, **kwargs) -> Any:
+        """Await one API attempt of a call admitted by ``arun``.
+
+        Retries do not queue again: an attempt only waits out a pause of the
+        model, and a 429 from the API starts one for every caller.
+        """
+        if not self.enabled:
+            return await fn(*args, **kwargs)
+        scheduler = self.get(model)
+        delay = self._pause_before_attempt(scheduler)
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            return await fn(*args, **kwargs)
+        except _rate_limit_errors() as e:
+            scheduler.throttle(_retry_after(e))
+            raise
+
+    def attempt_sync(self, model: str, fn: Callable[..., Any], /, *args, **kwargs) -> Any:
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        scheduler = self.get(model)
+        delay = self._pause_before_attempt(scheduler)
+        if delay:
+            time.sleep(delay)
+        try:
+            return fn(*args, **kwargs)
+        except _rate_limit_errors() as e:
+            scheduler.throttle(_retry_after(e))
+            raise
+
+    def settle(self, model: str, tokens: int, used: Optional[int]):
+        """Correct the reservation of a call estimated at ``tokens`` once its usage is known."""
+        if self.enabled:
+            scheduler = self.get(model)
+            scheduler.settle(scheduler.reservation(tokens), used)
+
+    def stats(self) -> dict:
+        return {model: scheduler.stats() for model, scheduler in list(self.schedulers.items())}
+
+
+rate_limiter = RateLimiter()
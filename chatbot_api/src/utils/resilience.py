@@ -0,0 +1,234 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+import httpx
+
+from utils import metrics
+
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "60"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Thời điểm (time.monotonic) mà request hiện tại phải xong, truyền xuống mọi stage
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request deadline passed before a stage could finish."""
+
+
+class StageUnavailableError(Exception):
+    """A stage failed after its retries or its circuit breaker is open."""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(f"{stage}: {message}")
+        self.stage = stage
+
+
+class CircuitOpenError(StageUnavailableError):
+    pass
+
+
+@contextmanager
+def deadline(seconds: float = REQUEST_DEADLINE):
+    """Set the deadline for everything run inside the block, keeping an earlier one."""
+    current = _deadline.get()
+    token = _deadline.set(min(time.monotonic() + seconds, current or float("inf")))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None when there is none."""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive failures.
+
+    While open every call fails fast. After ``reset_timeout`` seconds one
+    trial call is let through (half-open); its outcome closes or reopens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "closed" or (self.state == "half_open" and not self._trial_running):
+                self._trial_running = self.state == "half_open"
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """End the half-open trial without an outcome, e.g. when the call was cancelled."""
+        with self._lock:
+            self._trial_running = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, retrying only ``retry_on`` errors."""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.2, max_delay: float = 5.0,
+                 retry_on: Tuple[Type[BaseException], ...] = ()):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def _groq_errors() -> tuple:
+    import groq
+
+    return (groq.APIConnectionError, groq.APITimeoutError, groq.RateLimitError, groq.InternalServerError)
+
+
+def _neo4j_errors() -> tuple:
+    from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+    return (ServiceUnavailable, SessionExpired, TransientError)
+
+
+class Stage:
+    def __init__(self, name: str, policy: RetryPolicy):
+        self.name = name
+        self.policy = policy
+        self.breaker = CircuitBreaker(name)
+
+
+def _max_attempts(stage: str, default: int) -> int:
+    return int(os.getenv(f"{stage.upper()}_MAX_ATTEMPTS", str(default)))
+
+
+stages: Dict[str, Stage] = {
+    # Embedding chạy cục bộ trên CPU nên không thử lại, chỉ áp deadline và circuit breaker
+    "embedding": Stage("embedding", RetryPolicy(max_attempts=_max_attempts("embedding", 1))),
+    "neo4j": Stage("neo4j", RetryPolicy(
+        max_attempts=_max_attempts("neo4j", 3), retry_on=_neo4j_errors() + (httpx.TransportError, OSError),
+    )),
+    "groq": Stage("groq", RetryPolicy(
+        max_attempts=_max_attempts("groq", 3), base_delay=0.5, retry_on=_groq_errors() + (httpx.TransportError,),
+    )),
+}
+
+
+def _before_attempt(stage: Stage) -> Optional[float]:
+    time_left = remaining()
+    if time_left is not None and time_left <= 0:
+        raise DeadlineExceeded(f"{stage.name}: request deadline exceeded")
+    if not stage.breaker.allow():
+        raise CircuitOpenError(stage.name, "circuit open")
+    return time_left
+
+
+def _after_failure(stage: Stage, error: Exception, attempt: int) -> float:
+    """Record a failed attempt and return how long to sleep before the next one."""
+    retryable = isinstance(error, stage.policy.retry_on + (asyncio.TimeoutError,))
+    if not retryable:
+        # Lỗi logic (câu Cypher sai, request không hợp lệ) không phải sự cố của dịch vụ
+        stage.breaker.record_success()
+        raise error
+    stage.breaker.record_failure()
+    if attempt + 1 >= stage.policy.max_attempts:
+        raise StageUnavailableError(stage.name, f"failed after {attempt + 1} attempts: {error!r}") from error
+    delay = stage.policy.backoff(attempt)
+    time_left = remaining()
+    if time_left is not None and delay >= time_left:
+        raise DeadlineExceeded(f"{stage.name}: request deadline exceeded") from error
+    return delay
+
+
+async def call(stage_name: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Await ``fn(*args, **kwargs)`` under the stage's retry policy, breaker and the request deadline."""
+    with metrics.stage(stage_name):
+        return await _call(stages[stage_name], fn, *args, **kwargs)
+
+
+async def _call(stage: Stage, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    for attempt in range(stage.policy.max_attempts):
+        time_left = _before_attempt(stage)
+        try:
+            result = await asyncio.wait_for(fn(*args, **kwargs), timeout=time_left)
+        except asyncio.TimeoutError as e:
+            if remaining() is not None and remaining() <= 0:
+                stage.breaker.record_failure()
+                raise DeadlineExceeded(f"{stage.name}: request deadline exceeded") from e
+            await asyncio.sleep(_after_failure(stage, e, attempt))
+        except Exception as e:
+            await asyncio.sleep(_after_failure(stage, e, attempt))
+        except BaseException:
+            # CancelledError (client ngắt kết nối, wait_for của nhánh hybrid) không nói gì về dịch vụ
+            # nhưng phải nhả lượt thử half-open, nếu không breaker từ chối mọi lời gọi sau đó
+            stage.breaker.release()
+            raise
+        else:
+            stage.breaker.record_success()
+            return result
+
+
+def call_sync(stage_name: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Blocking counterpart of ``call``; the deadline is checked between attempts only."""
+    with metrics.stage(stage_name):
+        return _call_sync(stages[stage_name], fn, *args, **kwargs)
+
+
+def _call_sync(stage: Stage, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    for attempt in range(stage.policy.max_attempts):
+        _before_attempt(stage)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            time.sleep(_after_failure(stage, e, attempt))
+        except BaseException:
+            stage.breaker.release()
+            raise
+        else:
+            stage.breaker.record_success()
+            return result
+
+
+def stats() -> dict:
+    return {name: stage.breaker.stats() for name, stage in stages.items()}
+
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+from utils.startup_report import record_phase
+
+SNAPSHOT_VERSION = 1
+# Khoảng chờ trước khi thử làm mới lại sau một lần thất bại, để Neo4j lỗi không bị gọi ở mọi request
+SCHEMA_REFRESH_RETRY = float(os.getenv("SCHEMA_REFRESH_RETRY", "60"))
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaSnapshot:
+    """Neo4j graph schema cached on disk and refreshed in the background.
+
+    The first call to ``ensure`` reads the snapshot file. Only when there is
+    no usable snapshot does it introspect Neo4j synchronously; a snapshot older
+    than ``ttl`` seconds is served as is while a background thread refreshes
+    it and notifies the registered listeners. ``ensure`` is cheap once the
+    schema is loaded, so callers run it on every request.
+    """
+
+    def __init__(self, graph_factory: Callable, path: str, ttl: float):
+        self.graph_factory = graph_factory
+        self.path = path
+        self.ttl = ttl
+        self.schema: Optional[str] = None
+        self.structured_schema: dict = {}
+        self.created_at = 0.0
+        self.listeners: List[Callable] = []
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._next_attempt = 0.0
+
+    def ensure(self):
+        if self.schema is None:
+            with self._lock:
+                if self.schema is None and not self.load():
+                    with record_phase("schema_load"):
+                        self._refresh()
+        now = time.time()
+        if now - self.created_at > self.ttl and now >= self._next_attempt:
+            self.refresh_in_background()
+
+    async def aensure(self):
+        """``ensure`` for coroutines: introspecting Neo4j when there is no snapshot runs in a thread."""
+        if self.schema is None:
+            await asyncio.to_thread(self.ensure)
+        else:
+            self.ensure()
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with record_phase("schema_load"):
+            with open(self.path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if snapshot.get("version") != SNAPSHOT_VERSION:
+                return False
+            self.schema = snapshot["schema"]
+            self.structured_schema = snapshot["structured_schema"]
+            self.created_at = snapshot["created_at"]
+        return True
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._next_attempt = time.time() + SCHEMA_REFRESH_RETRY
+            self._refresh_thread = threading.Thread(target=self._refresh_safely, daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh_safely(self):
+        try:
+            self._refresh()
+        except Exception:
+            # Giữ snapshot cũ nếu Neo4j chưa sẵn sàng
+            logger.warning("Schema refresh failed, keeping the snapshot from %s", self.created_at, exc_info=True)
+
+    def _refresh(self):
+        graph = self.graph_factory()
+        graph.refresh_schema()
+        self.schema = graph.schema
+        self.structured_schema = graph.structured_schema
+        self.created_at = time.time()
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": SNAPSHOT_VERSION,
+                "created_at": self.created_at,
+                "schema": self.schema,
+                "structured_schema": self.structured_schema,
+            }, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.path)
+
+        for listener in self.listeners:
+            listener(self)
+
+    def apply(self, graph):
+        graph.schema = self.schema
+        graph.structured_schema = self.structured_schema
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """Cache agent answers and look them up by question similarity.
+
+    Questions are embedded with the bi-encoder and kept in a fixed size
+    matrix, so a lookup is a single matrix-vector product. An entry only
+    answers lookups for the mode (agent, hybrid) it was produced in, since
+    the intermediate steps differ. Entries are evicted least recently used
+    first and expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, get_embedder: Callable[[], Any], threshold: float = 0.95, max_size: int = 1000,
+                 ttl: float = 86400):
+        # Hàm trả về embedder, để model chỉ được nạp khi có câu hỏi đầu tiên
+        self.get_embedder = get_embedder
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._created_at = np.zeros(max_size, dtype=np.float64)
+        self._modes = np.full(max_size, None, dtype=object)
+        # slot -> (question, response), least recently used first
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._free_slots: List[int] = list(range(max_size - 1, -1, -1))
+
+    def embed(self, text: str) -> np.ndarray:
+        embedding = np.asarray(self.get_embedder().embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def lookup(self, embedding: np.ndarray, mode: Optional[str] = None) -> Optional[dict]:
+        with self._lock:
+            slots = self._live_slots()
+            slots = slots[self._modes[slots] == mode]
+            if not slots.size:
+                self.misses += 1
+                return None
+
+            scores = self._matrix[slots] @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = int(slots[best])
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return self._entries[slot][1]
+
+    def store(self, question: str, embedding: np.ndarray, response: dict, generation: Optional[int] = None,
+              mode: Optional[str] = None):
+        with self._lock:
+            # Câu trả lời được tạo ra trước khi dữ liệu bị nạp lại thì không lưu
+            if generation is not None and generation != self.generation:
+                return
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_size, embedding.shape[0]), dtype=np.float32)
+            if not self._free_slots:
+                oldest, _ = self._entries.popitem(last=False)
+                self._free_slots.append(oldest)
+
+            slot = self._free_slots.pop()
+            self._matrix[slot] = embedding
+            self._created_at[slot] = time.monotonic()
+            self._modes[slot] = mode
+            self._entries[slot] = (question, response)
+
+    def invalidate(self):
+        """Drop every entry, e.g. after the legal corpus in Neo4j is reloaded."""
+        with self._lock:
+            self._free_slots.extend(self._entries.keys())
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "generation": self.generation,
+            }
+
+    def _live_slots(self) -> np.ndarray:
+        slots = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+        expired = self._created_at[slots] < time.monotonic() - self.ttl
+        for slot in slots[expired].tolist():
+            del self._entries[slot]
+            self._free_slots.append(slot)
+        return slots[~expired]
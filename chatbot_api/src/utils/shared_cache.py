@@ -0,0 +1,346 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from utils.cypher_cache import normalize_question
+
+# memory: cache riêng từng process | sqlite: một file SQLite dùng chung cho mọi worker
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "shared_cache.sqlite3")
+# last_used của câu trả lời được dùng lại được ghi gộp, tối đa một lần mỗi khoảng này
+LAST_USED_FLUSH_INTERVAL = float(os.getenv("LAST_USED_FLUSH_INTERVAL", "30"))
+
+
+class SQLiteStore:
+    """SQLite connection opened lazily in each process and shared by its threads.
+
+    The object may be created before the server forks its workers; every
+    process opens its own connection on first use. WAL mode lets the workers
+    read concurrently while one of them writes.
+    """
+
+    def __init__(self, path: str = SHARED_CACHE_PATH, schema: str = "", migrations: tuple = ()):
+        self.path = path
+        self.schema = schema
+        self.migrations = migrations
+        self._pid: Optional[int] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(self.schema)
+            for statement in self.migrations:
+                try:
+                    connection.execute(statement)
+                except sqlite3.OperationalError as e:
+                    # Cột đã có từ lần chạy trước
+                    if "duplicate column" not in str(e):
+                        raise
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self.connection().execute(sql, params).fetchall()
+
+    def write(self, *statements) -> None:
+        """Run ``(sql, params)`` statements in one immediate transaction."""
+        with self._lock:
+            connection = self.connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    connection.execute(sql, params)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+
+class _VectorMirror:
+    """Per-process copy of the embeddings stored in a table, appended by id.
+
+    Rows deleted by another process stay here until a lookup finds them gone,
+    so every candidate has to be confirmed against the table.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.ids: List[int] = []
+        self.positions: Dict[int, int] = {}
+        self.matrix: Optional[np.ndarray] = None
+        self.size = 0
+        self.last_id = 0
+
+    def extend(self, rows: list):
+        for row_id, blob in rows:
+            embedding = np.frombuffer(blob, dtype=np.float32)
+            if self.matrix is None:
+                self.matrix = np.zeros((64, embedding.shape[0]), dtype=np.float32)
+            elif self.size == len(self.matrix):
+                self.matrix = np.concatenate([self.matrix, np.zeros_like(self.matrix)])
+            self.matrix[self.size] = embedding
+            self.positions[row_id] = self.size
+            self.ids.append(row_id)
+            self.size += 1
+            self.last_id = max(self.last_id, row_id)
+
+    def candidates(self, embedding: np.ndarray, threshold: float) -> Iterator[int]:
+        """Row ids scoring at least ``threshold``, best first."""
+        if not self.size:
+            return
+        scores = self.matrix[:self.size] @ embedding
+        for position in np.argsort(-scores):
+            if scores[position] < threshold:
+                return
+            if self.ids[position] >= 0:
+                yield self.ids[position]
+
+    def discard(self, row_id: int):
+        position = self.positions.pop(row_id)
+        self.ids[position] = -1
+        self.matrix[position] = 0
+
+
+class SharedAnswerCache:
+    """``SemanticAnswerCache`` backed by SQLite so every worker sees the same answers.
+
+    Questions are still matched by a matrix-vector product over a local
+    mirror of the stored embeddings; the mirror picks up rows written by
+    other workers on each lookup; there is one mirror per mode, as in
+    ``SemanticAnswerCache`` an answer only serves its own mode. Hits do not write: their ``last_used`` is
+    kept in memory and written with the next store, or after
+    ``LAST_USED_FLUSH_INTERVAL`` seconds. The methods block on SQLite, so
+    async callers run them in a thread.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS answers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT, embedding BLOB, response TEXT,
+        created_at REAL, last_used REAL, generation INTEGER, mode TEXT
+    );
+    CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used);
+    CREATE TABLE IF NOT EXISTS cache_meta (key TEXT PRIMARY KEY, value INTEGER);
+    INSERT OR IGNORE INTO cache_meta VALUES ('answers_generation', 0);
+    """
+    # Bảng tạo trước khi có cột mode; các dòng cũ có mode NULL nên không còn được dùng lại
+    MIGRATIONS = ("ALTER TABLE answers ADD COLUMN mode TEXT",)
+
+    def __init__(self, get_embedder: Callable[[], Any], threshold: float = 0.95, max_size: int = 1000,
+                 ttl: float = 86400, path: str = SHARED_CACHE_PATH):
+        self.get_embedder = get_embedder
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.db = SQLiteStore(path, self.SCHEMA, self.MIGRATIONS)
+        self._mirrors: Dict[Optional[str], _VectorMirror] = {}
+        self._mirror_generation: Optional[int] = None
+        self._touched: Dict[int, float] = {}
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self.db.query("SELECT value FROM cache_meta WHERE key = 'answers_generation'")[0][0]
+
+    def embed(self, text: str) -> np.ndarray:
+        embedding = np.asarray(self.get_embedder().embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def lookup(self, embedding: np.ndarray, mode: Optional[str] = None) -> Optional[dict]:
+        with self._lock:
+            mirror = self._sync(mode)
+            for row_id in mirror.candidates(embedding, self.threshold):
+                rows = self.db.query("SELECT response, created_at FROM answers WHERE id = ?", (row_id,))
+                if not rows or rows[0][1] < time.time() - self.ttl:
+                    mirror.discard(row_id)
+                    continue
+                self._touched[row_id] = time.time()
+                self.hits += 1
+                if time.monotonic() - self._flushed_at >= LAST_USED_FLUSH_INTERVAL:
+                    self.db.write(*self._take_touched())
+                return json.loads(rows[0][0])
+            self.misses += 1
+            return None
+
+    def _take_touched(self) -> list:
+        """``last_used`` updates recorded since the last flush, as write statements."""
+        statements = [("UPDATE answers SET last_used = ? WHERE id = ?", (last_used, row_id))
+                      for row_id, last_used in self._touched.items()]
+        self._touched = {}
+        self._flushed_at = time.monotonic()
+        return statements
+
+    def store(self, question: str, embedding: np.ndarray, response: dict, generation: Optional[int] = None,
+              mode: Optional[str] = None):
+        now = time.time()
+        current = self.generation
+        # Câu trả lời được tạo ra trước khi dữ liệu bị nạp lại thì không lưu
+        if generation is not None and generation != current:
+            return
+        with self._lock:
+            touched = self._take_touched()
+        self.db.write(
+            *touched,
+            ("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,)),
+            ("INSERT INTO answers (question, embedding, response, created_at, last_used, generation, mode) "
+             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+             (question, np.asarray(embedding, dtype=np.float32).tobytes(),
+              json.dumps(response, ensure_ascii=False), now, now, current, mode)),
+            ("DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used "
+             "LIMIT max(0, (SELECT count(*) FROM answers) - ?))", (self.max_size,)),
+        )
+
+    def invalidate(self):
+        """Drop every entry in all workers, e.g. after the legal corpus in Neo4j is reloaded."""
+        self.db.write(
+            ("DELETE FROM answers", ()),
+            ("UPDATE cache_meta SET value = value + 1 WHERE key = 'answers_generation'", ()),
+        )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "pid": os.getpid(),
+            "size": self.db.query("SELECT count(*) FROM answers")[0][0],
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "generation": self.generation,
+        }
+
+    def _sync(self, mode: Optional[str]) -> _VectorMirror:
+        generation = self.generation
+        if generation != self._mirror_generation:
+            self._mirrors.clear()
+            self._mirror_generation = generation
+        mirror = self._mirrors.setdefault(mode, _VectorMirror())
+        mirror.extend(self.db.query(
+            "SELECT id, embedding FROM answers WHERE id > ? AND generation = ? AND mode IS ? ORDER BY id",
+            (mirror.last_id, generation, mode),
+        ))
+        return mirror
+
+
+class SharedCypherCache:
+    """``CypherCache`` backed by SQLite so every worker reuses the same statements."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cypher (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE, cypher TEXT, embedding BLOB,
+        fingerprint TEXT, last_used REAL
+    );
+    CREATE INDEX IF NOT EXISTS cypher_last_used ON cypher(last_used);
+    CREATE TABLE IF NOT EXISTS bad_cypher (cypher TEXT, fingerprint TEXT, PRIMARY KEY (cypher, fingerprint));
+    """
+
+    def __init__(self, max_size: int = 5000, threshold: float = 0.97, path: str = SHARED_CACHE_PATH):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.fingerprint: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.db = SQLiteStore(path, self.SCHEMA)
+        self._mirror = _VectorMirror()
+        self._lock = threading.Lock()
+
+    def lookup(self, question: str, fingerprint: str, embedding: Optional[np.ndarray] = None) -> Optional[str]:
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            key = normalize_question(question)
+            rows = self.db.query("SELECT id, cypher FROM cypher WHERE key = ? AND fingerprint = ?",
+                                     (key, fingerprint))
+            if not rows and embedding is not None:
+                rows = self._nearest(embedding, fingerprint)
+            if not rows:
+                self.misses += 1
+                return None
+            self.db.write(("UPDATE cypher SET last_used = ? WHERE id = ?", (time.time(), rows[0][0])))
+            self.hits += 1
+            return rows[0][1]
+
+    def record_success(self, question: str, cypher: str, fingerprint: str, embedding: Optional[np.ndarray] = None):
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            if self.db.query("SELECT 1 FROM bad_cypher WHERE cypher = ? AND fingerprint = ?",
+                                 (cypher, fingerprint)):
+                return
+            blob = None if embedding is None else np.asarray(embedding, dtype=np.float32).tobytes()
+            self.db.write(
+                ("INSERT OR REPLACE INTO cypher (key, cypher, embedding, fingerprint, last_used) "
+                 "VALUES (?, ?, ?, ?, ?)",
+                 (normalize_question(question), cypher, blob, fingerprint, time.time())),
+                ("DELETE FROM cypher WHERE id IN (SELECT id FROM cypher ORDER BY last_used "
+                 "LIMIT max(0, (SELECT count(*) FROM cypher) - ?))", (self.max_size,)),
+            )
+
+    def record_failure(self, question: str, cypher: str, fingerprint: str):
+        """Remember a statement that raised or returned no rows so no worker reuses it."""
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            self.rejected += 1
+            self.db.write(
+                ("INSERT OR IGNORE INTO bad_cypher VALUES (?, ?)", (cypher, fingerprint)),
+                ("DELETE FROM bad_cypher WHERE rowid IN (SELECT rowid FROM bad_cypher ORDER BY rowid "
+                 "LIMIT max(0, (SELECT count(*) FROM bad_cypher) - ?))", (self.max_size,)),
+                # Mọi câu hỏi đang dùng câu Cypher này, kể cả câu lân cận đã trả nó qua tìm kiếm semantic
+                ("DELETE FROM cypher WHERE cypher = ?", (cypher,)),
+            )
+
+    def invalidate(self):
+        with self._lock:
+            self.db.write(("DELETE FROM cypher", ()), ("DELETE FROM bad_cypher", ()))
+            self._mirror.reset()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "pid": os.getpid(),
+            "size": self.db.query("SELECT count(*) FROM cypher")[0][0],
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "rejected": self.rejected,
+            "schema_fingerprint": self.fingerprint,
+        }
+
+    def _check_fingerprint(self, fingerprint: str):
+        if fingerprint != self.fingerprint:
+            # Câu Cypher sinh cho schema cũ không còn dùng được ở bất kỳ worker nào
+            self.db.write(
+                ("DELETE FROM cypher WHERE fingerprint != ?", (fingerprint,)),
+                ("DELETE FROM bad_cypher WHERE fingerprint != ?", (fingerprint,)),
+            )
+            self._mirror.reset()
+            self.fingerprint = fingerprint
+
+    def _nearest(self, embedding: np.ndarray, fingerprint: str) -> list:
+        self._mirror.extend(self.db.query(
+            "SELECT id, embedding FROM cypher WHERE id > ? AND embedding IS NOT NULL ORDER BY id",
+            (self._mirror.last_id,),
+        ))
+        for row_id in self._mirror.candidates(embedding, self.threshold):
+            rows = self.db.query("SELECT id, cypher FROM cypher WHERE id = ? AND fingerprint = ?",
+                                     (row_id, fingerprint))
+            if rows:
+                return rows
+            self._mirror.discard(row_id)
+        return []
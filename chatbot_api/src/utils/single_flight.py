@@ -0,0 +1,56 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Let concurrent calls with the same key share one execution.
+
+    The first caller starts ``fn`` as a task; callers arriving while it is in
+    flight await the same result (or exception) instead of starting their
+    own run. A cancelled caller only stops waiting; the run is cancelled
+    once nobody waits for it any more.
+    """
+
+    def __init__(self):
+        self.executions = 0
+        self.coalesced = 0
+        self._in_flight: Dict[str, dict] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._in_flight.get(key)
+        if flight is None:
+            # Chạy trong task riêng để caller đầu tiên bị hủy (client ngắt kết nối) không hủy kết quả
+            # của các caller khác; task chạy trong context của caller đầu tiên (deadline, priority)
+            task = asyncio.ensure_future(fn())
+            flight = self._in_flight[key] = {"task": task, "waiters": 0}
+            task.add_done_callback(lambda t: self._finish(key, flight))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+
+        task = flight["task"]
+        flight["waiters"] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            flight["waiters"] -= 1
+            # Không còn ai chờ thì không chạy tiếp cho ai cả
+            if not flight["waiters"] and not task.done():
+                task.cancel()
+
+    def _finish(self, key: str, flight: dict):
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        task = flight["task"]
+        # Tránh cảnh báo "exception was never retrieved" khi không có caller nào chờ
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        total = self.executions + self.coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / total if total else 0.0,
+        }
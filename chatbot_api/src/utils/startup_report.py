@@ -0,0 +1,42 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+STARTUP_REPORT_PATH = os.getenv("STARTUP_REPORT_PATH")
+
+# Mốc thời gian khi module này được import lần đầu, main.py import nó trước mọi thứ khác
+PROCESS_START = time.perf_counter()
+
+_phases = {}
+_first_request_done = False
+
+
+@contextmanager
+def record_phase(name: str):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = round(time.perf_counter() - start_time, 4)
+
+
+def mark_phase(name: str, seconds: float):
+    _phases[name] = round(seconds, 4)
+
+
+def mark_first_request(seconds: float):
+    """Record the first request and append the whole report to STARTUP_REPORT_PATH."""
+    global _first_request_done
+    if _first_request_done:
+        return
+    _first_request_done = True
+    _phases["first_request"] = round(seconds, 4)
+    _phases["until_first_response"] = round(time.perf_counter() - PROCESS_START, 4)
+    if STARTUP_REPORT_PATH:
+        with open(STARTUP_REPORT_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"timestamp": time.time(), **report()}) + "\n")
+
+
+def report() -> dict:
+    return {"pid": os.getpid(), "phases": dict(_phases)}
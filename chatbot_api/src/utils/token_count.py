@@ -0,0 +1,9 @@
+import os
+
+# Tiếng Việt có dấu bị tokenizer BPE chia nhỏ hơn tiếng Anh, ~3 ký tự mỗi token
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "3.0"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap prompt-token estimate used for budgets and savings reports."""
+    return int(len(text) / CHARS_PER_TOKEN) + 1 if text else 0
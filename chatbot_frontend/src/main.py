@@ -1,8 +1,28 @@
 import  os
+import json
 import requests
 import streamlit as st
 
 CHATBOT_URL = os.getenv("CHATBOT_URL")
+CHATBOT_STREAM_URL = os.getenv("CHATBOT_STREAM_URL", f"{CHATBOT_URL}/stream")
+
+
+def stream_answer(data, result, status):
+    """Yield answer tokens from the streaming endpoint and collect the final response in ``result``."""
+    with requests.post(CHATBOT_STREAM_URL, json=data, stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "step":
+                status.write(f"{event['name']}: {event['status']}")
+            elif event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "final":
+                result.update(event)
+            elif event["type"] == "error":
+                raise RuntimeError(event["message"])
 
 with st.sidebar:
     st.header("About")
@@ -37,20 +57,25 @@ if prompt := st.chat_input("Bạn muốn biết về điều gì?"):
 
     data = {"text" : prompt}
 
-    with st.spinner("Đang tìm kiếm câu trả lời phù hợp..."):
-        response = requests.post(CHATBOT_URL, json=data)
-
-        if response.status_code == 200:
-            output_text = response.json()["output"]
-            explanation = response.json()["intermediate_steps"]
-
-        else:
-            output_text = """Trong quá trình xử lý câu hỏi của bạn đã xảy ra lỗi.
+    error_text = """Trong quá trình xử lý câu hỏi của bạn đã xảy ra lỗi.
              Vui lòng hãy thử lại hoặc diễn tả lại câu hỏi của bạn theo một cách khác rõ ràng hơn."""
+
+    with st.chat_message("assistant"):
+        status = st.status("Đang tìm kiếm câu trả lời phù hợp...")
+        result = {}
+        try:
+            output_text = st.write_stream(stream_answer(data, result, status))
+            if not output_text:
+                output_text = result.get("output", "")
+                st.markdown(output_text)
+            explanation = result.get("intermediate_steps", "")
+        except (requests.RequestException, RuntimeError):
+            output_text = error_text
             explanation = output_text
+            st.markdown(output_text)
 
-        st.chat_message("assistant").markdown(output_text)
-        st.status("Giải thích", state="Xong").info(explanation)
+        status.update(label="Giải thích", state="complete")
+        status.info(explanation)
 
         st.session_state.messages.append(
             {
@@ -0,0 +1,15 @@
+#!/bin/bash
+
+# Run any setup steps or pre-processing tasks here
+echo "Loading the Pháp điển corpus into Neo4j..."
+
+set -e
+
+SOURCE_DIR="${PHAP_DIEN_DIR:-/data/phap_dien}"
+if [ ! -d "$SOURCE_DIR" ] || [ -z "$(ls -A "$SOURCE_DIR")" ]; then
+    echo "Pháp điển corpus not found in $SOURCE_DIR: mount it (PHAP_DIEN_HOST_DIR in docker-compose.yml)" >&2
+    exit 1
+fi
+
+# Resumes from the checkpoint when a previous run was interrupted
+python phap_dien_etl.py --source "$SOURCE_DIR"
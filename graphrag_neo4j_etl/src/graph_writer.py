@@ -0,0 +1,119 @@
+import os
+from typing import Dict, List
+
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "768"))
+
+SCHEMA_QUERIES = [
+    "CREATE CONSTRAINT demuc_id IF NOT EXISTS FOR (n:Demuc) REQUIRE n.id IS UNIQUE",
+    "CREATE CONSTRAINT chuong_id IF NOT EXISTS FOR (n:Chuong) REQUIRE n.id IS UNIQUE",
+    "CREATE CONSTRAINT dieu_id IF NOT EXISTS FOR (n:Dieu) REQUIRE n.id IS UNIQUE",
+    "CREATE CONSTRAINT noidung_id IF NOT EXISTS FOR (n:Noidung) REQUIRE n.id IS UNIQUE",
+]
+
+# Cùng tên index mà chatbot_api dùng khi truy vấn vector
+VECTOR_INDEX_QUERY = """
+CREATE VECTOR INDEX VectorIndex IF NOT EXISTS FOR (n:Noidung) ON n.embedding
+OPTIONS {indexConfig: {`vector.dimensions`: %d, `vector.similarity_function`: 'cosine'}}
+"""
+
+# Mỗi batch ghi cấu trúc Đề mục -> (Chương) -> Điều trước, rồi tới các node Noidung
+HIERARCHY_QUERY = """
+UNWIND $rows AS row
+MERGE (m:Demuc {id: row.demuc_id})
+SET m.title = row.demuc_title
+MERGE (d:Dieu {id: row.dieu_id})
+SET d.title = row.dieu_title, d.ghi_chu = row.ghi_chu
+FOREACH (_ IN CASE WHEN row.chuong_id IS NULL THEN [1] ELSE [] END |
+    MERGE (m)-[:CO_DIEU]->(d)
+)
+FOREACH (_ IN CASE WHEN row.chuong_id IS NULL THEN [] ELSE [1] END |
+    MERGE (c:Chuong {id: row.chuong_id})
+    SET c.title = row.chuong_title
+    MERGE (m)-[:CO_CHUONG]->(c)
+    MERGE (c)-[:CO_DIEU]->(d)
+)
+"""
+
+CONTENT_QUERY = """
+UNWIND $rows AS row
+MATCH (d:Dieu {id: row.dieu_id})
+MERGE (n:Noidung {id: row.id})
+SET n.content = row.content
+FOREACH (_ IN CASE WHEN row.embedding IS NULL THEN [] ELSE [1] END |
+    SET n.embedding = row.embedding, n.content_hash = row.content_hash, n.embedding_model = row.embedding_model
+)
+MERGE (d)-[:CO_NOI_DUNG]->(n)
+"""
+
+
+class Neo4jGraphWriter:
+    """Writes record batches with one UNWIND transaction per batch.
+
+    Every statement is a MERGE keyed on ``id``, so replaying a batch after a
+    crash leaves the graph unchanged.
+    """
+
+    def __init__(self, driver, database: str = None):
+        self.driver = driver
+        self.database = database
+
+    def ensure_schema(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        with self.driver.session(database=self.database) as session:
+            for query in SCHEMA_QUERIES:
+                session.run(query).consume()
+            session.run(VECTOR_INDEX_QUERY % dimensions).consume()
+
+    def write_batch(self, rows: List[dict]):
+        with self.driver.session(database=self.database) as session:
+            session.execute_write(self._write_batch, rows)
+
+    @staticmethod
+    def _write_batch(tx, rows: List[dict]):
+        tx.run(HIERARCHY_QUERY, rows=_dieu_rows(rows)).consume()
+        tx.run(CONTENT_QUERY, rows=rows).consume()
+
+
+def _dieu_rows(rows: List[dict]) -> List[dict]:
+    # Một Điều chỉ cần ghi cấu trúc một lần cho mỗi batch
+    return list({row["dieu_id"]: row for row in rows}.values())
+
+
+class InMemoryGraphWriter:
+    """Stand-in for ``Neo4jGraphWriter`` keeping nodes and relationships in dicts.
+
+    It applies the same MERGE semantics so tests can check idempotent replays
+    and the resulting hierarchy without a Neo4j server.
+    """
+
+    def __init__(self):
+        self.nodes: Dict[str, Dict[str, dict]] = {"Demuc": {}, "Chuong": {}, "Dieu": {}, "Noidung": {}}
+        self.relationships = set()
+        self.batches = 0
+
+    def ensure_schema(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def write_batch(self, rows: List[dict]):
+        for row in _dieu_rows(rows):
+            self._merge("Demuc", row["demuc_id"], title=row["demuc_title"])
+            self._merge("Dieu", row["dieu_id"], title=row["dieu_title"], ghi_chu=row["ghi_chu"])
+            if row["chuong_id"] is None:
+                self.relationships.add(("CO_DIEU", row["demuc_id"], row["dieu_id"]))
+            else:
+                self._merge("Chuong", row["chuong_id"], title=row["chuong_title"])
+                self.relationships.add(("CO_CHUONG", row["demuc_id"], row["chuong_id"]))
+                self.relationships.add(("CO_DIEU", row["chuong_id"], row["dieu_id"]))
+        for row in rows:
+            properties = {"content": row["content"]}
+            if row.get("embedding") is not None:
+                properties.update(embedding=row["embedding"], content_hash=row["content_hash"],
+                                  embedding_model=row["embedding_model"])
+            self._merge("Noidung", row["id"], **properties)
+            self.relationships.add(("CO_NOI_DUNG", row["dieu_id"], row["id"]))
+        self.batches += 1
+
+    def _merge(self, label: str, node_id: str, **properties):
+        self.nodes[label].setdefault(node_id, {"id": node_id}).update(properties)
+
+    def counts(self) -> dict:
+        return {**{label: len(nodes) for label, nodes in self.nodes.items()}, "relationships": len(self.relationships)}
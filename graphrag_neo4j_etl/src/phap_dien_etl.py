@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from graph_writer import Neo4jGraphWriter
+from phap_dien_parser import iter_records, list_source_files
+
+load_dotenv()
+
+PHAP_DIEN_DIR = os.getenv("PHAP_DIEN_DIR", "/data/phap_dien")
+ETL_BATCH_SIZE = int(os.getenv("ETL_BATCH_SIZE", "256"))
+ETL_EMBED_WORKERS = int(os.getenv("ETL_EMBED_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+ETL_CHECKPOINT_PATH = os.getenv("ETL_CHECKPOINT_PATH", "etl_checkpoint.json")
+ETL_REPORT_EVERY = int(os.getenv("ETL_REPORT_EVERY", "10"))
+# ChunkedEmbedding được dùng lại từ chatbot_api để vector lúc nạp và lúc truy vấn khớp nhau
+CHATBOT_API_SRC = os.getenv(
+    "CHATBOT_API_SRC", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "chatbot_api", "src")
+)
+if CHATBOT_API_SRC not in sys.path:
+    sys.path.append(CHATBOT_API_SRC)
+
+# Cùng hash với chains.reindex để lần reindex sau không embed lại các node vừa nạp
+from chains.reindex import content_hash  # noqa: E402
+
+
+def load_chunked_embedder():
+    """ChunkedEmbedding over the bi-encoder configured for chatbot_api."""
+    from chains.only_vector_chain import ChunkedEmbedding
+    from utils.model_registry import get_embedder
+
+    return ChunkedEmbedding(get_embedder())
+
+
+# Mỗi tiến trình embedding giữ một model riêng, nạp một lần khi khởi tạo
+_worker_embedder = None
+
+
+def _init_worker(embedder_factory: Callable, threads: int = 0):
+    global _worker_embedder
+    if threads:
+        # Chia số core cho các tiến trình embedding thay vì mỗi tiến trình dùng hết (như run_worker của serve.py)
+        try:
+            import torch
+        except ImportError:
+            pass
+        else:
+            torch.set_num_threads(threads)
+    _worker_embedder = embedder_factory()
+
+
+def _embed_batch(texts: List[str]) -> Tuple[str, np.ndarray]:
+    # float32 để giảm dữ liệu pickle gửi về tiến trình chính
+    model_name = getattr(_worker_embedder, "model_name", type(_worker_embedder).__name__)
+    return model_name, np.asarray(_worker_embedder.embed_documents(texts), dtype=np.float32)
+
+
+class Checkpoint:
+    """Progress of a run, saved after every committed batch.
+
+    A source file is keyed by its path relative to the source directory, its
+    size and its modification time, so a file that changed since the last run
+    is loaded again even when its size did not change.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.state = {"completed": {}, "current": None, "records_done": 0}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    @staticmethod
+    def key(source_dir: str, path: str) -> str:
+        stat = os.stat(path)
+        return f"{os.path.relpath(path, source_dir)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def is_complete(self, key: str) -> bool:
+        return key in self.state["completed"]
+
+    def records_done(self, key: str) -> int:
+        return self.state["records_done"] if self.state["current"] == key else 0
+
+    def advance(self, key: str, records_done: int):
+        self.state["current"] = key
+        self.state["records_done"] = records_done
+        self._save()
+
+    def complete(self, key: str, records: int):
+        self.state["completed"][key] = records
+        self.state["current"] = None
+        self.state["records_done"] = 0
+        self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        # Ghi file tạm rồi os.replace để checkpoint không bị hỏng khi tiến trình chết giữa chừng
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(self.path + ".tmp", self.path)
+
+
+class PhapDienEtl:
+    """Streams Pháp điển files into the graph: parse -> embed -> batched write.
+
+    Parsing and writing run in this process while batches are embedded in a
+    pool of ``embed_workers`` processes; up to ``max_in_flight`` batches are
+    embedded ahead of the writer. Batches never span two files, so the
+    checkpoint is always a file plus the number of its records written.
+    """
+
+    def __init__(self, writer, checkpoint: Checkpoint, embedder_factory: Optional[Callable] = load_chunked_embedder,
+                 batch_size: int = ETL_BATCH_SIZE, embed_workers: int = ETL_EMBED_WORKERS,
+                 max_in_flight: Optional[int] = None, report_every: int = ETL_REPORT_EVERY):
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.embedder_factory = embedder_factory
+        self.batch_size = batch_size
+        self.embed_workers = embed_workers
+        self.max_in_flight = max_in_flight or max(2, embed_workers * 2)
+        self.report_every = report_every
+        self.stats = {"files": 0, "files_skipped": 0, "rows": 0, "batches": 0,
+                      "parse_s": 0.0, "embed_wait_s": 0.0, "write_s": 0.0}
+
+    def run(self, source_dir: str) -> dict:
+        # Thư mục nguồn thiếu hoặc rỗng (chưa mount corpus) là lỗi, không phải một lần nạp 0 file
+        if not os.path.isdir(source_dir):
+            raise FileNotFoundError(f"Pháp điển source directory not found: {source_dir}")
+        source_files = list_source_files(source_dir)
+        if not source_files:
+            raise FileNotFoundError(f"No đề mục HTML files under {source_dir}")
+
+        start_time = time.perf_counter()
+        executor = None
+        if self.embedder_factory is not None and self.embed_workers > 0:
+            executor = ProcessPoolExecutor(
+                max_workers=self.embed_workers, initializer=_init_worker,
+                initargs=(self.embedder_factory, max(1, (os.cpu_count() or 1) // self.embed_workers)),
+            )
+        elif self.embedder_factory is not None:
+            _init_worker(self.embedder_factory)
+
+        pending = deque()
+        try:
+            for path in source_files:
+                key = Checkpoint.key(source_dir, path)
+                if self.checkpoint.is_complete(key):
+                    self.stats["files_skipped"] += 1
+                    continue
+                for batch in self._batches(path, key):
+                    pending.append(batch + (self._submit(executor, batch[2]),))
+                    while len(pending) > self.max_in_flight:
+                        self._commit(*pending.popleft())
+            while pending:
+                self._commit(*pending.popleft())
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        self.stats["elapsed_s"] = time.perf_counter() - start_time
+        self.stats["rows_per_s"] = self.stats["rows"] / self.stats["elapsed_s"] if self.stats["elapsed_s"] else 0.0
+        return self.stats
+
+    def _batches(self, path: str, key: str):
+        """Yield ``(key, records_done, rows, is_last)`` for the records not written yet."""
+        records_done = self.checkpoint.records_done(key)
+        records = iter_records(path)
+        # Bỏ qua phần đã ghi ở lần chạy trước, vẫn phải parse lại nhưng không embed lại
+        for _ in islice(records, records_done):
+            pass
+        self.stats["files"] += 1
+        while True:
+            parse_start = time.perf_counter()
+            rows = list(islice(records, self.batch_size))
+            self.stats["parse_s"] += time.perf_counter() - parse_start
+            records_done += len(rows)
+            is_last = len(rows) < self.batch_size
+            if rows or is_last:
+                yield key, records_done, rows, is_last
+            if is_last:
+                return
+
+    def _submit(self, executor, rows: List[dict]) -> Optional[Future]:
+        if self.embedder_factory is None or not rows:
+            return None
+        texts = [row["content"] for row in rows]
+        if executor is not None:
+            return executor.submit(_embed_batch, texts)
+        future = Future()
+        future.set_result(_embed_batch(texts))
+        return future
+
+    def _commit(self, key: str, records_done: int, rows: List[dict], is_last: bool, future: Optional[Future]):
+        if future is not None:
+            wait_start = time.perf_counter()
+            model_name, embeddings = future.result()
+            self.stats["embed_wait_s"] += time.perf_counter() - wait_start
+            for row, embedding in zip(rows, embeddings):
+                row["embedding"] = embedding.tolist()
+                row["content_hash"] = content_hash(row["content"])
+                row["embedding_model"] = model_name
+        if rows:
+            write_start = time.perf_counter()
+            self.writer.write_batch(rows)
+            self.stats["write_s"] += time.perf_counter() - write_start
+            self.stats["rows"] += len(rows)
+            self.stats["batches"] += 1
+        if is_last:
+            self.checkpoint.complete(key, records_done)
+        else:
+            self.checkpoint.advance(key, records_done)
+        if rows and self.report_every and self.stats["batches"] % self.report_every == 0:
+            self._report()
+
+    def _report(self):
+        # Tốc độ được tính từ lúc ghi batch đầu tiên của lần chạy này
+        elapsed = self.stats["parse_s"] + self.stats["embed_wait_s"] + self.stats["write_s"]
+        print(f"{self.stats['rows']} rows, {self.stats['batches']} batches, "
+              f"{self.stats['rows'] / elapsed if elapsed else 0.0:.1f} rows/sec "
+              f"(parse {self.stats['parse_s']:.1f}s, embed wait {self.stats['embed_wait_s']:.1f}s, "
+              f"write {self.stats['write_s']:.1f}s)", flush=True)
+
+
+if __name__ == "__main__":
+    # python phap_dien_etl.py --source ./phap_dien --workers 4
+    parser = argparse.ArgumentParser(description="Load the Pháp điển HTML corpus into Neo4j")
+    parser.add_argument("--source", default=PHAP_DIEN_DIR, help="directory of đề mục HTML files")
+    parser.add_argument("--batch-size", type=int, default=ETL_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=ETL_EMBED_WORKERS, help="embedding processes, 0 = in-process")
+    parser.add_argument("--checkpoint", default=ETL_CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and load everything again")
+    parser.add_argument("--no-embed", action="store_true", help="write the graph only, embed later")
+    args = parser.parse_args()
+
+    from neo4j import GraphDatabase
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    driver = GraphDatabase.driver(
+        os.getenv("NEO4J_URI"),
+        auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+    )
+    try:
+        writer = Neo4jGraphWriter(driver)
+        writer.ensure_schema()
+        etl = PhapDienEtl(
+            writer,
+            Checkpoint(args.checkpoint),
+            embedder_factory=None if args.no_embed else load_chunked_embedder,
+            batch_size=args.batch_size,
+            embed_workers=args.workers,
+        )
+        stats = etl.run(args.source)
+    finally:
+        driver.close()
+    print(json.dumps(stats, indent=2))
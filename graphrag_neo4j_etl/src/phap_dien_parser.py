@@ -0,0 +1,132 @@
+import hashlib
+import os
+from html.parser import HTMLParser
+from typing import Iterator, List, Optional
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Các class đoạn văn trong file đề mục HTML của Bộ Pháp điển điện tử
+PARAGRAPH_CLASSES = {"pChuong", "pDieu", "pNoiDung", "pGhiChu"}
+
+
+def _stable_id(*parts: str) -> str:
+    return hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=10).hexdigest()
+
+
+def _normalize(text: str) -> str:
+    # Gộp khoảng trắng trong từng dòng, giữ xuống dòng từ <br>
+    return "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
+
+
+class PhapDienParser(HTMLParser):
+    """Incremental parser for one đề mục file of the Pháp điển.
+
+    Feed it the file piece by piece; every completed Điều is turned into one
+    record (its pNoiDung paragraphs joined) and collected in ``records`` until
+    the caller drains them, so a file is never held in memory as a whole.
+    """
+
+    def __init__(self, demuc_id: str, demuc_title: Optional[str] = None):
+        super().__init__(convert_charrefs=True)
+        self.demuc_id = demuc_id
+        self.demuc_title = demuc_title or demuc_id
+        self.records: List[dict] = []
+        self._anchor: Optional[str] = None
+        self._paragraph_class: Optional[str] = None
+        self._paragraph_depth = 0
+        self._text: List[str] = []
+        self._in_title = False
+        self._title_parts: List[str] = []
+        self._chuong: Optional[dict] = None
+        self._dieu: Optional[dict] = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "title":
+            self._in_title = True
+        elif tag == "a" and attrs.get("name") and self._paragraph_class is None:
+            self._anchor = attrs["name"]
+        elif tag == "p" and attrs.get("class") in PARAGRAPH_CLASSES:
+            self._paragraph_class = attrs["class"]
+            self._paragraph_depth = 1
+            self._text = []
+        elif tag == "p" and self._paragraph_class is not None:
+            self._paragraph_depth += 1
+        elif tag == "br" and self._paragraph_class is not None:
+            self._text.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+            title = " ".join("".join(self._title_parts).split())
+            if title and self.demuc_title == self.demuc_id:
+                self.demuc_title = title
+        elif tag == "p" and self._paragraph_class is not None:
+            self._paragraph_depth -= 1
+            if self._paragraph_depth == 0:
+                self._end_paragraph(self._paragraph_class, _normalize("".join(self._text)))
+                self._paragraph_class = None
+
+    def handle_data(self, data):
+        if self._paragraph_class is not None:
+            self._text.append(data)
+        elif self._in_title:
+            self._title_parts.append(data)
+
+    def _end_paragraph(self, paragraph_class: str, text: str):
+        anchor, self._anchor = self._anchor, None
+        if paragraph_class == "pChuong":
+            self._flush_dieu()
+            self._chuong = {"id": anchor or _stable_id(self.demuc_id, text), "title": text}
+        elif paragraph_class == "pDieu":
+            self._flush_dieu()
+            self._dieu = {"id": anchor or _stable_id(self.demuc_id, text), "title": text, "ghi_chu": [], "content": []}
+        elif self._dieu is not None and text:
+            self._dieu["ghi_chu" if paragraph_class == "pGhiChu" else "content"].append(text)
+
+    def _flush_dieu(self):
+        dieu, self._dieu = self._dieu, None
+        if dieu is None or not dieu["content"]:
+            return
+        self.records.append({
+            "demuc_id": self.demuc_id,
+            "demuc_title": self.demuc_title,
+            "chuong_id": self._chuong["id"] if self._chuong else None,
+            "chuong_title": self._chuong["title"] if self._chuong else None,
+            "dieu_id": dieu["id"],
+            "dieu_title": dieu["title"],
+            "ghi_chu": "\n".join(dieu["ghi_chu"]),
+            "id": f"{dieu['id']}_noidung",
+            "content": "\n".join(dieu["content"]),
+        })
+
+    def close(self):
+        super().close()
+        self._flush_dieu()
+
+    def drain(self) -> List[dict]:
+        records, self.records = self.records, []
+        return records
+
+
+def iter_records(path: str, demuc_title: Optional[str] = None) -> Iterator[dict]:
+    """Stream the Noidung records of one đề mục HTML file, in document order."""
+    demuc_id = os.path.splitext(os.path.basename(path))[0]
+    parser = PhapDienParser(demuc_id, demuc_title)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            yield from parser.drain()
+    parser.close()
+    yield from parser.drain()
+
+
+def list_source_files(source_dir: str) -> List[str]:
+    """All đề mục HTML files under ``source_dir``, sorted so runs are reproducible."""
+    paths = []
+    for root, _, files in os.walk(source_dir):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith((".html", ".htm")))
+    return sorted(paths)
@@ -3,16 +3,17 @@ import time
 import httpx
 
 CHATBOT_URL = "http://localhost:8000/rag-agent"
+CONCURRENCY_LEVELS = [1, 2, 4, 8]
 
-async def make_async_post(url, data):
+async def make_async_post(client, url, data):
     timeout = httpx.Timeout(timeout=120)
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=data, timeout=timeout)
-        return response
+    response = await client.post(url, json=data, timeout=timeout)
+    return response
 
 async def make_bulk_requests(url, data):
-    tasks = [make_async_post(url, payload) for payload in data]
-    responses = await asyncio.gather(*tasks)
+    async with httpx.AsyncClient() as client:
+        tasks = [make_async_post(client, url, payload) for payload in data]
+        responses = await asyncio.gather(*tasks)
     outputs = [r.json()["output"] for r in responses]
     return outputs
 
@@ -22,10 +23,19 @@ questions = [
 ]
 
 
-request_bodies = [{"text": q} for q in questions]
+request_count = 0
+for concurrency in CONCURRENCY_LEVELS:
+    # Mỗi câu hỏi có hậu tố (#i) riêng, kể cả giữa các mức concurrency, để cache câu trả lời,
+    # cache LLM và single-flight không gộp các request lại; mọi request đều chạy agent
+    request_bodies = [
+        {"text": questions[i % len(questions)].strip() + f" (#{i})"}
+        for i in range(request_count, request_count + concurrency)
+    ]
+    request_count += concurrency
 
-start_time = time.perf_counter()
-outputs = asyncio.run(make_bulk_requests(CHATBOT_URL, request_bodies))
-end_time = time.perf_counter()
+    start_time = time.perf_counter()
+    outputs = asyncio.run(make_bulk_requests(CHATBOT_URL, request_bodies))
+    end_time = time.perf_counter()
 
-print(f"Run time: {end_time - start_time} seconds")
\ No newline at end of file
+    run_time = end_time - start_time
+    print(f"Concurrency {concurrency}: run time {run_time:.2f} seconds, {concurrency / run_time:.2f} requests/sec")
@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "chatbot_api", "src"))
+
+from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+from chains.only_vector_chain import ChunkedEmbedding
+
+NUM_DOCUMENTS = int(os.getenv("BENCHMARK_NUM_DOCUMENTS", "256"))
+BATCH_SIZES = [16, 64, 128]
+
+article = (
+    "Tổ chức, cá nhân sản xuất, kinh doanh sản phẩm, hàng hóa nhóm 2 phải công bố hợp quy "
+    "phù hợp với quy chuẩn kỹ thuật quốc gia tương ứng và chịu trách nhiệm về chất lượng. "
+)
+# Độ dài văn bản khác nhau giống các node Noidung thật: từ một câu đến vài nghìn ký tự
+documents = [article * (1 + i % 12) for i in range(NUM_DOCUMENTS)]
+
+base_embedder = HuggingFaceEmbeddings(
+    model_name="NghiemAbe/Vi-Legal-Bi-Encoder-v2",
+    model_kwargs={'device': 'cpu'},
+    encode_kwargs={'normalize_embeddings': True}
+)
+
+
+def run(embedder):
+    start_time = time.perf_counter()
+    embedder.embed_documents(documents)
+    return NUM_DOCUMENTS / (time.perf_counter() - start_time)
+
+
+# Làm nóng model trước khi đo
+base_embedder.embed_documents(documents[:4])
+
+print(f"Per-document loop: {run(ChunkedEmbedding(base_embedder, batched=False)):.1f} docs/sec")
+for batch_size in BATCH_SIZES:
+    docs_per_sec = run(ChunkedEmbedding(base_embedder, batch_size=batch_size))
+    print(f"Batched (batch_size={batch_size}): {docs_per_sec:.1f} docs/sec")
@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "chatbot_api", "src"))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from chains.context_packer import ContextPacker
+from chains.local_vector_index import LocalVectorIndex
+from chains.only_cypher_chain import qa_generation_prompt
+from chains.only_vector_chain import ChunkedEmbedding
+from stand_ins import SAMPLE_PASSAGES, HashEmbeddings
+
+# Chạy offline với embedder giả (mặc định) hoặc một model nhỏ có sẵn trên máy:
+#   python tests/benchmark_components.py --output components.json
+#   python tests/benchmark_components.py --model ./models/small-bi-encoder --baseline components.json
+parser = argparse.ArgumentParser(description="Micro-benchmarks of the vector chain hot paths")
+parser.add_argument("--model", help="local sentence-transformers model path, default is a hash embedder")
+parser.add_argument("--dim", type=int, default=768, help="embedding size for the hash embedder and corpora")
+parser.add_argument("--sizes", default="10000,100000,1000000", help="corpus sizes for the top-k benchmark")
+parser.add_argument("--repeat", type=int, default=5)
+parser.add_argument("--output", default="benchmark_components.json")
+parser.add_argument("--baseline", help="earlier results file; slower or larger results are reported")
+parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression against the baseline")
+args = parser.parse_args()
+
+results = {}
+
+
+def measure(name: str, fn, repeat: int = args.repeat, **info):
+    """Record median/min wall time over ``repeat`` runs and the peak traced memory of one run."""
+    fn()  # làm nóng
+    durations = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start_time)
+
+    # Đo bộ nhớ ở một lần chạy riêng vì tracemalloc làm chậm đáng kể
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results[name] = {
+        "median_ms": statistics.median(durations) * 1000,
+        "min_ms": min(durations) * 1000,
+        "peak_kb": peak / 1024,
+        **info,
+    }
+    print(f"{name:<48}{results[name]['median_ms']:>12.2f} ms{results[name]['peak_kb']:>14.0f} KiB")
+
+
+def article(num_chars: int) -> str:
+    text = " ".join(SAMPLE_PASSAGES)
+    return (text * (num_chars // len(text) + 1))[:num_chars]
+
+
+if args.model:
+    from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+    base_embedder = HuggingFaceEmbeddings(
+        model_name=args.model,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+else:
+    base_embedder = HashEmbeddings(dim=args.dim)
+
+print(f"{'benchmark':<48}{'median':>15}{'peak memory':>18}")
+
+# 1. Chia văn bản dài bằng RecursiveCharacterTextSplitter
+splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, length_function=len)
+for num_chars in (2_000, 20_000, 200_000):
+    text = article(num_chars)
+    measure(f"split/{num_chars}_chars", lambda: splitter.split_text(text), chars=num_chars)
+
+# 2. ChunkedEmbedding.embed_documents theo batch size và độ dài văn bản
+for num_chars in (300, 2_000, 10_000):
+    documents = [article(num_chars + i) for i in range(64)]
+    for batch_size in (16, 64, 128):
+        embedder = ChunkedEmbedding(base_embedder, batch_size=batch_size)
+        measure(f"embed_documents/{num_chars}_chars/batch_{batch_size}",
+                lambda: embedder.embed_documents(documents), repeat=max(1, args.repeat // 2),
+                documents=len(documents))
+
+# 3. embed_query
+embedder = ChunkedEmbedding(base_embedder)
+for num_chars in (60, 300):
+    query = article(num_chars)
+    measure(f"embed_query/{num_chars}_chars", lambda: embedder.embed_query(query))
+
+# 4. Mean pooling các chunk về văn bản: embed_documents_batched (segment-reduce) so với đường từng văn bản.
+# Chunk đã chia sẵn và vector tính sẵn để thời gian đo là của chính phần pooling, không phải splitter/model.
+class PresplitSplitter:
+    def __init__(self, chunks_by_text: dict):
+        self.split_text = chunks_by_text.__getitem__
+
+
+class PrecomputedEmbeddings:
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return self.vectors[:len(texts)]
+
+
+rng = np.random.default_rng(0)
+chunk_counts = rng.integers(1, 8, size=10_000)
+pooling_documents = [f"văn bản {i}" for i in range(len(chunk_counts))]
+chunks_by_text = {text: [f"{text} / chunk {j}" for j in range(count)]
+                  for text, count in zip(pooling_documents, chunk_counts)}
+pooling_embedder = PrecomputedEmbeddings(
+    rng.standard_normal((int(chunk_counts.sum()), args.dim), dtype=np.float32))
+for batched in (True, False):
+    embedder = ChunkedEmbedding(pooling_embedder, batch_size=len(pooling_embedder.vectors), batched=batched)
+    embedder.text_splitter = PresplitSplitter(chunks_by_text)
+    measure(f"mean_pooling/{'batched' if batched else 'per_document'}_10k_docs",
+            lambda: embedder.embed_documents(pooling_documents), repeat=max(1, args.repeat // 2),
+            documents=len(pooling_documents))
+
+# 5. Ghép context và render prompt
+documents = [
+    Document(page_content=f"\ncontent: {article(400 + 37 * i)}\nid: noidung-{i}") for i in range(10)
+]
+packer = ContextPacker()
+measure("prompt/context_pack_10_docs", lambda: packer.pack(documents))
+rows = [{"title": f"Điều {i}", "content": article(300)} for i in range(20)]
+measure("prompt/qa_render_20_rows", lambda: qa_generation_prompt.format(context=rows, question=SAMPLE_PASSAGES[0]))
+
+# 6. Top-k trên corpus tổng hợp, ghi thẳng ra snapshot dạng memmap như LocalVectorIndex
+query_embedding = rng.standard_normal(args.dim).astype(np.float32)
+with tempfile.TemporaryDirectory(prefix="benchmark-components-") as workdir:
+    for size in (int(s) for s in args.sizes.split(",")):
+        path = os.path.join(workdir, f"corpus_{size}")
+        os.makedirs(path)
+        with open(os.path.join(path, "embeddings.f32"), "wb") as f:
+            for start in range(0, size, 50_000):
+                block = rng.standard_normal((min(50_000, size - start), args.dim), dtype=np.float32)
+                block /= np.linalg.norm(block, axis=1, keepdims=True)
+                block.tofile(f)
+        with open(os.path.join(path, "nodes.json"), "w", encoding="utf-8") as f:
+            nodes = [{"element_id": str(i), "id": str(i), "content": ""} for i in range(size)]
+            json.dump({"dim": args.dim, "nodes": nodes}, f)
+        del nodes
+
+        index = LocalVectorIndex(path, use_hnsw=False)
+        measure(f"top_k/{size}_vectors", lambda: index.search(query_embedding, k=10), vectors=size)
+        # Giải phóng memmap trước khi xoá corpus
+        del index
+
+with open(args.output, "w", encoding="utf-8") as f:
+    json.dump(results, f, indent=2)
+print(f"results written to {os.path.abspath(args.output)}")
+
+if args.baseline:
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        # min_ms ít nhiễu hơn median khi máy đang bận
+        for metric in ("min_ms", "peak_kb"):
+            if old[metric] and result[metric] > old[metric] * (1 + args.tolerance):
+                regressions.append(f"{name} {metric}: {old[metric]:.2f} -> {result[metric]:.2f}")
+    print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} against {args.baseline}")
+    for regression in regressions:
+        print(f"  {regression}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,74 @@
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "chatbot_api", "src"))
+
+from chains.lexical_index import LexicalIndex, SYLLABLE_PATTERN, reciprocal_rank_fusion
+from chains.local_vector_index import LocalVectorIndex
+from chains.only_vector_chain import get_chunked_embedder
+
+# Chạy sau khi đã xuất snapshot: python -m chains.local_vector_index export
+NUM_QUERIES = int(os.getenv("BENCHMARK_NUM_QUERIES", "200"))
+K = 10
+
+random.seed(0)
+vector_index = LocalVectorIndex()
+nodes = vector_index.nodes
+
+start_time = time.perf_counter()
+lexical_index = LexicalIndex()
+lexical_index.add_documents(nodes)
+lexical_index.compact()
+print(f"BM25 build: {len(nodes)} documents in {time.perf_counter() - start_time:.2f} seconds")
+
+# Câu hỏi tổng hợp: một đoạn 6-12 âm tiết lấy từ một node, node đó là kết quả đúng
+queries = []
+for row in random.sample(range(len(nodes)), min(NUM_QUERIES, len(nodes))):
+    syllables = SYLLABLE_PATTERN.findall(nodes[row]["content"] or "")
+    if len(syllables) < 6:
+        continue
+    length = random.randint(6, min(12, len(syllables)))
+    start = random.randint(0, len(syllables) - length)
+    queries.append((" ".join(syllables[start:start + length]), row))
+
+row_by_content = {vector_index.to_document(row, 0).page_content: row for row in range(len(nodes))}
+
+embedder = get_chunked_embedder()
+query_embeddings = [embedder.embed_query(q) for q, _ in queries]
+
+
+def evaluate(name, search):
+    hits, latencies = 0, []
+    for (query, row), embedding in zip(queries, query_embeddings):
+        start_time = time.perf_counter()
+        rows = search(query, embedding)
+        latencies.append(time.perf_counter() - start_time)
+        hits += row in rows
+    print(
+        f"{name}: recall@{K} {hits / len(queries):.3f}, "
+        f"p50 {np.percentile(latencies, 50) * 1000:.2f} ms, p99 {np.percentile(latencies, 99) * 1000:.2f} ms"
+    )
+
+
+def vector_search(query, embedding):
+    return [row for row, _ in vector_index.search(embedding, K)]
+
+
+def lexical_search(query, embedding):
+    return [row for row, _ in lexical_index.search(query, K)]
+
+
+def fusion_search(query, embedding):
+    vector_documents = [vector_index.to_document(row, score) for row, score in vector_index.search(embedding, K)]
+    lexical_documents = lexical_index.search_documents(query, K)
+    fused = reciprocal_rank_fusion([vector_documents, lexical_documents], K)
+    return [row_by_content[document.page_content] for document in fused]
+
+
+evaluate("vector only", vector_search)
+evaluate("bm25 only", lexical_search)
+evaluate("vector + bm25 (rrf)", fusion_search)
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "chatbot_api", "src"))
+
+from chains.local_vector_index import LocalVectorIndex, LocalVectorRetriever
+from chains.only_vector_chain import Neo4jVectorIndex, get_chunked_embedder
+
+NUM_RUNS = int(os.getenv("BENCHMARK_NUM_RUNS", "50"))
+
+questions = [
+"Các sản phẩm, hàng hóa nhóm 2 được miễn chứng nhận hợp quy, công bố hợp quy cần đáp ứng những yêu cầu nào?",
+"Các loại hình kiểm tra của đăng kiểm đối với tàu quân sự là gì? ",
+"Các nguyên tắc quản lý sản phẩm, hàng hóa nhóm 2 là gì?",
+]
+
+
+def measure(search, embeddings):
+    latencies = []
+    for i in range(NUM_RUNS):
+        embedding = embeddings[i % len(embeddings)]
+        start_time = time.perf_counter()
+        search(embedding)
+        latencies.append(time.perf_counter() - start_time)
+    return np.percentile(latencies, 50) * 1000, np.percentile(latencies, 99) * 1000
+
+
+# Embedding câu hỏi được tính trước để chỉ đo thời gian tìm kiếm
+embedder = get_chunked_embedder()
+embeddings = [embedder.embed_query(q) for q in questions]
+
+neo4j_index = Neo4jVectorIndex().vector_index
+local_index = LocalVectorIndex()
+retriever = LocalVectorRetriever(index=local_index, embedder=embedder, k=10)
+
+results = {
+    "neo4j": measure(lambda e: neo4j_index.similarity_search_by_vector(e, k=10), embeddings),
+    "local (numpy)": measure(lambda e: local_index.search(e, k=10), embeddings),
+}
+if local_index.hnsw is not None:
+    results["local (hnsw)"] = results.pop("local (numpy)")
+
+for name, (p50, p99) in results.items():
+    print(f"{name}: p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+# Kiểm tra kết quả hai retriever có trùng nhau không
+neo4j_ids = {d.page_content for d in neo4j_index.similarity_search_by_vector(embeddings[0], k=10)}
+local_ids = {d.page_content for d in retriever.invoke(questions[0])}
+print(f"Top-10 overlap: {len(neo4j_ids & local_ids)}/10")
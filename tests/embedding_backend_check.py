@@ -0,0 +1,34 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "chatbot_api", "src"))
+
+from utils.model_registry import get_embedder  # noqa: E402
+
+# So sánh embedding của ONNX / ONNX int8 với PyTorch trên model thật (cần tải model từ Hugging Face):
+#   python tests/embedding_backend_check.py --backends onnx,onnx-int8
+parser = argparse.ArgumentParser(description="Parity of the ONNX query embedders against the PyTorch output")
+parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+args = parser.parse_args()
+
+MIN_SIMILARITY = {"torch": 0.9999, "onnx": 0.999, "onnx-int8": 0.98}
+QUERIES = [
+    "Các nguyên tắc quản lý sản phẩm, hàng hóa nhóm 2 là gì?",
+    "Các sản phẩm, hàng hóa nhóm 2 được miễn chứng nhận hợp quy, công bố hợp quy cần đáp ứng những yêu cầu nào?",
+    "Các loại hình kiểm tra của đăng kiểm đối với tàu quân sự là gì?",
+]
+
+reference = np.array([get_embedder("torch").embed_query(q) for q in QUERIES])
+for backend in args.backends.split(","):
+    embedder = get_embedder(backend)
+    start_time = time.perf_counter()
+    result = np.array([embedder.embed_query(q) for q in QUERIES])
+    elapsed = (time.perf_counter() - start_time) / len(QUERIES)
+    similarity = np.sum(reference * result, axis=1)
+    print(f"{backend}: min cosine {similarity.min():.5f}, {elapsed * 1000:.1f} ms/query")
+    assert similarity.min() >= MIN_SIMILARITY[backend], f"{backend} diverges from the PyTorch output"
+print("OK")
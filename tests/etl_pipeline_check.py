@@ -0,0 +1,144 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "graphrag_neo4j_etl", "src"))
+
+from stand_ins import SAMPLE_PASSAGES, HashEmbeddings  # noqa: E402  (thêm chatbot_api/src vào sys.path)
+
+from chains.only_vector_chain import ChunkedEmbedding  # noqa: E402
+from chains.reindex import content_hash  # noqa: E402
+from graph_writer import InMemoryGraphWriter  # noqa: E402
+from phap_dien_etl import Checkpoint, PhapDienEtl  # noqa: E402
+from phap_dien_parser import iter_records  # noqa: E402
+
+# Chạy offline trên corpus Pháp điển tổng hợp, ghi vào graph trong bộ nhớ:
+#   python tests/etl_pipeline_check.py --files 20 --articles 200 --workers 2
+parser = argparse.ArgumentParser(description="End-to-end check of the Pháp điển ETL against an in-memory graph")
+parser.add_argument("--files", type=int, default=6)
+parser.add_argument("--articles", type=int, default=60, help="articles per file")
+parser.add_argument("--batch-size", type=int, default=16)
+parser.add_argument("--workers", type=int, default=2)
+args = parser.parse_args()
+
+
+def hash_chunked_embedder():
+    return ChunkedEmbedding(HashEmbeddings(dim=64))
+
+
+def write_corpus(directory: str):
+    """Đề mục files shaped like the Pháp điển export: chapters, anchors, notes and <br> inside content."""
+    for f in range(args.files):
+        parts = [f"<html><head><title>Đề mục {f} &amp; khoa học</title></head><body><div class='_content'>"]
+        for a in range(args.articles):
+            # File chẵn có chương, file lẻ thì Điều nằm thẳng dưới đề mục
+            if f % 2 == 0 and a % 20 == 0:
+                parts.append(f'<a name="C{f}_{a}"></a><p class="pChuong">Chương {a // 20 + 1} QUY ĐỊNH</p>')
+            parts.append(f'<a name="D{f}_{a}"></a><p class="pDieu">Điều {f}.{a}.LQ.{a}. Tiêu đề {a}</p>')
+            parts.append(f'<p class="pGhiChu">(Điều {a} Luật số {f}/2013/QH13)</p>')
+            passage = SAMPLE_PASSAGES[(f + a) % len(SAMPLE_PASSAGES)]
+            parts.append(f'<p class="pNoiDung">{passage * (1 + a % 7)}<br>1. <b>Khoản</b> {a}</p>')
+            if a % 3 == 0:
+                parts.append(f'<p class="pNoiDung">Đoạn bổ sung của điều {a}.</p>')
+        parts.append("</div></body></html>")
+        with open(os.path.join(directory, f"demuc_{f:03d}.html"), "w", encoding="utf-8") as out:
+            out.write("\n".join(parts))
+
+
+class CrashingWriter(InMemoryGraphWriter):
+    """Fails after ``crash_after`` batches, like a process killed in the middle of a load."""
+
+    def __init__(self, crash_after: int):
+        super().__init__()
+        self.crash_after = crash_after
+
+    def write_batch(self, rows):
+        if self.batches == self.crash_after:
+            raise RuntimeError("simulated crash")
+        super().write_batch(rows)
+
+
+workdir = tempfile.mkdtemp(prefix="etl-check-")
+source_dir = os.path.join(workdir, "phap_dien")
+os.makedirs(source_dir)
+write_corpus(source_dir)
+total_records = args.files * args.articles
+
+try:
+    # 1. Chạy một lượt đầy đủ, so số node và quan hệ với corpus
+    clean = InMemoryGraphWriter()
+    stats = PhapDienEtl(clean, Checkpoint(None), embedder_factory=hash_chunked_embedder,
+                        batch_size=args.batch_size, embed_workers=args.workers, report_every=0).run(source_dir)
+    counts = clean.counts()
+    chapters = sum(len(range(0, args.articles, 20)) for f in range(args.files) if f % 2 == 0)
+    assert stats["rows"] == total_records, stats
+    assert counts["Demuc"] == args.files and counts["Dieu"] == total_records and counts["Chuong"] == chapters, counts
+    assert counts["Noidung"] == total_records and counts["relationships"] == 2 * total_records + chapters, counts
+    print(f"clean run: {stats['rows']} rows in {stats['elapsed_s']:.2f}s, {stats['rows_per_s']:.1f} rows/sec "
+          f"with {args.workers} embedding worker(s)")
+
+    # 2. Vector từ các tiến trình con giống hệt vector tính trong tiến trình chính
+    records = list(iter_records(os.path.join(source_dir, "demuc_000.html")))
+    expected = hash_chunked_embedder().embed_documents([r["content"] for r in records[:5]])
+    for record, embedding in zip(records, expected):
+        node = clean.nodes["Noidung"][record["id"]]
+        assert np.allclose(node["embedding"], embedding, atol=1e-6)
+        # Cùng hash với chains.reindex nên lần reindex sau không embed lại các node vừa nạp
+        assert node["content_hash"] == content_hash(record["content"])
+        assert node["embedding_model"] == "stand-in/hash-embeddings"
+    assert "<br>" not in records[0]["content"] and "\n1. Khoản 0" in records[0]["content"]
+    assert clean.nodes["Demuc"]["demuc_000"]["title"] == "Đề mục 0 & khoa học"
+
+    # 3. Dừng giữa chừng rồi chạy tiếp từ checkpoint, không embed lại phần đã ghi
+    checkpoint_path = os.path.join(workdir, "checkpoint.json")
+    crash_after = max(1, total_records // args.batch_size // 2)
+    crashed = CrashingWriter(crash_after)
+    try:
+        PhapDienEtl(crashed, Checkpoint(checkpoint_path), embedder_factory=hash_chunked_embedder,
+                    batch_size=args.batch_size, embed_workers=args.workers, report_every=0).run(source_dir)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("the writer did not crash")
+    written_before = len(crashed.nodes["Noidung"])
+
+    resumed = PhapDienEtl(InMemoryGraphWriter(), Checkpoint(checkpoint_path),
+                          embedder_factory=hash_chunked_embedder, batch_size=args.batch_size,
+                          embed_workers=args.workers, report_every=0)
+    # Graph ở lượt chạy lại là graph đã có dữ liệu của lượt trước
+    resumed.writer.nodes, resumed.writer.relationships = crashed.nodes, crashed.relationships
+    stats = resumed.run(source_dir)
+    assert stats["rows"] == total_records - written_before, (stats, written_before)
+    assert resumed.writer.counts() == counts, resumed.writer.counts()
+
+    # 4. Chạy lại khi mọi file đã xong thì không ghi gì
+    stats = PhapDienEtl(InMemoryGraphWriter(), Checkpoint(checkpoint_path), embedder_factory=hash_chunked_embedder,
+                        batch_size=args.batch_size, embed_workers=0, report_every=0).run(source_dir)
+    assert stats["rows"] == 0 and stats["files_skipped"] == args.files, stats
+
+    # 5. File sửa lại mà giữ nguyên kích thước vẫn được nạp lại nhờ mtime trong khoá checkpoint
+    changed = sorted(os.listdir(source_dir))[0]
+    changed_stat = os.stat(os.path.join(source_dir, changed))
+    os.utime(os.path.join(source_dir, changed), ns=(changed_stat.st_atime_ns, changed_stat.st_mtime_ns + 10**9))
+    stats = PhapDienEtl(InMemoryGraphWriter(), Checkpoint(checkpoint_path), embedder_factory=None,
+                        batch_size=args.batch_size, embed_workers=0, report_every=0).run(source_dir)
+    assert stats["files"] == 1 and stats["files_skipped"] == args.files - 1, stats
+
+    # 6. Thư mục nguồn thiếu hoặc rỗng là lỗi, không phải một lần nạp 0 file
+    empty_dir = os.path.join(workdir, "empty")
+    os.makedirs(empty_dir)
+    for missing in (empty_dir, os.path.join(workdir, "missing")):
+        try:
+            PhapDienEtl(InMemoryGraphWriter(), Checkpoint(None), embedder_factory=None).run(missing)
+        except FileNotFoundError:
+            pass
+        else:
+            raise AssertionError(f"no error for the source directory {missing}")
+    print(f"resume: {written_before} rows written before the crash, {total_records - written_before} after")
+    print("etl checks passed")
+finally:
+    shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+
+import httpx
+import numpy as np
+
+import stand_ins
+
+# Chạy offline, không cần Groq hay Neo4j:
+#   python tests/load_test.py --requests 200 --concurrency 16 --mode hybrid --output load_test.json
+#   python tests/load_test.py --rate 20 --baseline load_test.json
+parser = argparse.ArgumentParser(description="In-process load test of the RAG API against local stand-ins")
+parser.add_argument("--requests", type=int, default=200)
+parser.add_argument("--concurrency", type=int, default=8, help="maximum requests in flight")
+parser.add_argument("--rate", type=float, default=0.0, help="Poisson arrival rate in requests/sec, 0 = closed loop")
+parser.add_argument("--mode", choices=["agent", "hybrid"], default="agent")
+parser.add_argument("--nodes", type=int, default=500)
+parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds before the first token")
+parser.add_argument("--tokens-per-second", type=float, default=300.0)
+parser.add_argument("--answer-tokens", type=int, default=80)
+parser.add_argument("--neo4j-latency", type=float, default=0.01)
+parser.add_argument("--embedding-latency", type=float, default=0.0)
+parser.add_argument("--output", default="load_test_results.json")
+parser.add_argument("--baseline", help="earlier results file to compare p50/p95 against")
+args = parser.parse_args()
+
+stand_ins.install(
+    num_nodes=args.nodes,
+    llm_latency=args.llm_latency,
+    tokens_per_second=args.tokens_per_second,
+    answer_tokens=args.answer_tokens,
+    neo4j_latency=args.neo4j_latency,
+    embedding_latency=args.embedding_latency,
+)
+
+import main  # noqa: E402  (phải import sau khi cài stand-in)
+
+
+def percentiles(values) -> dict:
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {}
+    return {
+        "count": int(len(values)),
+        "mean_ms": float(values.mean() * 1000),
+        "p50_ms": float(np.percentile(values, 50) * 1000),
+        "p95_ms": float(np.percentile(values, 95) * 1000),
+        "p99_ms": float(np.percentile(values, 99) * 1000),
+    }
+
+
+async def run_load():
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, timings, errors = [], [], []
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=300) as client:
+        async def one_request(i: int):
+            body = {
+                "text": stand_ins.SAMPLE_QUESTIONS[i % len(stand_ins.SAMPLE_QUESTIONS)] + f" (#{i})",
+                "mode": args.mode,
+                "include_timings": True,
+            }
+            async with semaphore:
+                start_time = time.perf_counter()
+                try:
+                    response = await client.post("/rag-agent", json=body)
+                    response.raise_for_status()
+                except Exception as e:
+                    errors.append(str(e))
+                    return
+                latencies.append(time.perf_counter() - start_time)
+                timings.append(response.json().get("timings") or {})
+
+        start_time = time.perf_counter()
+        tasks = []
+        for i in range(args.requests):
+            tasks.append(asyncio.create_task(one_request(i)))
+            if args.rate > 0:
+                await asyncio.sleep(random.expovariate(args.rate))
+        await asyncio.gather(*tasks)
+        duration = time.perf_counter() - start_time
+    return latencies, timings, errors, duration
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+random.seed(0)
+latencies, timings, errors, duration = asyncio.run(run_load())
+
+stages = sorted({stage for timing in timings for stage in timing if not stage.endswith("_tokens")})
+results = {
+    "commit": git_commit(),
+    "config": vars(args),
+    "requests": args.requests,
+    "errors": len(errors),
+    "duration_s": duration,
+    "throughput_rps": len(latencies) / duration if duration else 0.0,
+    "latency": {"end_to_end": percentiles(latencies)},
+    "stages": {stage: percentiles([t[stage] for t in timings if stage in t]) for stage in stages},
+    "tokens_per_request": {
+        kind: float(np.mean([t.get(kind, 0) for t in timings])) if timings else 0.0
+        for kind in ("prompt_tokens", "completion_tokens")
+    },
+}
+
+with open(args.output, "w", encoding="utf-8") as f:
+    json.dump(results, f, ensure_ascii=False, indent=2)
+
+print(f"{len(latencies)}/{args.requests} ok in {duration:.2f}s, {results['throughput_rps']:.2f} requests/sec")
+if errors:
+    print(f"first error: {errors[0]}")
+print(f"{'stage':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+for stage, stats in [("end_to_end", results["latency"]["end_to_end"]), *results["stages"].items()]:
+    if stats:
+        print(f"{stage:<28}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+print(f"results written to {os.path.abspath(args.output)}")
+
+if args.baseline:
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {args.baseline} (commit {baseline.get('commit')}):")
+    base_stages = {"end_to_end": baseline["latency"]["end_to_end"], **baseline["stages"]}
+    new_stages = {"end_to_end": results["latency"]["end_to_end"], **results["stages"]}
+    for stage in sorted(set(base_stages) & set(new_stages)):
+        old, new = base_stages[stage], new_stages[stage]
+        if old and new:
+            change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+            print(f"{stage:<28} p95 {old['p95_ms']:>9.1f} -> {new['p95_ms']:>9.1f} ms ({change:+.1f}%)")
+    print(f"{'throughput':<28}     {baseline['throughput_rps']:>9.2f} -> {results['throughput_rps']:>9.2f} requests/sec")
@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "chatbot_api", "src"))
+
+# agents.query_router nạp các agent, chúng đọc tên model từ biến môi trường khi import
+for name in ("AGENT_MODEL", "CYPHER_MODEL", "QA_MODEL", "VECTOR_MODEL", "HYBRID_MODEL"):
+    os.environ.setdefault(name, "stand-in-llm")
+os.environ.setdefault("GROQ_API_KEY", "stand-in")
+
+from agents.query_router import (  # noqa: E402
+    AGENT, OUT_OF_DOMAIN, QUERY_ROUTER_MARGIN, QUERY_ROUTER_THRESHOLD, ROUTES, QueryRouter,
+)
+
+# Đánh giá bộ định tuyến câu hỏi trên tập câu hỏi có nhãn, khác với các prototype (cần model thật):
+#   python tests/query_router_eval.py
+#   python tests/query_router_eval.py --threshold 0.55 --margin 0.03 --questions labelled.json
+#   python tests/query_router_eval.py --embedder hash   # chạy offline, chỉ kiểm tra script
+parser = argparse.ArgumentParser(description="Accuracy and refusal false-positive rate of the query router")
+parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                    help="the configured query embedder, or the offline hash stand-in")
+parser.add_argument("--questions", help='JSON file {"label": ["question", ...]} replacing the built-in set')
+parser.add_argument("--threshold", type=float, default=QUERY_ROUTER_THRESHOLD)
+parser.add_argument("--margin", type=float, default=QUERY_ROUTER_MARGIN)
+parser.add_argument("--max-refusal-fpr", type=float, default=0.0,
+                    help="highest allowed share of in-domain questions answered with the out-of-domain reply")
+args = parser.parse_args()
+
+LABELLED_QUESTIONS = {
+    OUT_OF_DOMAIN: [
+        "Chào buổi sáng",
+        "Bạn có khỏe không?",
+        "Tối nay nên xem phim gì?",
+        "Công thức làm bánh flan",
+        "Tỷ giá đô la hôm nay là bao nhiêu?",
+        "Thủ tục đăng ký kết hôn với người nước ngoài",
+        "Người lao động nghỉ thai sản được hưởng bao nhiêu tháng lương?",
+        "Mức phạt nồng độ cồn khi lái ô tô",
+        "Dịch giúp tôi câu này sang tiếng Anh",
+        "Ai là người giàu nhất thế giới?",
+    ],
+    "vector": [
+        "Tổ chức khoa học và công nghệ có những quyền tự chủ nào?",
+        "Nhiệm vụ khoa học và công nghệ cấp quốc gia được tuyển chọn như thế nào?",
+        "Sản phẩm, hàng hóa nhóm 2 được miễn chứng nhận hợp quy khi nào?",
+        "Các loại hình kiểm tra của đăng kiểm đối với tàu quân sự là gì?",
+        "Góp vốn bằng công nghệ có phải là hình thức chuyển giao công nghệ không?",
+        "Nhà nước khuyến khích đầu tư cho khoa học và công nghệ bằng những chính sách nào?",
+        "Công bố hợp quy đối với hàng hóa nhập khẩu được thực hiện ra sao?",
+        "Phương tiện đo nhóm 2 phải đáp ứng yêu cầu gì?",
+    ],
+    "cypher": [
+        "Điều 7 Luật Chuyển giao công nghệ quy định gì?",
+        "Chương III Luật Khoa học và công nghệ có những điều nào?",
+        "Liệt kê các chương của Luật Đo lường",
+        "Luật Tiêu chuẩn và quy chuẩn kỹ thuật có bao nhiêu điều?",
+        "Điều 15 thuộc chương nào của Luật Chuyển giao công nghệ?",
+        "Đề mục Tiêu chuẩn, đo lường, chất lượng gồm những luật nào?",
+        "Cho tôi tiêu đề các điều trong Chương II Luật Năng lượng nguyên tử",
+        "Nội dung Điều 4 Luật Khoa học và công nghệ",
+    ],
+    "hybrid": [
+        "Theo Điều 9 Luật Chuyển giao công nghệ, công nghệ nào được khuyến khích chuyển giao và tại sao?",
+        "Chương V Luật Khoa học và công nghệ quy định những ưu đãi nào cho tổ chức nghiên cứu?",
+        "Những điều nào trong Luật Đo lường quy định về chuẩn đo lường và nội dung chính là gì?",
+        "Điều 34 Luật Tiêu chuẩn và quy chuẩn kỹ thuật quy định thủ tục ban hành quy chuẩn thế nào?",
+        "So sánh quy định về thẩm định công nghệ tại Chương II với các trường hợp bị cấm chuyển giao",
+        "Các điều của Luật Khoa học và công nghệ về quỹ phát triển khoa học quy định nguồn vốn ra sao?",
+    ],
+}
+
+if args.questions:
+    with open(args.questions, encoding="utf-8") as f:
+        LABELLED_QUESTIONS = json.load(f)
+unknown = set(LABELLED_QUESTIONS) - set(ROUTES)
+assert not unknown, f"unknown labels {sorted(unknown)}, expected {ROUTES}"
+
+if args.embedder == "hash":
+    from stand_ins import HashEmbeddings
+
+    embedder = HashEmbeddings()
+else:
+    from utils.model_registry import get_query_embedder
+
+    embedder = get_query_embedder()
+router = QueryRouter(embedder=embedder, threshold=args.threshold, margin=args.margin)
+
+confusion = Counter()
+for label, questions in LABELLED_QUESTIONS.items():
+    for question in questions:
+        route, score = router.classify(router.embed(question))
+        confusion[label, route] += 1
+        if route != label:
+            print(f"  {label:>14} -> {route:<14} {score:.3f}  {question}")
+
+total = sum(confusion.values())
+correct = sum(count for (label, route), count in confusion.items() if route == label)
+routed = sum(count for (_, route), count in confusion.items() if route != AGENT)
+routed_correct = sum(count for (label, route), count in confusion.items() if route == label != AGENT)
+in_domain = sum(count for (label, _), count in confusion.items() if label != OUT_OF_DOMAIN)
+false_refusals = sum(count for (label, route), count in confusion.items()
+                     if label != OUT_OF_DOMAIN and route == OUT_OF_DOMAIN)
+refusal_fpr = false_refusals / in_domain if in_domain else 0.0
+
+print(f"\nthreshold {args.threshold}, margin {args.margin}, {total} questions")
+print(f"{'label':>14}" + "".join(f"{route:>15}" for route in ROUTES + (AGENT,)))
+for label in LABELLED_QUESTIONS:
+    print(f"{label:>14}" + "".join(f"{confusion[label, route]:>15}" for route in ROUTES + (AGENT,)))
+print(f"accuracy {correct / total:.1%} (agent fallback counts as a miss)")
+print(f"routed accuracy {routed_correct / routed if routed else 0.0:.1%}, coverage {routed / total:.1%}")
+print(f"refusal false-positive rate {refusal_fpr:.1%} ({false_refusals}/{in_domain} in-domain questions refused)")
+
+assert refusal_fpr <= args.max_refusal_fpr, "in-domain questions were answered with the out-of-domain reply"
+print("OK")
@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import os
+import time
+
+import numpy as np
+
+os.environ.setdefault("GROQ_API_KEY", "stand-in")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+import stand_ins  # noqa: E402  (thêm chatbot_api/src vào sys.path)
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+
+from utils import metrics, resilience  # noqa: E402
+from utils.llm import get_chat_model  # noqa: E402
+from utils.rate_limiter import BATCH, INTERACTIVE, RateLimitExceeded, priority, rate_limiter  # noqa: E402
+
+# Chạy offline một đợt gọi Groq dồn dập vào API giả có giới hạn RPM/TPM, có và không có rate limiter:
+#   python tests/rate_limit_check.py --requests 40 --rpm 20 --deadline 10
+parser = argparse.ArgumentParser(description="Burst of chat model calls against a rate-limited Groq stand-in")
+parser.add_argument("--requests", type=int, default=40)
+parser.add_argument("--rpm", type=float, default=20)
+parser.add_argument("--tpm", type=float, default=100000)
+parser.add_argument("--deadline", type=float, default=10.0, help="request deadline in seconds")
+parser.add_argument("--llm-latency", type=float, default=0.05)
+parser.add_argument("--headroom", type=float, default=0.05,
+                    help="share of the API's RPM left unused: a granted call reaches the API a moment later")
+args = parser.parse_args()
+
+MODEL = "stand-in-groq"
+
+
+def reset(enabled: bool, rpm: float = args.rpm, tpm: float = args.tpm,
+          configured_rpm: float = 0) -> stand_ins.RateLimitedGroq:
+    rate_limiter.enabled = enabled
+    rate_limiter.limits = {MODEL: (configured_rpm or rpm * (1 - args.headroom), tpm)}
+    rate_limiter.schedulers.clear()
+    resilience.stages["groq"].breaker = resilience.CircuitBreaker("groq")
+    return stand_ins.RateLimitedGroq(rpm, tpm, latency=args.llm_latency).patch()
+
+
+async def one_call(llm, i: int) -> dict:
+    start = time.perf_counter()
+    with resilience.deadline(args.deadline):
+        try:
+            await llm.ainvoke([HumanMessage(content=f"Câu hỏi số {i} về chuyển giao công nghệ?")])
+            outcome = "ok"
+        except RateLimitExceeded:
+            outcome = "shed"
+        except (resilience.StageUnavailableError, resilience.DeadlineExceeded):
+            outcome = "failed"
+    return {"outcome": outcome, "seconds": time.perf_counter() - start}
+
+
+async def burst(enabled: bool, configured_rpm: float = 0) -> dict:
+    api = reset(enabled, configured_rpm=configured_rpm)
+    llm = get_chat_model(MODEL)
+    results = await asyncio.gather(*(one_call(llm, i) for i in range(args.requests)))
+    summary = {"api_429": api.rejected}
+    for outcome in ("ok", "shed", "failed"):
+        seconds = [r["seconds"] for r in results if r["outcome"] == outcome]
+        summary[outcome] = len(seconds)
+        if seconds:
+            summary[f"{outcome}_p50"] = float(np.percentile(seconds, 50))
+            summary[f"{outcome}_p95"] = float(np.percentile(seconds, 95))
+    return summary
+
+
+async def priority_order() -> list:
+    """Batch calls queued first still start after the interactive calls queued behind them."""
+    reset(True, rpm=240, tpm=0)
+    scheduler = rate_limiter.get(MODEL)
+    scheduler.requests.level = 0
+    order = []
+
+    async def queued(name: str):
+        with priority(name):
+            await scheduler.acquire(1)
+        order.append(name)
+
+    tasks = [asyncio.create_task(queued(BATCH)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    tasks += [asyncio.create_task(queued(INTERACTIVE)) for _ in range(3)]
+    await asyncio.gather(*tasks)
+    return order
+
+
+def report(name: str, summary: dict):
+    line = " ".join(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                    for key, value in summary.items())
+    print(f"{name:>16}: {line}")
+
+
+async def main():
+    without = await burst(enabled=False)
+    report("no limiter", without)
+    with_limiter = await burst(enabled=True)
+    report("rate limiter", with_limiter)
+    print(f"{'stats':>16}: {rate_limiter.stats()[MODEL]}")
+
+    assert with_limiter["api_429"] == 0, "the limiter let calls through over the API's budget"
+    assert with_limiter["ok"] >= without["ok"], "the limiter completed fewer calls than hammering the API"
+    assert with_limiter["failed"] == 0, "calls admitted by the limiter missed their deadline"
+    # Thời gian chờ trong hàng đợi và lời gọi bị từ chối không phải lỗi của Groq
+    assert resilience.stages["groq"].breaker.stats()["failures"] == 0, "queue waits counted as Groq failures"
+    if with_limiter["shed"]:
+        assert with_limiter["shed_p95"] < args.deadline / 10, \
+            "calls that cannot make the deadline must be rejected at once"
+
+    # Giới hạn cấu hình cao hơn của API: 429 đầu tiên tạm dừng model theo Retry-After thay vì thử lại ngay
+    overconfigured = await burst(enabled=True, configured_rpm=args.rpm * 2)
+    report("limit too high", overconfigured)
+    assert rate_limiter.stats()[MODEL]["throttled"] > 0, "a 429 from the API did not pause the model"
+
+    # Đường gọi đồng bộ và stream cũng đi qua hàng đợi
+    reset(True)
+    llm = get_chat_model(MODEL)
+    await asyncio.to_thread(llm.invoke, [HumanMessage(content="Gọi đồng bộ")])
+    chunks = [chunk async for chunk in llm.astream([HumanMessage(content="Gọi stream")])]
+    assert chunks and rate_limiter.stats()[MODEL]["admitted"] == 2
+    # Phần giữ chỗ (prompt + LLM_EXPECTED_COMPLETION_TOKENS) được trả lại theo usage thật, kể cả khi stream
+    assert rate_limiter.stats()[MODEL]["tokens_available"] > args.tpm - 200
+    assert not issubclass(RateLimitExceeded, resilience.StageUnavailableError)
+
+    order = await priority_order()
+    print(f"{'grant order':>16}: {order}")
+    assert order[:3] == [INTERACTIVE] * 3, "interactive calls must be granted before queued batch calls"
+
+    if metrics.METRICS_ENABLED:
+        assert b"rag_llm_queue_seconds" in metrics.render()[0]
+    print("OK")
+
+
+asyncio.run(main())
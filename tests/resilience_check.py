@@ -0,0 +1,100 @@
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "chatbot_api", "src"))
+
+from utils.resilience import (  # noqa: E402
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, StageUnavailableError, call, deadline, stages, stats,
+)
+
+# Kiểm tra retry, circuit breaker và deadline bằng các stand-in gây lỗi:
+#   python tests/resilience_check.py
+
+
+class Flaky:
+    def __init__(self, failures: int, error: Exception):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return "ok"
+
+
+async def check():
+    import groq
+    from neo4j.exceptions import CypherSyntaxError, ServiceUnavailable
+
+    for stage in stages.values():
+        stage.policy.base_delay = 0.01
+
+    # Lỗi tạm thời được thử lại và thành công
+    flaky = Flaky(2, ServiceUnavailable("down"))
+    assert await call("neo4j", flaky) == "ok" and flaky.calls == 3
+
+    # Lỗi logic không được thử lại
+    flaky = Flaky(1, CypherSyntaxError("bad cypher"))
+    try:
+        await call("neo4j", flaky)
+    except CypherSyntaxError:
+        assert flaky.calls == 1
+    else:
+        raise AssertionError("non-retryable error was swallowed")
+
+    # Hết số lần thử -> StageUnavailableError, breaker mở sau ngưỡng lỗi liên tiếp
+    stages["groq"].breaker = CircuitBreaker("groq", failure_threshold=3, reset_timeout=0.2)
+    error = groq.APIConnectionError(request=httpx.Request("POST", "https://api.groq.com"))
+    flaky = Flaky(100, error)
+    try:
+        await call("groq", flaky)
+    except StageUnavailableError as e:
+        assert not isinstance(e, CircuitOpenError) and flaky.calls == 3
+    assert stages["groq"].breaker.state == "open"
+
+    # Breaker mở thì fail fast, không gọi dịch vụ
+    try:
+        await call("groq", flaky)
+    except CircuitOpenError:
+        assert flaky.calls == 3
+    else:
+        raise AssertionError("open circuit let a call through")
+
+    # Lượt thử half-open bị huỷ giữa chừng phải được nhả, không giữ breaker ở half_open mãi
+    await asyncio.sleep(0.25)
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    try:
+        await asyncio.wait_for(call("groq", hang), timeout=0.05)
+    except asyncio.TimeoutError:
+        pass
+    assert stages["groq"].breaker.state == "half_open"
+
+    # Half-open: một lần thử thành công đóng lại breaker
+    assert await call("groq", Flaky(0, error)) == "ok"
+    assert stages["groq"].breaker.state == "closed"
+
+    # Deadline cắt ngang một stage chậm
+    async def slow():
+        await asyncio.sleep(1)
+
+    start_time = time.monotonic()
+    with deadline(0.1):
+        try:
+            await call("neo4j", slow)
+        except DeadlineExceeded:
+            assert time.monotonic() - start_time < 0.5
+        else:
+            raise AssertionError("deadline was not enforced")
+    print("resilience checks passed", stats())
+
+
+asyncio.run(check())
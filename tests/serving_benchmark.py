@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+import stand_ins
+
+# Đo RSS/PSS từng worker và requests/sec theo số worker của serve.py, chạy offline với stand-in:
+#   python tests/serving_benchmark.py --workers 1,2,4 --model-mb 400 --output serving.json
+parser = argparse.ArgumentParser(description="Memory per worker and throughput of serve.py versus worker count")
+parser.add_argument("--workers", default="1,2,4")
+parser.add_argument("--requests", type=int, default=200)
+parser.add_argument("--concurrency", type=int, default=16)
+parser.add_argument("--mode", choices=["agent", "hybrid"], default="hybrid")
+parser.add_argument("--port", type=int, default=8765)
+parser.add_argument("--model-mb", type=int, default=200, help="read-only ballast standing in for model weights")
+parser.add_argument("--llm-latency", type=float, default=0.05)
+parser.add_argument("--embedding-latency", type=float, default=0.002, help="CPU-bound seconds per embedded text")
+parser.add_argument("--output", default="serving_benchmark.json")
+args = parser.parse_args()
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SERVE = os.path.join(ROOT, "chatbot_api", "src", "serve.py")
+
+
+def memory(pid: int) -> dict:
+    """RSS, PSS and private memory of one process in MiB, from /proc/<pid>/smaps_rollup."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:", "Shared_Clean:", "Shared_Dirty:"):
+                values[parts[0][:-1].lower()] = int(parts[1]) / 1024
+    return {
+        "rss_mb": values["rss"],
+        "pss_mb": values["pss"],
+        "shared_mb": values["shared_clean"] + values["shared_dirty"],
+        "private_mb": values["private_clean"] + values["private_dirty"],
+    }
+
+
+def children(pid: int) -> list:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError("server did not start")
+
+
+async def run_load(client: httpx.AsyncClient) -> dict:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    errors = []
+
+    async def one_request(i: int):
+        body = {"text": stand_ins.SAMPLE_QUESTIONS[i % len(stand_ins.SAMPLE_QUESTIONS)] + f" (#{i})", "mode": args.mode}
+        async with semaphore:
+            try:
+                (await client.post("/rag-agent", json=body)).raise_for_status()
+            except Exception as e:
+                errors.append(str(e))
+
+    await asyncio.gather(*(one_request(-i - 1) for i in range(args.concurrency)))  # làm nóng
+    start_time = time.perf_counter()
+    errors.clear()
+    await asyncio.gather(*(one_request(i) for i in range(args.requests)))
+    duration = time.perf_counter() - start_time
+    return {"duration_s": duration, "errors": len(errors), "requests_per_s": (args.requests - len(errors)) / duration}
+
+
+async def measure(workers: int) -> dict:
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([os.path.dirname(os.path.abspath(__file__)), os.environ.get("PYTHONPATH", "")]),
+        "STAND_IN_MODEL_MB": str(args.model_mb),
+        "STAND_IN_LLM_LATENCY": str(args.llm_latency),
+        "STAND_IN_EMBEDDING_LATENCY": str(args.embedding_latency),
+        "LOG_LEVEL": "warning",
+    }
+    server = subprocess.Popen(
+        [sys.executable, SERVE, "--app", "stand_in_app:app", "--host", "127.0.0.1",
+         "--port", str(args.port), "--workers", str(workers)],
+        cwd=os.path.dirname(SERVE), env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=120) as client:
+            await wait_ready(client)
+            load = await run_load(client)
+        worker_memory = [memory(pid) for pid in children(server.pid)]
+        return {
+            "workers": workers,
+            **load,
+            "master": memory(server.pid),
+            "per_worker": worker_memory,
+            "total_pss_mb": memory(server.pid)["pss_mb"] + sum(m["pss_mb"] for m in worker_memory),
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+results = [asyncio.run(measure(int(workers))) for workers in args.workers.split(",")]
+
+with open(args.output, "w", encoding="utf-8") as f:
+    json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+print(f"{'workers':>7}{'req/s':>9}{'errors':>8}{'worker RSS':>12}{'worker PSS':>12}{'shared':>9}{'total PSS':>11}")
+for result in results:
+    per_worker = result["per_worker"]
+    average = {key: sum(m[key] for m in per_worker) / len(per_worker) for key in ("rss_mb", "pss_mb", "shared_mb")}
+    print(f"{result['workers']:>7}{result['requests_per_s']:>9.1f}{result['errors']:>8}"
+          f"{average['rss_mb']:>10.0f}MB{average['pss_mb']:>10.0f}MB{average['shared_mb']:>7.0f}MB"
+          f"{result['total_pss_mb']:>9.0f}MB")
+print(f"results written to {os.path.abspath(args.output)}")
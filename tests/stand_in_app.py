@@ -0,0 +1,25 @@
+"""ASGI app wired to the stand-ins, for servers started in another process.
+
+    PYTHONPATH=tests:chatbot_api/src python chatbot_api/src/serve.py --app stand_in_app:app
+
+The stand-in settings come from STAND_IN_* environment variables.
+STAND_IN_MODEL_MB adds that much read-only ballast to the embedder, in place of
+real model weights, so the pages shared between workers can be measured.
+"""
+import os
+
+import numpy as np
+
+import stand_ins
+
+objects = stand_ins.install(
+    num_nodes=int(os.getenv("STAND_IN_NODES", "500")),
+    llm_latency=float(os.getenv("STAND_IN_LLM_LATENCY", "0.3")),
+    tokens_per_second=float(os.getenv("STAND_IN_TOKENS_PER_SECOND", "300")),
+    answer_tokens=int(os.getenv("STAND_IN_ANSWER_TOKENS", "80")),
+    neo4j_latency=float(os.getenv("STAND_IN_NEO4J_LATENCY", "0.01")),
+    embedding_latency=float(os.getenv("STAND_IN_EMBEDDING_LATENCY", "0")),
+)
+objects["embedder"].weights = np.ones(int(os.getenv("STAND_IN_MODEL_MB", "0")) * 2 ** 18, dtype=np.float32)
+
+from main import app  # noqa: E402,F401  (phải import sau khi cài stand-in)
@@ -0,0 +1,422 @@
+"""Offline stand-ins for Groq, Neo4j and the embedding model.
+
+``install()`` has to run before ``main`` (or any chain/agent module) is
+imported: the agent builds its chat model at import time and several modules
+read their configuration from the environment when they are imported.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "chatbot_api", "src"))
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, FunctionMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_neo4j.graphs.graph_store import GraphStore
+
+SAMPLE_PASSAGES = [
+    "Sản phẩm, hàng hóa nhóm 2 phải được công bố hợp quy, chứng nhận hợp quy theo quy chuẩn kỹ thuật quốc gia tương ứng trước khi lưu thông trên thị trường.",
+    "Sản phẩm, hàng hóa nhóm 2 được miễn chứng nhận hợp quy khi đã được chứng nhận bởi tổ chức chứng nhận được thừa nhận theo điều ước quốc tế mà Việt Nam là thành viên.",
+    "Việc quản lý sản phẩm, hàng hóa nhóm 2 phải bảo đảm công khai, minh bạch, không phân biệt đối xử và không gây trở ngại không cần thiết đối với thương mại.",
+    "Tàu quân sự được cơ sở đăng kiểm kiểm tra, giám sát kỹ thuật; nếu bảo đảm chất lượng an toàn kỹ thuật và bảo vệ môi trường thì được cấp hồ sơ đăng kiểm.",
+    "Các loại hình kiểm tra của đăng kiểm đối với tàu quân sự gồm kiểm tra lần đầu, kiểm tra định kỳ, kiểm tra bất thường và kiểm tra sau sửa chữa, hoán cải.",
+    "Giấy chứng nhận an toàn kỹ thuật và bảo vệ môi trường được cấp cho tàu có thời hạn hiệu lực tối đa 12 (mười hai) tháng.",
+    "Tổ chức khoa học và công nghệ có quyền tự chủ trong việc xác định phương hướng nghiên cứu, hợp tác quốc tế và sử dụng kinh phí theo quy định của pháp luật.",
+    "Nhiệm vụ khoa học và công nghệ cấp quốc gia được tuyển chọn, giao trực tiếp trên cơ sở đề xuất đặt hàng của bộ, ngành, địa phương.",
+    "Chuyển giao công nghệ được thực hiện thông qua hợp đồng chuyển giao công nghệ, góp vốn bằng công nghệ hoặc các hình thức khác theo quy định của pháp luật.",
+    "Trường hợp các văn bản quy phạm pháp luật làm căn cứ, trích dẫn tại Thông tư này được sửa đổi, bổ sung hoặc thay thế thì áp dụng quy định tại văn bản mới.",
+    "Quỹ phát triển khoa học và công nghệ quốc gia tài trợ, cho vay, hỗ trợ thực hiện nhiệm vụ khoa học và công nghệ theo điều lệ của Quỹ.",
+    "Phòng thí nghiệm trọng điểm quốc gia được đầu tư trang thiết bị hiện đại và được ưu tiên giao nhiệm vụ nghiên cứu trong lĩnh vực được giao.",
+]
+
+SAMPLE_QUESTIONS = [
+    "Các sản phẩm, hàng hóa nhóm 2 được miễn chứng nhận hợp quy, công bố hợp quy cần đáp ứng những yêu cầu nào?",
+    "Các loại hình kiểm tra của đăng kiểm đối với tàu quân sự là gì?",
+    "Các nguyên tắc quản lý sản phẩm, hàng hóa nhóm 2 là gì?",
+    "Giấy chứng nhận an toàn kỹ thuật của tàu có thời hạn bao lâu?",
+    "Quỹ phát triển khoa học và công nghệ quốc gia hỗ trợ những gì?",
+    "Chuyển giao công nghệ được thực hiện bằng những hình thức nào?",
+    "Điều 3 Luật Khoa học và công nghệ quy định gì?",
+]
+
+SAMPLE_SCHEMA = {
+    "node_props": {
+        "Dieu": [{"property": "id", "type": "STRING"}, {"property": "title", "type": "STRING"}],
+        "Noidung": [{"property": "id", "type": "STRING"}, {"property": "content", "type": "STRING"}],
+    },
+    "rel_props": {},
+    "relationships": [{"start": "Dieu", "type": "CO_NOI_DUNG", "end": "Noidung"}],
+    "metadata": {"constraint": [], "index": []},
+}
+SAMPLE_CYPHER = "MATCH (d:Dieu)-[:CO_NOI_DUNG]->(n:Noidung) RETURN d.title AS title, n.content AS content LIMIT 20"
+
+SYLLABLE_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def sample_nodes(count: int = 500) -> List[dict]:
+    """``count`` Noidung rows cycling through the sample passages."""
+    nodes = []
+    for i in range(count):
+        passage = SAMPLE_PASSAGES[i % len(SAMPLE_PASSAGES)]
+        nodes.append({
+            "element_id": f"4:stand-in:{i}",
+            "id": f"noidung-{i}",
+            "dieu_id": f"dieu-{i // len(SAMPLE_PASSAGES) + 1}",
+            "title": f"Điều {i // len(SAMPLE_PASSAGES) + 1}",
+            "content": f"{passage} (Khoản {i // len(SAMPLE_PASSAGES) + 1})",
+        })
+    return nodes
+
+
+def legal_index_rows(nodes: List[dict]) -> List[dict]:
+    """Rows of ``chains.legal_index.EXPORT_QUERY`` for the sample nodes, five Điều per Chương."""
+    rows: Dict[str, dict] = {}
+    for node in nodes:
+        number = int(node["dieu_id"].split("-")[1])
+        row = rows.setdefault(node["dieu_id"], {
+            "dieu_id": node["dieu_id"],
+            "dieu_title": node["title"],
+            "ghi_chu": f"({node['title']} Luật Khoa học và công nghệ số 29/2013/QH13)",
+            "chuong_id": f"chuong-{(number - 1) // 5 + 1}",
+            "chuong_title": f"Chương {(number - 1) // 5 + 1}",
+            "demuc_id": "demuc-1",
+            "demuc_title": "Khoa học, công nghệ",
+            "noidung_ids": [],
+        })
+        row["noidung_ids"].append(node["id"])
+    return list(rows.values())
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-syllables embedding; similar texts get similar vectors."""
+
+    def __init__(self, dim: int = 256, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.model_name = "stand-in/hash-embeddings"
+        self.encode_kwargs = {"normalize_embeddings": True}
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for syllable in SYLLABLE_PATTERN.findall(text.lower()):
+            digest = hashlib.blake2b(syllable.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers like the real pipeline expects, with tunable speed.
+
+    The agent model first calls ``Vector Search`` then ``Cypher Chain``
+    (``tool_calls`` of them) and then answers; a Cypher generation prompt gets
+    ``SAMPLE_CYPHER``; any other prompt gets ``answer_tokens`` tokens of text.
+    Each call waits ``latency`` seconds before the first token and then
+    produces ``tokens_per_second`` tokens per second.
+    """
+
+    model: str = "stand-in"
+    latency: float = 0.3
+    tokens_per_second: float = 300.0
+    answer_tokens: int = 80
+    tool_calls: int = 2
+
+    @property
+    def _llm_type(self) -> str:
+        return "stand-in-chat"
+
+    def _respond(self, messages: List[BaseMessage], **kwargs: Any) -> AIMessage:
+        prompt = "\n".join(str(message.content) for message in messages)
+        prompt_tokens = len(prompt) // 3 + 1
+        if kwargs.get("functions"):
+            # Prompt của agent là PromptTemplate nên scratchpad bị chuyển thành chuỗi
+            done = sum(isinstance(m, FunctionMessage) for m in messages) + prompt.count("FunctionMessage(")
+            if done < self.tool_calls:
+                name = ["Vector Search", "Cypher Chain"][done % 2]
+                question = SAMPLE_QUESTIONS[zlib.crc32(prompt.encode("utf-8")) % len(SAMPLE_QUESTIONS)]
+                return self._message("", prompt_tokens, 20, function_call={
+                    "name": name, "arguments": json.dumps({"__arg1": question}, ensure_ascii=False),
+                })
+        if "truy vấn Cypher" in prompt and "Schema:" in prompt:
+            return self._message(SAMPLE_CYPHER, prompt_tokens, 30)
+        words = [f"từ{i}" for i in range(self.answer_tokens)]
+        return self._message("Theo quy định hiện hành, " + " ".join(words), prompt_tokens, self.answer_tokens)
+
+    @staticmethod
+    def _message(content: str, prompt_tokens: int, completion_tokens: int, **additional_kwargs) -> AIMessage:
+        return AIMessage(
+            content=content,
+            additional_kwargs=additional_kwargs,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+
+    def _duration(self, message: AIMessage) -> float:
+        return self.latency + message.usage_metadata["output_tokens"] / self.tokens_per_second
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = self._respond(messages, **kwargs)
+        time.sleep(self._duration(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = self._respond(messages, **kwargs)
+        await asyncio.sleep(self._duration(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        result = self._generate(messages, stop, run_manager, **kwargs)
+        yield ChatGenerationChunk(message=AIMessageChunk(**result.generations[0].message.model_dump()))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._respond(messages, **kwargs)
+        if message.additional_kwargs:
+            await asyncio.sleep(self._duration(message))
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="", additional_kwargs=message.additional_kwargs, usage_metadata=message.usage_metadata,
+            ))
+            return
+        await asyncio.sleep(self.latency)
+        tokens = message.content.split(" ")
+        for i, token in enumerate(tokens):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            chunk = AIMessageChunk(content=token if i == 0 else " " + token)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=message.usage_metadata))
+
+
+class RateLimitedGroq:
+    """Groq endpoint stand-in that enforces requests and tokens per minute like the API does.
+
+    ``patch()`` replaces the network calls of ``ChatGroq``, so the real
+    ``ResilientChatGroq`` (retries, rate limiter, callbacks) runs against a
+    ``FakeChatModel``. A call over either budget gets ``groq.RateLimitError``
+    with a Retry-After header, the way Groq answers 429; budgets replenish
+    continuously.
+    """
+
+    def __init__(self, rpm: float, tpm: float, latency: float = 0.05, answer_tokens: int = 40):
+        from utils.rate_limiter import TokenBucket
+
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.model = FakeChatModel(latency=latency, answer_tokens=answer_tokens)
+        self.accepted = 0
+        self.rejected = 0
+
+    def _admit(self, messages: List[BaseMessage]):
+        import groq
+        import httpx
+
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        prompt_tokens = len("\n".join(str(message.content) for message in messages)) // 3 + 1
+        retry_after = max(self.requests.wait_time(1), self.tokens.wait_time(prompt_tokens))
+        if retry_after > 0:
+            self.rejected += 1
+            request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+            response = httpx.Response(429, headers={"retry-after": f"{retry_after:.3f}"}, request=request)
+            raise groq.RateLimitError("Rate limit reached", response=response, body=None)
+        self.accepted += 1
+        self.requests.take(1)
+
+    def _charge(self, result: ChatResult) -> ChatResult:
+        self.tokens.take(result.generations[0].message.usage_metadata["total_tokens"])
+        return result
+
+    def patch(self):
+        from langchain_groq import ChatGroq
+
+        api = self
+
+        def _generate(chat_model, messages, stop=None, run_manager=None, **kwargs):
+            api._admit(messages)
+            return api._charge(api.model._generate(messages, stop, **kwargs))
+
+        async def _agenerate(chat_model, messages, stop=None, run_manager=None, **kwargs):
+            api._admit(messages)
+            return api._charge(await api.model._agenerate(messages, stop, **kwargs))
+
+        async def _astream(chat_model, messages, stop=None, run_manager=None, **kwargs):
+            api._admit(messages)
+            async for chunk in api.model._astream(messages, stop, run_manager, **kwargs):
+                if chunk.message.usage_metadata:
+                    api.tokens.take(chunk.message.usage_metadata["total_tokens"])
+                yield chunk
+
+        ChatGroq._generate, ChatGroq._agenerate, ChatGroq._astream = _generate, _agenerate, _astream
+        return self
+
+
+class InMemoryGraph(GraphStore):
+    """Neo4jGraph stand-in over the sample nodes, used by GraphCypherQAChain."""
+
+    def __init__(self, nodes: List[dict]):
+        self.nodes = nodes
+        self.schema = ""
+        self.structured_schema: Dict[str, Any] = {}
+
+    @property
+    def get_schema(self) -> str:
+        return self.schema
+
+    @property
+    def get_structured_schema(self) -> Dict[str, Any]:
+        return self.structured_schema
+
+    def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        return [{"title": node["title"], "content": node["content"]} for node in self.nodes[:20]]
+
+    def refresh_schema(self) -> None:
+        self.structured_schema = SAMPLE_SCHEMA
+        self.schema = "\n".join([
+            "Node properties:",
+            *(f"{label} {{{', '.join(p['property'] + ': ' + p['type'] for p in props)}}}"
+              for label, props in SAMPLE_SCHEMA["node_props"].items()),
+            "The relationships:",
+            *(f"(:{r['start']})-[:{r['type']}]->(:{r['end']})" for r in SAMPLE_SCHEMA["relationships"]),
+        ])
+
+    def add_graph_documents(self, graph_documents, include_source: bool = False) -> None:
+        raise NotImplementedError
+
+
+class _Record:
+    def __init__(self, row: dict):
+        self._row = row
+
+    def data(self) -> dict:
+        return dict(self._row)
+
+
+class InMemoryAsyncDriver:
+    """Async Neo4j driver stand-in for ``utils.neo4j_pool.read_query``.
+
+    Vector index queries are answered by cosine search over ``embeddings``,
+    ``$dieu_ids`` lookups with the Noidung of those Điều; any other statement
+    returns the first rows of the sample graph.
+    """
+
+    def __init__(self, nodes: List[dict], embeddings: np.ndarray, latency: float = 0.01):
+        self.nodes = nodes
+        self.embeddings = embeddings
+        self.latency = latency
+        self.queries = 0
+
+    async def execute_query(self, query: str, params: Optional[dict] = None, **kwargs) -> tuple:
+        self.queries += 1
+        await asyncio.sleep(self.latency)
+        params = params or {}
+        if "db.index.vector.queryNodes" in query:
+            scores = self.embeddings @ np.asarray(params["embedding"], dtype=np.float32)
+            top = np.argsort(-scores)[: params.get("k", 10)]
+            rows = [{
+                "text": f"\ncontent: {self.nodes[i]['content']}\nid: {self.nodes[i]['id']}",
+                "id": self.nodes[i]["id"],
+                "score": float((1 + scores[i]) / 2),
+            } for i in top]
+        elif "dieu_ids" in params:
+            rows = []
+            for dieu_id in params["dieu_ids"]:
+                members = [node for node in self.nodes if node["dieu_id"] == dieu_id]
+                if members:
+                    rows.append({
+                        "dieu_id": dieu_id,
+                        "title": members[0]["title"],
+                        "ghi_chu": None,
+                        "noidung_ids": [node["id"] for node in members],
+                        "contents": [node["content"] for node in members],
+                    })
+        else:
+            rows = [{"title": node["title"], "content": node["content"]} for node in self.nodes[:20]]
+        return [_Record(row) for row in rows], None, None
+
+    async def close(self):
+        pass
+
+
+def install(num_nodes: int = 500, llm_latency: float = 0.3, tokens_per_second: float = 300.0,
+            answer_tokens: int = 80, neo4j_latency: float = 0.01, embedding_latency: float = 0.0,
+            workdir: Optional[str] = None) -> dict:
+    """Point the app at the stand-ins. Returns the objects so callers can inspect them."""
+    workdir = workdir or tempfile.mkdtemp(prefix="rag-stand-ins-")
+    for name in ("AGENT_MODEL", "CYPHER_MODEL", "QA_MODEL", "VECTOR_MODEL", "HYBRID_MODEL"):
+        os.environ.setdefault(name, "stand-in-llm")
+    os.environ.setdefault("GROQ_API_KEY", "stand-in")
+    os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+    os.environ["VECTOR_RETRIEVER"] = "local"
+    os.environ["LOCAL_VECTOR_INDEX_PATH"] = os.path.join(workdir, "vector_snapshot")
+    os.environ["SCHEMA_SNAPSHOT_PATH"] = os.path.join(workdir, "schema_snapshot.json")
+    os.environ["STARTUP_REPORT_PATH"] = os.path.join(workdir, "startup_report.jsonl")
+    os.environ["SHARED_CACHE_PATH"] = os.path.join(workdir, "shared_cache.sqlite3")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm_cache.sqlite3")
+    os.environ["LEGAL_INDEX_PATH"] = os.path.join(workdir, "legal_index.json")
+
+    from chains.legal_index import LegalHierarchyIndex
+    from chains.local_vector_index import _write_snapshot
+    from utils import llm, model_registry, neo4j_pool
+
+    nodes = sample_nodes(num_nodes)
+    embedder = HashEmbeddings(latency=embedding_latency)
+    embeddings = np.asarray(embedder.embed_documents([node["content"] for node in nodes]), dtype=np.float32)
+    _write_snapshot(
+        os.environ["LOCAL_VECTOR_INDEX_PATH"],
+        [{key: node[key] for key in ("element_id", "id", "content")} for node in nodes],
+        embeddings,
+    )
+
+    LegalHierarchyIndex.from_rows(legal_index_rows(nodes)).save(os.environ["LEGAL_INDEX_PATH"])
+
+    for backend in ("torch", "onnx", "onnx-int8"):
+        model_registry.get_or_load(f"embedder:{backend}", lambda: embedder)
+    graph = InMemoryGraph(nodes)
+    model_registry.get_or_load("neo4j_graph", lambda: graph)
+    driver = InMemoryAsyncDriver(nodes, embeddings, latency=neo4j_latency)
+    neo4j_pool.get_async_driver = lambda: driver
+
+    from utils import metrics
+
+    def get_chat_model(model: str, **kwargs) -> FakeChatModel:
+        return FakeChatModel(
+            model=str(model),
+            latency=llm_latency,
+            tokens_per_second=tokens_per_second,
+            answer_tokens=answer_tokens,
+            callbacks=metrics.llm_callbacks(str(model)),
+        )
+
+    llm.get_chat_model = get_chat_model
+    return {"workdir": workdir, "nodes": nodes, "embedder": embedder, "graph": graph, "driver": driver}